@@ -6,6 +6,10 @@ from flask_cors import CORS  # TODO: will remove this once we figure out the pro
 
 from hysds.es_util import get_grq_es, get_mozart_es
 
+from grq2.lib.codec import DEFAULT_CODEC, CodecJSONProvider, set_codec, install_es_serializer
+from grq2.lib.metrics import metrics
+from grq2.lib.compression import DecompressedRequest, enable_http_compress, max_decompressed_length
+
 
 class ReverseProxied:
     """
@@ -86,6 +90,21 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 config_path = os.path.abspath(os.path.join(current_dir, '..', 'settings.cfg'))
 app.config.from_pyfile(config_path)
 
+# gzip/zstd compressed request bodies (Content-Encoding), decompressed while the views read them
+if app.config.get('REQUEST_DECOMPRESSION', True) is True:
+    app.wsgi_app = DecompressedRequest(app.wsgi_app, max_length=max_decompressed_length(app.config))
+
+# JSON codec used for the API responses, ES request/response bodies and bulk payloads
+json_codec = set_codec(app.config.get('JSON_CODEC', DEFAULT_CODEC))
+if json_codec.name != app.config.get('JSON_CODEC', DEFAULT_CODEC):
+    app.logger.warning("JSON_CODEC %s is not available, using %s" % (app.config['JSON_CODEC'], json_codec.name))
+app.json = CodecJSONProvider(app)
+
+# per stage ingest timers and counters, exposed at /metrics
+metrics.enabled = app.config.get('METRICS_ENABLED', False) is True
+if metrics.enabled and app.config.get('METRICS_DIR', None):
+    metrics.share(app.config['METRICS_DIR'], interval=float(app.config.get('METRICS_FLUSH_INTERVAL', 5)))
+
 # TODO: will remove this when ready for actual release, need to figure out the right host
 CORS(app)
 
@@ -98,6 +117,14 @@ grq_es = get_grq_es()
 # initializing connection to Mozart's Elasticsearch
 mozart_es = get_mozart_es()
 
+install_es_serializer(grq_es.es)
+install_es_serializer(mozart_es.es)
+
+# gzip compressed ES request bodies (ie. bulk writes)
+if app.config.get('ES_HTTP_COMPRESS', False) is True:
+    enable_http_compress(grq_es.es)
+    enable_http_compress(mozart_es.es)
+
 # services blueprints
 from grq2.services.main import mod as main_module
 app.register_blueprint(main_module)
@@ -108,6 +135,9 @@ app.register_blueprint(query_module)
 from grq2.services.geonames import mod as geonames_module
 app.register_blueprint(geonames_module)
 
+from grq2.services.metrics import mod as metrics_module
+app.register_blueprint(metrics_module)
+
 # rest API blueprints
 from grq2.services.api_v01.service import services as api_v01_services
 app.register_blueprint(api_v01_services)
@@ -115,6 +145,12 @@ app.register_blueprint(api_v01_services)
 from grq2.services.api_v02.service import services as api_v02_services
 app.register_blueprint(api_v02_services)
 
+# background writer of the asynchronous ingest queue
+async_writer = app.config.get('ASYNC_INGEST_WRITER', None)
+if async_writer is True or (async_writer is None and app.config.get('ASYNC_INGEST', False) is True):
+    from grq2.services.api_v02.datasets import start_ingest_writer
+    start_ingest_writer()
+
 
 if __name__ != '__main__':
     import logging
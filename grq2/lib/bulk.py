@@ -0,0 +1,166 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import elasticsearch.exceptions
+import opensearchpy.exceptions
+
+from grq2.lib.codec import dumpb, loads
+
+
+RETRYABLE_STATUSES = {429, 503}
+
+
+def encode_bulk_item(action, doc=None):
+    """
+    encodes a bulk action (and its document) into newline delimited JSON, only once
+    :param action: Dict; ex. {"index": {"_index": "grq_v1.0_dataset", "_id": "dataset_id"}}
+    :param doc: Dict; document (None for delete actions)
+    :return: bytes
+    """
+    if doc is None:
+        return dumpb(action) + b'\n'
+    return dumpb(action) + b'\n' + dumpb(doc) + b'\n'
+
+
+def group_bulk_items(items, bulk_limit=1e+8):
+    """
+    groups encoded bulk items into batches no larger than bulk_limit bytes
+    (a single item larger than bulk_limit gets its own batch)
+    :param items: Iterable[bytes]; see encode_bulk_item()
+    :param bulk_limit: int, max size (bytes) of a batch
+    :return: List[List[bytes]]
+    """
+    groups = []
+    batch = []
+    cur_byte_count = 0
+    for item in items:
+        if batch and cur_byte_count + len(item) >= bulk_limit:
+            groups.append(batch)
+            batch = []
+            cur_byte_count = 0
+        batch.append(item)
+        cur_byte_count += len(item)
+
+    if batch:
+        groups.append(batch)
+    return groups
+
+
+def pack_bulk_items(items, bulk_limit=1e+8):
+    """
+    packs encoded bulk items into request bodies no larger than bulk_limit bytes
+    :param items: Iterable[bytes]; see encode_bulk_item()
+    :param bulk_limit: int, max size (bytes) of the request bodies
+    :return: List[bytes]
+    """
+    return [b''.join(group) for group in group_bulk_items(items, bulk_limit)]
+
+
+def build_bulk_bodies(docs_bulk, bulk_limit=1e+8):
+    """
+    Elasticsearch/Opensearch has a 100mb size limit when making API calls
+        serializes the bulk actions once and splits them into NDJSON request bodies which can be sent as is
+    :param docs_bulk: List[Dict]; [action, doc, action, doc, ...]
+    :param bulk_limit: int, max size (bytes) of the request bodies
+    :return: List[bytes]
+    """
+    items = (encode_bulk_item(docs_bulk[i], docs_bulk[i + 1]) for i in range(0, len(docs_bulk), 2))
+    return pack_bulk_items(items, bulk_limit)
+
+
+def send_bulk_parallel(es, bodies, concurrency, **kwargs):
+    """
+    sends the bulk request bodies through a bounded pool of workers and waits for all of them
+    :param es: elasticsearch/opensearch client
+    :param bodies: List[bytes]; see build_bulk_bodies()
+    :param concurrency: int; max number of requests in flight
+    :param kwargs: bulk request kwargs
+    :return: List[Dict|Exception]; bulk responses in the same order as bodies, the exception if the request failed
+    """
+    def _send(body):
+        try:
+            return es.bulk(body=body, **kwargs)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(bodies)))) as executor:
+        return list(executor.map(_send, bodies))
+
+
+def is_retryable(e):
+    """
+    :param e: Exception raised by a bulk request
+    :return: bool, True if the request can be retried (cluster overloaded or unreachable)
+    """
+    if isinstance(e, (elasticsearch.exceptions.ConnectionError, opensearchpy.exceptions.ConnectionError)):
+        return True
+    return getattr(e, 'status_code', None) in RETRYABLE_STATUSES
+
+
+def backoff_delay(attempt, backoff=1., max_delay=30.):
+    """
+    exponential backoff with full jitter
+    :param attempt: int, retry number (starts at 0)
+    :param backoff: float, base delay (seconds)
+    :param max_delay: float
+    :return: float, seconds to wait
+    """
+    return random.uniform(0, min(max_delay, backoff * 2 ** attempt))
+
+
+def _failed_item(item, e):
+    """bulk response style item for an encoded item whose request raised an exception"""
+    action = loads(item.split(b'\n', 1)[0])
+    op_type, meta = next(iter(action.items()))
+    return {op_type: {**meta, "status": getattr(e, 'status_code', None), "error": f"{type(e)}:{e}"}}
+
+
+def index_bulk_items(es, items, bulk_limit=1e+8, max_retries=3, backoff=1., **kwargs):
+    """
+    sends the encoded bulk items without all-or-nothing semantics:
+        only the items which failed with a retryable status (429/503) are re-sent, with jittered backoff
+        items failing permanently (or still failing after max_retries) are reported and the others are kept
+    :param es: elasticsearch/opensearch client
+    :param items: List[bytes]; see encode_bulk_item()
+    :param bulk_limit: int, max size (bytes) of the request bodies
+    :param max_retries: int
+    :param backoff: float, base delay (seconds) between retries
+    :param kwargs: bulk request kwargs
+    :return: Tuple[int, List[Dict]]; number of documents written, failed items (bulk response items)
+    """
+    written = 0
+    failed = []
+    pending = list(items)
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            time.sleep(backoff_delay(attempt - 1, backoff))
+
+        retry = []
+        last_attempt = attempt == max_retries
+        for group in group_bulk_items(pending, bulk_limit):
+            try:
+                resp = es.bulk(body=b''.join(group), **kwargs)
+            except Exception as e:
+                if is_retryable(e) and not last_attempt:
+                    retry.extend(group)
+                else:
+                    failed.extend([_failed_item(item, e) for item in group])
+                continue
+
+            for item, resp_item in zip(group, resp["items"]):
+                doc_info = next(iter(resp_item.values()))
+                if "error" not in doc_info:
+                    written += 1
+                elif doc_info.get("status") in RETRYABLE_STATUSES and not last_attempt:
+                    retry.append(item)
+                else:
+                    failed.append(resp_item)
+
+        if not retry:
+            break
+        pending = retry
+    return written, failed
@@ -0,0 +1,74 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import threading
+
+
+class _Pending:
+    __slots__ = ('item', 'result', 'done')
+
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.done = threading.Event()
+
+
+class BulkCoalescer:
+    """
+    Gathers items submitted concurrently (ie. by many requests handled by the same worker) over a short window, or up
+    to max_items, and processes them with a single call, every caller gets back its own result
+        the first caller of a batch is its leader: it waits for the window (or a full batch), flushes the batch and
+        hands out the results, the other callers wait for their result
+    """
+
+    def __init__(self, flush, window=0.05, max_items=100):
+        """
+        :param flush: function(List[any]) -> List[any|Exception]; processes a batch, 1 result per item (in order),
+                      an Exception result is raised to its caller
+        :param window: float, seconds the leader waits for more items
+        :param max_items: int, flushes as soon as the batch has this many items
+        """
+        self.flush = flush
+        self.window = window
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._batch = []
+        self._full = threading.Event()
+
+    def submit(self, item):
+        """
+        :param item: any
+        :return: result of the item, see flush
+        """
+        pending = _Pending(item)
+        with self._lock:
+            self._batch.append(pending)
+            leader = len(self._batch) == 1
+            if len(self._batch) >= self.max_items:
+                self._full.set()
+            full = self._full
+
+        if leader:
+            full.wait(self.window)
+            with self._lock:
+                batch = self._batch
+                self._batch = []
+                self._full = threading.Event()
+            self._flush(batch)
+
+        pending.done.wait()
+        if isinstance(pending.result, Exception):
+            raise pending.result
+        return pending.result
+
+    def _flush(self, batch):
+        try:
+            results = self.flush([p.item for p in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        if len(results) < len(batch):
+            results = list(results) + [RuntimeError("no result returned for the item")] * (len(batch) - len(results))
+
+        for p, result in zip(batch, results):
+            p.result = result
+            p.done.set()
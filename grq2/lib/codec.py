@@ -0,0 +1,264 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import json
+import uuid
+import decimal
+from datetime import date, datetime, time
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_CODEC = 'json'
+
+
+def _default(o):
+    """
+    serializes the types the stdlib (and ujson/orjson) can't, the same way the Elasticsearch/Opensearch clients'
+    JSONSerializer does (ie. decimals as numbers, numpy scalars and arrays as python values)
+    """
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if np is not None:
+        if isinstance(o, np.integer):
+            return int(o)
+        if isinstance(o, np.floating):
+            return float(o)
+        if isinstance(o, np.bool_):
+            return bool(o)
+        if isinstance(o, np.datetime64):
+            return o.item().isoformat()
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+    raise TypeError("Object of type %s is not JSON serializable" % type(o).__name__)
+
+
+class StdlibCodec:
+    """python's json module, compact output (same as the ES client's serializer)"""
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj, sort_keys=False, default=None):
+        """
+        :param obj: any
+        :param sort_keys: bool
+        :param default: function(any) -> any; serializes the unsupported types (see _default)
+        :return: str
+        """
+        return json.dumps(obj, default=default or _default, ensure_ascii=False, separators=(',', ':'),
+                          sort_keys=sort_keys)
+
+    def dumpb(self, obj, sort_keys=False, default=None):
+        """
+        :param obj: any
+        :param sort_keys: bool
+        :param default: function(any) -> any; serializes the unsupported types (see _default)
+        :return: bytes, UTF-8 encoded
+        """
+        return self.dumps(obj, sort_keys=sort_keys, default=default).encode('utf-8')
+
+    @staticmethod
+    def loads(s):
+        """
+        :param s: str|bytes
+        :return: any
+        """
+        return json.loads(s)
+
+
+class OrjsonCodec(StdlibCodec):
+    """
+    orjson, serializes straight to UTF-8 bytes
+        falls back to the stdlib for what orjson rejects (ie. integers larger than 64 bits)
+    """
+    name = 'orjson'
+
+    def dumpb(self, obj, sort_keys=False, default=None):
+        # dates go through default like with the other codecs (ie. HTTP dates in Flask responses)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default or _default, option=option)
+        except TypeError:
+            return StdlibCodec.dumps(obj, sort_keys=sort_keys, default=default).encode('utf-8')
+
+    def dumps(self, obj, sort_keys=False, default=None):
+        return self.dumpb(obj, sort_keys=sort_keys, default=default).decode('utf-8')
+
+    @staticmethod
+    def loads(s):
+        return orjson.loads(s)
+
+
+class UjsonCodec(StdlibCodec):
+    """ujson, falls back to the stdlib for what ujson rejects"""
+    name = 'ujson'
+
+    @staticmethod
+    def dumps(obj, sort_keys=False, default=None):
+        try:
+            return ujson.dumps(obj, default=default or _default, ensure_ascii=False, escape_forward_slashes=False,
+                               sort_keys=sort_keys)
+        except (TypeError, OverflowError):
+            return StdlibCodec.dumps(obj, sort_keys=sort_keys, default=default)
+
+    @staticmethod
+    def loads(s):
+        return ujson.loads(s)
+
+
+CODECS = {
+    StdlibCodec.name: (StdlibCodec, json),
+    OrjsonCodec.name: (OrjsonCodec, orjson),
+    UjsonCodec.name: (UjsonCodec, ujson),
+}
+
+_codec = StdlibCodec()
+
+
+def available_codecs():
+    """
+    :return: List[str], codecs whose library is installed
+    """
+    return [name for name, (_, module) in CODECS.items() if module is not None]
+
+
+def create_codec(name):
+    """
+    :param name: str; json|orjson|ujson
+    :return: StdlibCodec|OrjsonCodec|UjsonCodec; the stdlib codec if the library isn't installed (or unknown name)
+    """
+    codec_class, module = CODECS.get(name, (StdlibCodec, json))
+    if module is None:
+        return StdlibCodec()
+    return codec_class()
+
+
+def set_codec(name):
+    """
+    selects the codec used by dumps(), dumpb() and loads()
+    :param name: str; json|orjson|ujson
+    :return: codec in use, check its name to know if it fell back to the stdlib
+    """
+    global _codec
+    _codec = create_codec(name)
+    return _codec
+
+
+def get_codec():
+    return _codec
+
+
+def dumps(obj, sort_keys=False):
+    """
+    :param obj: any
+    :param sort_keys: bool
+    :return: str, compact JSON
+    """
+    return _codec.dumps(obj, sort_keys=sort_keys)
+
+
+def dumpb(obj, sort_keys=False):
+    """
+    :param obj: any
+    :param sort_keys: bool
+    :return: bytes, compact UTF-8 encoded JSON
+    """
+    return _codec.dumpb(obj, sort_keys=sort_keys)
+
+
+def loads(s):
+    """
+    :param s: str|bytes
+    :return: any
+    """
+    return _codec.loads(s)
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider (jsonify, request.get_json) backed by the selected codec
+        the types the codec doesn't support natively are serialized by Flask's default (HTTP dates, dataclasses,
+        __html__, UUID), then the codec's (numpy, decimals)
+        pretty printing (debug mode), ensure_ascii, the JSON_AS_ASCII/JSON_SORT_KEYS settings and custom encoder
+        arguments are left to Flask's default provider
+    """
+    ensure_ascii = False  # UTF-8, as the codecs write it
+
+    def _default(self, o):
+        try:
+            return self.default(o)
+        except TypeError:
+            return _default(o)
+
+    def dumps(self, obj, **kwargs):
+        config = self._app.config
+        if (set(kwargs) - {'separators'} or self.ensure_ascii or config.get('JSON_AS_ASCII') is not None or
+                config.get('JSON_SORT_KEYS') is not None):
+            return super().dumps(obj, **kwargs)
+        return _codec.dumps(obj, sort_keys=self.sort_keys, default=self._default)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return _codec.loads(s)
+
+
+class CodecSerializer:
+    """
+    Elasticsearch/Opensearch client serializer (application/json) backed by the selected codec
+        strings and bytes are passed through as is, same as the clients' JSONSerializer
+        the types the codec doesn't support natively are serialized by the client's own JSONSerializer.default (ie.
+        decimals as numbers, numpy scalars and arrays)
+    """
+    mimetype = 'application/json'
+
+    def __init__(self, default=None):
+        """
+        :param default: function(any) -> any; serializer of the unsupported types, ex. JSONSerializer().default
+        """
+        self.default = default
+
+    def dumps(self, data):
+        if isinstance(data, (str, bytes)):
+            return data
+        return _codec.dumps(data, default=self.default)
+
+    @staticmethod
+    def loads(s):
+        return _codec.loads(s)
+
+
+def install_es_serializer(client):
+    """
+    makes the ES client (de)serialize its request/response bodies with the selected codec
+    :param client: elasticsearch/opensearch client
+    """
+    transport = client.transport
+    serializer = CodecSerializer(default=getattr(transport.serializer, 'default', None))
+    transport.serializer = serializer
+    transport.deserializer.serializers[serializer.mimetype] = serializer
+    if transport.deserializer.default.mimetype == serializer.mimetype:
+        transport.deserializer.default = serializer
@@ -0,0 +1,145 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import io
+import gzip
+import zlib
+
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.wsgi import LimitedStream, get_content_length
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_MAX_DECOMPRESSED_LENGTH = int(1e+8)  # same as the BULK_LIMIT default
+
+
+def max_decompressed_length(config):
+    """
+    :param config: Dict; app config
+    :return: int, max size (bytes) of a decompressed request body: MAX_DECOMPRESSED_LENGTH, else MAX_CONTENT_LENGTH,
+             else BULK_LIMIT (a decompressed body is never unbounded)
+    """
+    for key in ('MAX_DECOMPRESSED_LENGTH', 'MAX_CONTENT_LENGTH', 'BULK_LIMIT'):
+        value = config.get(key, None)
+        if value:
+            return int(value)
+    return DEFAULT_MAX_DECOMPRESSED_LENGTH
+
+
+def supported_encodings():
+    """
+    :return: List[str], request Content-Encoding values which can be decompressed
+    """
+    encodings = ['gzip', 'x-gzip']
+    if zstandard is not None:
+        encodings.append('zstd')
+    return encodings
+
+
+def decompressing_reader(stream, encoding):
+    """
+    :param stream: file-like object, compressed request body
+    :param encoding: str; Content-Encoding (gzip|x-gzip|zstd)
+    :return: file-like object decompressing the body as it's read
+    """
+    if encoding in ('gzip', 'x-gzip'):
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    raise ValueError("unsupported Content-Encoding: %s" % encoding)
+
+
+_DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+class DecompressedInput(io.RawIOBase):
+    """
+    request body decompressed on the fly, the compressed body is never held in memory as a whole
+        reading past max_length decompressed bytes raises a 413 (protects against decompression bombs), a corrupted
+        body raises a 400
+    """
+
+    def __init__(self, reader, encoding, max_length=None):
+        self._reader = reader
+        self._encoding = encoding
+        self._max_length = max_length
+        self._length = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        try:
+            n = self._reader.readinto(b)
+        except _DECOMPRESSION_ERRORS as e:
+            raise BadRequest("invalid %s request body: %s" % (self._encoding, str(e)))
+        self._length += n
+        if self._max_length is not None and self._length > self._max_length:
+            raise RequestEntityTooLarge("decompressed request body is larger than %d bytes" % self._max_length)
+        return n
+
+    def close(self):
+        self._reader.close()
+        super().close()
+
+
+class DecompressedRequest:
+    """
+    WSGI middleware decompressing the request bodies sent with Content-Encoding: gzip (or zstd, if zstandard is
+    installed), the views read the decompressed body through request.stream/request.data/request.json as usual
+        the body length is unknown once decompressed, CONTENT_LENGTH is dropped and wsgi.input_terminated set
+        unsupported encodings are rejected with a 415
+
+    :param app: the WSGI application
+    :param max_length: int, max size (bytes) of a decompressed request body, larger bodies get a 413 (None: no limit)
+    :param buffer_size: int, read buffer of the decompressed body
+    """
+
+    def __init__(self, app, max_length=DEFAULT_MAX_DECOMPRESSED_LENGTH, buffer_size=64 * 1024):
+        self.app = app
+        self.max_length = max_length
+        self.buffer_size = buffer_size
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding or encoding == 'identity':
+            return self.app(environ, start_response)
+
+        if encoding not in supported_encodings():
+            error = UnsupportedMediaType("unsupported Content-Encoding: %s (supported: %s)" %
+                                         (encoding, ', '.join(supported_encodings())))
+            return error(environ, start_response)
+
+        stream = environ['wsgi.input']
+        content_length = get_content_length(environ)
+        if content_length is not None and not environ.get('wsgi.input_terminated'):
+            stream = LimitedStream(stream, content_length)  # don't read past the body (keep-alive)
+
+        reader = DecompressedInput(decompressing_reader(stream, encoding), encoding, self.max_length)
+        environ['wsgi.input'] = io.BufferedReader(reader, buffer_size=self.buffer_size)
+        environ['wsgi.input_terminated'] = True
+        environ['grq.content_encoding'] = encoding
+        environ.pop('CONTENT_LENGTH', None)
+        del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
+
+
+def enable_http_compress(client):
+    """
+    turns on gzip compression of the ES client's request bodies (and asks for compressed responses), same as creating
+    the client with http_compress=True
+    :param client: elasticsearch/opensearch client
+    """
+    transport = client.transport
+    transport.kwargs['http_compress'] = True  # connections created later on (sniffing)
+    connections = list(transport.connection_pool.connections) + list(getattr(transport, 'seed_connections', []))
+    for connection in connections:
+        connection.http_compress = True
+        connection.headers['accept-encoding'] = 'gzip,deflate'
+        session = getattr(connection, 'session', None)  # requests based connections
+        if session is not None:
+            session.headers['accept-encoding'] = 'gzip,deflate'
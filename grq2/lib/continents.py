@@ -0,0 +1,90 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import json
+
+import shapely
+from shapely.geometry import shape, Point
+from shapely.prepared import prep
+
+from grq2.lib.geocoder import haversine_km
+
+
+class ContinentResolver:
+    """
+    Resolves the continent of points in memory
+        points inside a continent outline (if outlines are given) get that continent, the others get the closest
+        continent (geonames feature_code: CONT point), which is what get_continents()[0] returns
+    """
+
+    def __init__(self, continents, outlines=None):
+        """
+        :param continents: List[Dict]; geonames continent docs (feature_class: L, feature_code: CONT)
+        :param outlines: List[Tuple[str, BaseGeometry]]; (continent name, outline)
+        """
+        self.continents = [(c['name'], c['location']['lon'], c['location']['lat']) for c in continents]
+        self.outlines = outlines or []
+        if hasattr(shapely, 'prepare'):  # Shapely 2, prepared once for the contains_xy() of every batch
+            shapely.prepare([geom for _, geom in self.outlines])
+        self._prepared = [(name, prep(geom)) for name, geom in self.outlines]
+
+    def __len__(self):
+        return len(self.continents)
+
+    @staticmethod
+    def load_outlines(path):
+        """
+        :param path: str; GeoJSON FeatureCollection, each feature has the continent name in its "name" property
+                     (same names as the geonames continents, ex. "North America")
+        :return: List[Tuple[str, BaseGeometry]]
+        """
+        with open(path) as f:
+            collection = json.load(f)
+        return [(feature['properties']['name'], shape(feature['geometry'])) for feature in collection['features']]
+
+    def nearest(self, lon, lat):
+        """
+        :return: str, name of the closest continent point (None if there are no continents)
+        """
+        best = None
+        best_distance = None
+        for name, c_lon, c_lat in self.continents:
+            distance = haversine_km(lon, lat, c_lon, c_lat)
+            if best_distance is None or distance < best_distance:
+                best, best_distance = name, distance
+        return best
+
+    def resolve(self, lon, lat):
+        """
+        :param lon: float
+        :param lat: float
+        :return: str, continent name
+        """
+        return self.resolve_batch([(lon, lat)])[0]
+
+    def resolve_batch(self, centers):
+        """
+        :param centers: List[Tuple[float, float]]; (lon, lat)
+        :return: List[str]; continent name of each center
+        """
+        names = [None] * len(centers)
+        if self.outlines and centers:
+            if hasattr(shapely, 'contains_xy'):  # Shapely 2, vectorized point in polygon
+                xs = [c[0] for c in centers]
+                ys = [c[1] for c in centers]
+                for name, geom in self.outlines:
+                    for i, inside in enumerate(shapely.contains_xy(geom, xs, ys)):
+                        if inside and names[i] is None:
+                            names[i] = name
+            else:
+                for i, (lon, lat) in enumerate(centers):
+                    point = Point(lon, lat)
+                    for name, geom in self._prepared:
+                        if geom.contains(point):
+                            names[i] = name
+                            break
+
+        for i, (lon, lat) in enumerate(centers):
+            if names[i] is None:
+                names[i] = self.nearest(lon, lat)
+        return names
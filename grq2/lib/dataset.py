@@ -1,13 +1,20 @@
 from future import standard_library
 
 import json
+import logging
 import traceback
-from datetime import datetime
 
 from shapely.geometry import shape
 
 from grq2 import app, grq_es
-from grq2.lib.geonames import get_cities, get_nearest_cities, get_continents
+from grq2.lib.geonames import get_cities, get_nearest_cities, get_continent
+from grq2.lib.bulk import build_bulk_bodies
+from grq2.lib.geometry import normalize_geojson_type
+from grq2.lib.footprint_cache import (get_footprint_cache, footprint_precision, footprint_key, footprint_entry,
+                                      apply_footprint_entry)
+from grq2.lib.registry import get_alias_registry, index_name, ensure_indices
+from grq2.lib.pipeline import get_ingest_pipeline, is_geo_enriched
+from grq2.lib.metrics import metrics, batch_labels
 from grq2.lib.time_utils import getTemporalSpanInDays as get_ts
 from grq2.lib.time_utils import datetime_iso_naive
 standard_library.install_aliases()
@@ -35,35 +42,28 @@ def map_geojson_type(geo_type):
 
     if geo_type in GEOJSON_TYPES:
         return geo_type
-
-    geo_type_lower = geo_type.lower()
-    if _POINT.lower() == geo_type_lower:
-        return _POINT
-    elif _MULTIPOINT.lower() == geo_type_lower:
-        return _MULTIPOINT
-    elif _MULTILINESTRING.lower() == geo_type_lower:
-        return _MULTILINESTRING
-    elif _LINESTRING.lower() == geo_type_lower:
-        return _LINESTRING
-    elif _MULTIPOLYGON.lower() == geo_type_lower:
-        return _MULTIPOLYGON
-    elif _POLYGON.lower() == geo_type_lower:
-        return _POLYGON
-    else:
-        return None
+    return normalize_geojson_type(geo_type)
 
 
-def update(update_json):
-    """Update GRQ metadata and urls for a product."""
+def prepare_update(update_json, pipeline=None):
+    """
+    adds the GRQ metadata (timestamp, reverse geo-location, temporal span) to a product
+    the timestamp and temporal span are left to the ingest pipeline if one is set (INGEST_PIPELINE)
+    :param update_json: Dict; product metadata
+    :param pipeline: str, ingest pipeline the product is indexed with (see get_ingest_pipeline()), None if none
+    :return: Tuple[str, List[str]]; index name, custom aliases
+    """
     version = update_json['version']  # get version
+    enrich = pipeline is None
 
-    update_json["@timestamp"] = datetime_iso_naive() + 'Z'
+    if enrich:
+        update_json["@timestamp"] = datetime_iso_naive() + 'Z'
 
     # TODO: maybe set the set the default value to "dataset" instead of None
     dataset = update_json.get('dataset', None)  # determine index name
     index_suffix = dataset
 
-    index = '{}_{}_{}'.format(app.config['GRQ_INDEX'], version, index_suffix)  # get default index
+    index = index_name(version, index_suffix)  # get default index
 
     # get custom index and aliases
     aliases = []
@@ -77,6 +77,17 @@ def update(update_json):
 
     # add reverse geo-location data
     if 'location' in update_json:
+        # footprint already reverse geolocated (FOOTPRINT_CACHE_SIZE)?
+        geocode = enrich or not is_geo_enriched()  # city & continent otherwise added by the ingest pipeline
+        cache = get_footprint_cache() if geocode else None
+        key = footprint_key(update_json, footprint_precision()) if cache is not None else None
+        entry = None
+        if key is not None:
+            with metrics.timer('footprint_cache'):
+                entry = cache.get_many([key]).get(key)
+            if entry is not None:
+                apply_footprint_entry(update_json, entry)
+
         location = {**update_json['location']}  # copying location to be used to create a shapely geometry object
         loc_type = location['type']
 
@@ -86,8 +97,9 @@ def update(update_json):
 
         # add center if missing
         if 'center' not in update_json:
-            geo_shape = shape(location)
-            centroid = geo_shape.centroid
+            with metrics.timer('geometry'):
+                geo_shape = shape(location)
+                centroid = geo_shape.centroid
             update_json['center'] = {
                 'type': 'point',
                 'coordinates': [centroid.x, centroid.y]
@@ -96,51 +108,175 @@ def update(update_json):
         # extract coordinates from center
         lon, lat = update_json['center']['coordinates']
 
-        # add cities
-        if geo_json_type in (_POLYGON, _MULTIPOLYGON):
-            mp = True if geo_json_type == _MULTIPOLYGON else False
-            coords = location['coordinates'][0]
-            cities = get_cities(coords, multipolygon=mp)
-            if cities:
-                update_json['city'] = cities
-        elif geo_json_type in (_POINT, _MULTIPOINT, _LINESTRING, _MULTILINESTRING):
-            nearest_cities = get_nearest_cities(lon, lat)
-            if nearest_cities:
-                update_json['city'] = nearest_cities
-        else:
-            raise TypeError('{} is not a valid GEOJson type (or un-supported): {}'.format(geo_json_type, GEOJSON_TYPES))
-
-        # add closest continent
-        continents = get_continents(lon, lat)
-        if continents:
-            update_json['continent'] = continents[0]['name'] if len(continents) > 0 else None
+        # add cities and closest continent (unless added by the ingest pipeline)
+        if geocode and entry is None:
+            with metrics.timer('geonames'):
+                cities, continent = add_geolocation(update_json, location, geo_json_type, lon, lat)
+            if key is not None and cities is not None:
+                with metrics.timer('footprint_cache'):
+                    cache.put_many({key: footprint_entry(update_json, cities, continent)})
 
     # set temporal_span
-    if update_json.get('starttime', None) is not None and update_json.get('endtime', None) is not None:
+    if enrich and update_json.get('starttime', None) is not None and update_json.get('endtime', None) is not None:
         if isinstance(update_json['starttime'], str) and isinstance(update_json['endtime'], str):
             start_time = update_json['starttime']
             end_time = update_json['endtime']
-            update_json['temporal_span'] = get_ts(start_time, end_time)
+            with metrics.timer('temporal_span'):
+                update_json['temporal_span'] = get_ts(start_time, end_time)
+
+    return index, aliases
 
-    result = grq_es.index_document(index=index, body=update_json, id=update_json['id'])
-    app.logger.debug("%s" % json.dumps(result, indent=2))
 
+def add_geolocation(update_json, location, geo_json_type, lon, lat):
+    """
+    adds the cities and closest continent of a product
+    :param update_json: Dict; product metadata
+    :param location: Dict; GEOJson location (with the proper GEOJson type)
+    :param geo_json_type: str
+    :param lon: float; center of the location
+    :param lat: float
+    :return: Tuple[List[Dict], str]; cities (None if the geonames index is not found) and continent
+    """
+    # add cities
+    if geo_json_type in (_POLYGON, _MULTIPOLYGON):
+        mp = True if geo_json_type == _MULTIPOLYGON else False
+        coords = location['coordinates'][0]
+        cities = get_cities(coords, multipolygon=mp)
+        if cities:
+            update_json['city'] = cities
+    elif geo_json_type in (_POINT, _MULTIPOINT, _LINESTRING, _MULTILINESTRING):
+        cities = get_nearest_cities(lon, lat)
+        if cities:
+            update_json['city'] = cities
+    else:
+        raise TypeError('{} is not a valid GEOJson type (or un-supported): {}'.format(geo_json_type, GEOJSON_TYPES))
+
+    # add closest continent
+    continent = get_continent(lon, lat)
+    if continent:
+        update_json['continent'] = continent
+    return cities, continent
+
+
+def update_labels(update_json):
+    """
+    :param update_json: Dict; product metadata (before prepare_update())
+    :return: Dict; dataset & index metrics labels of the product
+    """
+    dataset = update_json.get('dataset', None)
+    index = index_name(update_json.get('version'), dataset)
+    if 'suffix' in update_json.get('index', {}):
+        index = '{}_{}'.format(app.config['GRQ_INDEX'], update_json['index']['suffix']).lower()
+    return {'dataset': dataset, 'index': index}
+
+
+def add_aliases(index_aliases):
+    """
+    adds the custom aliases which don't exist yet (see grq2.lib.registry.AliasRegistry)
+    :param index_aliases: List[Tuple[str, str]]; (index, alias)
+    """
     # update custom aliases (Fixing HC-23)
-    if len(aliases) > 0:
+    if len(index_aliases) > 0:
         try:
-            actions = list()
-            for index_alias in aliases:
-                actions.append({"add": {"index": index, "alias": index_alias}})
-
-            update_alias = {"actions": actions}
-            grq_es.es.indices.update_aliases(update_alias)
+            with metrics.timer('aliases'):
+                added = get_alias_registry().add(index_aliases)
+            if added:
+                app.logger.info("added aliases: %s" % added)
         except Exception as e:
             app.logger.debug("Got exception trying to add aliases to index: %s\n%s\nContinuing on." %
                              (str(e), traceback.format_exc()))
 
+
+def update(update_json):
+    """Update GRQ metadata and urls for a product."""
+    with metrics.context(**(update_labels(update_json) if metrics.enabled else {})):
+        metrics.inc('grq_ingest_requests_total', endpoint='v0.1')
+        try:
+            pipeline = get_ingest_pipeline()  # resolved once, prepare_update() depends on it
+            index, aliases = prepare_update(update_json, pipeline)
+            with metrics.timer('indices'):
+                ensure_indices([index])
+
+            with metrics.timer('bulk'):
+                if pipeline is not None:
+                    result = grq_es.index_document(index=index, body=update_json, id=update_json['id'],
+                                                   pipeline=pipeline)
+                else:
+                    result = grq_es.index_document(index=index, body=update_json, id=update_json['id'])
+        except Exception:
+            metrics.inc('grq_ingest_errors_total')
+            raise
+        metrics.inc('grq_ingest_docs_total')
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("%s" % json.dumps(result, indent=2))
+
+        add_aliases([(index, alias) for alias in aliases])
+
     return {
         'success': True,
         'message': result,
         'objectid': update_json['id'],
         'index': index,
     }
+
+
+def update_bulk(update_jsons):
+    """
+    same as update() for many products, indexed with a single bulk request
+    :param update_jsons: List[Dict]; products metadata
+    :return: List[Dict|Exception]; update() response of each product, or the exception it raised
+    """
+    results = [None] * len(update_jsons)
+    docs_bulk = []
+    positions = []
+    index_aliases = []
+    metrics.inc('grq_ingest_requests_total', len(update_jsons), endpoint='v0.1')
+    pipeline = get_ingest_pipeline()  # resolved once, prepare_update() depends on it
+    for i, update_json in enumerate(update_jsons):
+        try:
+            with metrics.context(**(update_labels(update_json) if metrics.enabled else {})):
+                index, aliases = prepare_update(update_json, pipeline)
+        except Exception as e:
+            metrics.inc('grq_ingest_errors_total', dataset=update_json.get('dataset'))
+            results[i] = e
+            continue
+        docs_bulk.append({"index": {"_index": index, "_id": update_json['id']}})
+        docs_bulk.append(update_json)
+        positions.append(i)
+        index_aliases.extend([(index, alias) for alias in aliases])
+
+    indices = [docs_bulk[i]["index"]["_index"] for i in range(0, len(docs_bulk), 2)]
+    labels = batch_labels((update_jsons[i].get('dataset'), index) for i, index in zip(positions, indices))
+    with metrics.timer('indices', **labels):
+        ensure_indices(indices)
+
+    bulk_limit = app.config.get("BULK_LIMIT", 1e+8)
+    kwargs = {"request_timeout": app.config.get("BULK_REQUEST_TIMEOUT", 10)}
+    if pipeline is not None:
+        kwargs["pipeline"] = pipeline
+    with metrics.timer('serialize', **labels):
+        bodies = build_bulk_bodies(docs_bulk, bulk_limit)
+    resp_items = []
+    for body in bodies:
+        with metrics.timer('bulk', **labels):
+            resp_items.extend(grq_es.es.bulk(body=body, **kwargs)["items"])
+        metrics.inc('grq_ingest_chunks_total', **labels)
+        metrics.inc('grq_ingest_bytes_total', len(body), **labels)
+    app.logger.debug("bulk indexed %d documents" % len(resp_items))
+
+    for i, item in zip(positions, resp_items):
+        doc_info = item["index"]
+        if "error" in doc_info:
+            metrics.inc('grq_ingest_errors_total', dataset=update_jsons[i].get('dataset'), index=doc_info["_index"])
+            results[i] = Exception("failed to index %s: %s" % (doc_info["_id"], json.dumps(doc_info["error"])))
+            continue
+        metrics.inc('grq_ingest_docs_total', dataset=update_jsons[i].get('dataset'), index=doc_info["_index"])
+        results[i] = {
+            'success': True,
+            'message': doc_info,
+            'objectid': doc_info["_id"],
+            'index': doc_info["_index"],
+        }
+
+    add_aliases(index_aliases)
+    return results
@@ -0,0 +1,92 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import re
+from datetime import datetime
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DATETIME_RE = re.compile(r'^(\d{4})[/-](\d{2})[/-](\d{2})[\s*T](\d{2}):(\d{2}):(\d{2})(?:\.\d+)?Z?$')
+DATE_RE = re.compile(r'^(\d{4})[/-](\d{2})[/-](\d{2})$')
+
+CACHE_SIZE = 65536
+NUMPY_MIN_BATCH = 256  # smaller batches are faster in pure python
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+def parse_time_elements(dt_str):
+    """
+    same as grq2.lib.time_utils.getTimeElementsFromString, with a fast path for YYYY-MM-DDTHH:MM:SS[.ffffff][Z]
+    :param dt_str: str
+    :return: Tuple[int]; (year, month, day, hour, minute, second)
+    """
+    n = len(dt_str)
+    if n >= 19 and dt_str[10] == 'T' and dt_str[4] == '-' and dt_str[7] == '-' and dt_str[13] == ':' \
+            and dt_str[16] == ':' and (n == 19 or (n == 20 and dt_str[19] == 'Z')):
+        digits = dt_str[0:4] + dt_str[5:7] + dt_str[8:10] + dt_str[11:13] + dt_str[14:16] + dt_str[17:19]
+        if digits.isdecimal() and digits.isascii():
+            return (int(digits[0:4]), int(digits[4:6]), int(digits[6:8]),
+                    int(digits[8:10]), int(digits[10:12]), int(digits[12:14]))
+
+    match = DATETIME_RE.match(dt_str)
+    if match:
+        return tuple(map(int, match.groups()))
+    match = DATE_RE.match(dt_str)
+    if match:
+        year, month, day = map(int, match.groups())
+        return year, month, day, 0, 0, 0
+    raise RuntimeError("Failed to recognize date format: %s" % dt_str)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def epoch_seconds(dt_str):
+    """
+    :param dt_str: str, date time string (see parse_time_elements)
+    :return: int, seconds since 1970-01-01T00:00:00 (naive)
+    """
+    dt = datetime(*parse_time_elements(dt_str))  # validates the date & time values
+    return (dt.toordinal() - _EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+def span_in_days(seconds):
+    """
+    rounding rule of grq2.lib.time_utils.getTemporalSpanInDays: whole days, +1 if the remainder is >= 12 hours
+    :param seconds: int, absolute difference in seconds
+    :return: int
+    """
+    days, remainder = divmod(seconds, 86400)
+    return days + 1 if remainder >= 43200 else days
+
+
+def temporal_span_days(dt1, dt2):
+    """
+    same as grq2.lib.time_utils.getTemporalSpanInDays, timestamps are parsed once and cached (LRU)
+    :param dt1: str
+    :param dt2: str
+    :return: int
+    """
+    return span_in_days(abs(epoch_seconds(dt1) - epoch_seconds(dt2)))
+
+
+def temporal_spans(pairs, use_numpy=None):
+    """
+    temporal span (in days) of many start/end time pairs
+    :param pairs: List[Tuple[str, str]]; (starttime, endtime)
+    :param use_numpy: bool, vectorize the arithmetic with numpy (default: if installed and the batch is large enough)
+    :return: List[int]
+    """
+    if use_numpy is None:
+        use_numpy = np is not None and len(pairs) >= NUMPY_MIN_BATCH
+
+    if not use_numpy:
+        return [temporal_span_days(dt1, dt2) for dt1, dt2 in pairs]
+
+    starts = np.fromiter((epoch_seconds(p[0]) for p in pairs), dtype=np.int64, count=len(pairs))
+    ends = np.fromiter((epoch_seconds(p[1]) for p in pairs), dtype=np.int64, count=len(pairs))
+    days, remainder = np.divmod(np.abs(ends - starts), 86400)
+    return (days + (remainder >= 43200)).tolist()
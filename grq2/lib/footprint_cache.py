@@ -0,0 +1,220 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from grq2 import app
+from grq2.lib import codec
+from grq2.lib.geometry import normalize_geojson_type
+from grq2.lib.geonames import get_cities_index
+from grq2.lib.metrics import metrics
+
+
+'''
+cache of the reverse geolocation of the dataset footprints (center, cities and continent), orbit based products reuse
+the same frame/track footprints across dates so most of them skip the centroid and geonames lookups
+
+the entries are keyed by a hash of the normalized footprint: GEOJson type and coordinates rounded to
+FOOTPRINT_CACHE_PRECISION decimals (plus the dataset's own center if it has one, the continent and nearest cities are
+looked up from it)
+'''
+
+
+def _round_coordinates(coordinates, precision):
+    if isinstance(coordinates, str):  # would recurse into its characters
+        raise TypeError("invalid coordinates: %s" % coordinates)
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(float(c), precision) + 0. for c in coordinates[:2]]  # + 0. turns -0.0 into 0.0
+    return [_round_coordinates(c, precision) for c in coordinates]
+
+
+def footprint_key(prod_json, precision=5):
+    """
+    :param prod_json: Dict; dataset metadata
+    :param precision: int, decimals kept of the coordinates
+    :return: str, hash of the normalized footprint, None if the dataset has no (supported) location
+    """
+    location = prod_json.get('location', None)
+    if not location:
+        return None
+    geo_type = normalize_geojson_type(location.get('type', ''))
+    if geo_type is None:
+        return None
+
+    try:
+        normalized = [geo_type, _round_coordinates(location['coordinates'], precision)]
+        if 'center' in prod_json:
+            normalized.append(_round_coordinates(prod_json['center']['coordinates'], precision))
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+    return hashlib.sha1(json.dumps(normalized, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def footprint_entry(prod_json, cities, continent):
+    """
+    :param prod_json: Dict; dataset metadata (with its center)
+    :param cities: List[Dict]
+    :param continent: str
+    :return: Dict; cache entry
+    """
+    return {
+        'center': prod_json['center']['coordinates'],
+        'city': cities,
+        'continent': continent,
+    }
+
+
+def apply_footprint_entry(prod_json, entry):
+    """
+    adds the cached center (if missing), cities and continent to the dataset
+    :param prod_json: Dict; dataset metadata
+    :param entry: Dict; see footprint_entry()
+    """
+    if 'center' not in prod_json:
+        prod_json['center'] = {
+            'type': 'point',
+            'coordinates': entry['center']
+        }
+    if entry.get('city'):
+        prod_json['city'] = entry['city']
+    if entry.get('continent'):
+        prod_json['continent'] = entry['continent']
+
+
+class FootprintCache:
+    """
+    In-process LRU cache of footprint entries (bounded to size entries), optionally backed by redis so every GRQ worker
+    shares the footprints seen by the others
+        the entries are kept encoded, every lookup returns new objects (the datasets can't alter the cached ones)
+        redis errors are logged and counted as misses, the cache never fails an ingest
+
+    :param size: int, max number of footprints kept in process
+    :param ttl: int, seconds an entry is kept (in process and in redis)
+    :param redis_url: str, redis backing the cache (None: in process only)
+    :param prefix: str, prefix of the redis keys
+    """
+
+    def __init__(self, size, ttl=604800, redis_url=None, prefix='grq_footprint_cache:'):
+        self.size = size
+        self.ttl = ttl
+        self.prefix = prefix
+        self.redis = Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1) if redis_url else None
+        self._entries = OrderedDict()  # key -> (expiration time, encoded entry)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, raw_entries):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            for key, raw in raw_entries.items():
+                self._entries[key] = (expires_at, raw)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        """
+        :param keys: Iterable[str]; footprint keys, see footprint_key()
+        :return: Dict[str, Dict]; entries of the cached footprints
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        missing = []
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                item = self._entries.get(key, None)
+                if item is not None and item[0] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = item[1]
+                else:
+                    self._entries.pop(key, None)
+                    missing.append(key)
+        memory_hits = len(found)
+
+        if missing and self.redis is not None:
+            try:
+                values = self.redis.mget([self.prefix + key for key in missing])
+            except RedisError as e:
+                app.logger.warning("footprint cache: unable to read from redis: %s" % str(e))
+                values = []
+            shared = {key: raw for key, raw in zip(missing, values) if raw is not None}
+            self._store(shared)
+            found.update(shared)
+
+        metrics.inc('grq_footprint_cache_hits_total', memory_hits, tier='memory')
+        metrics.inc('grq_footprint_cache_hits_total', len(found) - memory_hits, tier='redis')
+        metrics.inc('grq_footprint_cache_misses_total', len(keys) - len(found))
+        return {key: codec.loads(raw) for key, raw in found.items()}
+
+    def put_many(self, entries):
+        """
+        :param entries: Dict[str, Dict]; footprint key -> entry, see footprint_entry()
+        """
+        if not entries:
+            return
+        raw_entries = {key: codec.dumpb(entry) for key, entry in entries.items()}
+        self._store(raw_entries)
+
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, raw in raw_entries.items():
+                    pipe.set(self.prefix + key, raw, ex=self.ttl)
+                pipe.execute()
+            except RedisError as e:
+                app.logger.warning("footprint cache: unable to write to redis: %s" % str(e))
+
+
+def continent_mode():
+    """
+    :return: str, how GRQ resolves the continent of the cached footprints: "outlines" (CONTINENT_RESOLVER with
+             CONTINENT_OUTLINES, point in polygon) or "nearest" (closest continent point)
+    """
+    if app.config.get('CONTINENT_RESOLVER', False) is True and app.config.get('CONTINENT_OUTLINES', None):
+        return 'outlines'
+    return 'nearest'
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_footprint_cache():
+    """
+    footprint cache of the current GRQ worker (FOOTPRINT_CACHE_SIZE footprints, backed by REDIS_URL if
+    FOOTPRINT_CACHE_REDIS), created on first use
+    :return: FootprintCache, None if disabled
+    """
+    global _cache
+
+    size = int(app.config.get('FOOTPRINT_CACHE_SIZE', 0) or 0)
+    if size <= 0:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            redis_url = app.config['REDIS_URL'] if app.config.get('FOOTPRINT_CACHE_REDIS', False) is True else None
+            ttl = int(app.config.get('FOOTPRINT_CACHE_TTL', 604800))
+            # the cached cities depend on the geonames index and the continents on how they're resolved, a new index
+            # or continent mode starts a new set of redis keys
+            prefix = 'grq_footprint_cache:%s:%s:' % (get_cities_index(), continent_mode())
+            _cache = FootprintCache(size, ttl=ttl, redis_url=redis_url, prefix=prefix)
+            app.logger.info("footprint cache of %d entries%s" % (size, " backed by redis" if redis_url else ""))
+    return _cache
+
+
+def footprint_precision():
+    """
+    :return: int, decimals of the coordinates kept in the footprint keys (FOOTPRINT_CACHE_PRECISION)
+    """
+    return int(app.config.get('FOOTPRINT_CACHE_PRECISION', 5))
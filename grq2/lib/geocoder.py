@@ -0,0 +1,222 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import gzip
+import json
+import math
+from array import array
+
+
+EARTH_RADIUS_KM = 6371.0087714  # mean earth radius, same value ES uses for _geo_distance (arc)
+NEAREST_CITIES_DISTANCE_KM = 100.
+CONTINENTS_SIZE = 10  # ES's default search size, get_continents() doesn't set one
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """
+    great-circle distance between 2 points
+    :param lon1: float
+    :param lat1: float
+    :param lon2: float
+    :param lat2: float
+    :return: float, distance in kilometers
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    h = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1., math.sqrt(h)))
+
+
+def point_in_ring(lon, lat, ring):
+    """
+    ray casting point in polygon test, ring is a list of [lon, lat] points
+    :param lon: float
+    :param lat: float
+    :param ring: List[List[float]]
+    :return: bool
+    """
+    inside = False
+    n = len(ring)
+    j = n - 1
+    for i in range(n):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def read_snapshot(path):
+    """
+    reads a geonames snapshot, newline delimited JSON of geonames docs (gzip compressed if ends with .gz)
+    :param path: str
+    :return: Generator[Dict]
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def is_populated_place(doc):
+    """mirrors the feature_class: P & population >= 1 filter used in the geonames queries"""
+    return doc.get('feature_class') == 'P' and (doc.get('population') or 0) >= 1
+
+
+def is_continent(doc):
+    """mirrors the feature_class: L & feature_code: CONT filter used in get_continents()"""
+    return doc.get('feature_class') == 'L' and doc.get('feature_code') == 'CONT'
+
+
+class LocalGeocoder:
+    """
+    In-memory reverse geocoder over the populated places of the geonames index
+
+    Places are kept in flat arrays sorted by population (desc) and bucketed into a lat/lon grid, answering the same
+    questions as the ES queries in grq2.lib.geonames:
+        - top N populated cities within a polygon (get_cities)
+        - nearest cities within 100km (get_nearest_cities)
+        - closest continents (get_continents)
+    results are the geonames docs, same as the _source of the ES hits
+    """
+
+    def __init__(self, docs, cell_size=1.):
+        """
+        :param docs: Iterable[Dict]; geonames docs (ie. the _source of the geonames index)
+        :param cell_size: float; size of the grid cells (degrees)
+        """
+        self.cell_size = float(cell_size)
+
+        places = []
+        self._continents = []
+        for doc in docs:
+            if is_populated_place(doc):
+                places.append(doc)
+            elif is_continent(doc):
+                self._continents.append(doc)
+        places.sort(key=lambda d: d['population'], reverse=True)
+
+        self._docs = places
+        self._lon = array('d', (d['location']['lon'] for d in places))
+        self._lat = array('d', (d['location']['lat'] for d in places))
+
+        self._grid = {}
+        for i in range(len(places)):
+            cell = self._cell(self._lon[i], self._lat[i])
+            bucket = self._grid.get(cell)
+            if bucket is None:
+                bucket = self._grid[cell] = array('l')
+            bucket.append(i)  # buckets stay sorted by population because places are
+
+    def __len__(self):
+        return len(self._docs)
+
+    @property
+    def continents(self):
+        """geonames continent docs (feature_class: L, feature_code: CONT)"""
+        return list(self._continents)
+
+    @classmethod
+    def from_snapshot(cls, path, cell_size=1.):
+        """
+        :param path: str; path to the geonames snapshot (see scripts/geonames/create_snapshot.py)
+        :param cell_size: float
+        :return: LocalGeocoder
+        """
+        return cls(read_snapshot(path), cell_size=cell_size)
+
+    def _cell(self, lon, lat):
+        return int(math.floor(lon / self.cell_size)), int(math.floor(lat / self.cell_size))
+
+    def _candidates(self, min_lon, min_lat, max_lon, max_lat):
+        """indices of the places in the grid cells overlapping the bounding box, sorted by population (desc)"""
+        min_x, min_y = self._cell(min_lon, min_lat)
+        max_x, max_y = self._cell(max_lon, max_lat)
+        candidates = []
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                bucket = self._grid.get((x, y))
+                if bucket is not None:
+                    candidates.extend(bucket)
+        candidates.sort()
+        return candidates
+
+    def get_cities(self, polygon, size=5, multipolygon=False):
+        """
+        top populated cities within a polygon, same semantics as grq2.lib.geonames.get_cities
+        :param polygon: List[List[float]], or List[List[List[float]]] if multipolygon (matched as an OR)
+        :param size: int
+        :param multipolygon: bool
+        :return: List[Dict]
+        """
+        rings = [r for r in polygon if r] if multipolygon else [polygon]
+        results = []
+        seen = set()
+        for ring in rings:
+            xs = [p[0] for p in ring]
+            ys = [p[1] for p in ring]
+            min_lon, max_lon, min_lat, max_lat = min(xs), max(xs), min(ys), max(ys)
+            for i in self._candidates(min_lon, min_lat, max_lon, max_lat):
+                if i in seen:
+                    continue
+                lon, lat = self._lon[i], self._lat[i]
+                if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat and point_in_ring(lon, lat, ring):
+                    seen.add(i)
+                    results.append(i)
+
+        results.sort()
+        return [dict(self._docs[i]) for i in results[:size]]
+
+    def get_nearest_cities(self, lon, lat, size=5, distance=NEAREST_CITIES_DISTANCE_KM):
+        """
+        populated cities closest to the point, same semantics as grq2.lib.geonames.get_nearest_cities
+        :param lon: float
+        :param lat: float
+        :param size: int
+        :param distance: float; max distance (km)
+        :return: List[Dict]
+        """
+        d_lat = math.degrees(distance / EARTH_RADIUS_KM)
+        min_lat, max_lat = max(-90., lat - d_lat), min(90., lat + d_lat)
+        lon_ranges = [(-180., 180.)]  # circle reaches a pole, every longitude is a candidate
+        if -90. < min_lat and max_lat < 90.:
+            d_lon = d_lat / math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+            if d_lon < 180.:
+                lon_ranges = [(lon - d_lon, lon + d_lon)]
+                if lon - d_lon < -180.:
+                    lon_ranges.append((lon - d_lon + 360., 180.))
+                if lon + d_lon > 180.:
+                    lon_ranges.append((-180., lon + d_lon - 360.))
+
+        hits = []
+        seen = set()
+        for min_lon, max_lon in lon_ranges:
+            for i in self._candidates(min_lon, min_lat, max_lon, max_lat):
+                if i in seen:
+                    continue
+                seen.add(i)
+                dist = haversine_km(lon, lat, self._lon[i], self._lat[i])
+                if dist <= distance:
+                    hits.append((dist, i))
+
+        hits.sort()
+        return [dict(self._docs[i]) for _, i in hits[:size]]
+
+    def get_continents(self, lon, lat, size=CONTINENTS_SIZE):
+        """
+        continents sorted by distance to the point, same semantics as grq2.lib.geonames.get_continents
+        :param lon: float
+        :param lat: float
+        :param size: int
+        :return: List[Dict]
+        """
+        ranked = sorted(
+            ((haversine_km(lon, lat, c['location']['lon'], c['location']['lat']), i)
+             for i, c in enumerate(self._continents))
+        )
+        return [dict(self._continents[i]) for _, i in ranked[:size]]
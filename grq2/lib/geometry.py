@@ -0,0 +1,135 @@
+from future import standard_library
+standard_library.install_aliases()
+
+from collections import namedtuple
+
+import shapely
+from shapely.geometry import shape
+
+try:
+    import numpy as np  # Shapely 2 depends on numpy
+except ImportError:
+    np = None
+
+
+GEOJSON_TYPE_NAMES = {t.lower(): t for t in (
+    'Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon'
+)}
+
+RAGGED_TYPES = {
+    'Point': 0, 'LineString': 1, 'Polygon': 3, 'MultiPoint': 4, 'MultiLineString': 5, 'MultiPolygon': 6
+}  # shapely.GeometryType values
+
+GeometryInfo = namedtuple('GeometryInfo', ['type', 'center', 'bounds'])
+
+
+def normalize_geojson_type(geo_type):
+    """
+    :param geo_type: str, GEOJson type in any case, ex. multipolygon
+    :return: str, GEOJson type (ex. MultiPolygon), None if not supported
+    """
+    return GEOJSON_TYPE_NAMES.get(geo_type.lower())
+
+
+def _prepare_geometry(geo_type, location):
+    geo_shape = shape({'type': geo_type, 'coordinates': location['coordinates']})
+    centroid = geo_shape.centroid
+    return GeometryInfo(geo_type, (centroid.x, centroid.y), tuple(geo_shape.bounds))
+
+
+def ragged_array(geo_type, coordinates):
+    """
+    flattens the coordinates of geometries of the same type into shapely's ragged array (coords, offsets) layout
+    :param geo_type: str, GEOJson type
+    :param coordinates: List; GEOJson coordinates of each geometry
+    :return: Tuple[numpy.ndarray, Tuple[numpy.ndarray]]
+    """
+    coords = []
+    if geo_type == 'Point':
+        coords = coordinates
+        offsets = ()
+    elif geo_type in ('LineString', 'MultiPoint'):
+        offsets = [0]
+        for c in coordinates:
+            coords.extend(c)
+            offsets.append(len(coords))
+        offsets = (offsets,)
+    elif geo_type in ('Polygon', 'MultiLineString'):
+        rings, parts = [0], [0]
+        for c in coordinates:
+            for ring in c:
+                coords.extend(ring)
+                rings.append(len(coords))
+            parts.append(len(rings) - 1)
+        offsets = (rings, parts)
+    else:  # MultiPolygon
+        rings, polygons, parts = [0], [0], [0]
+        for c in coordinates:
+            for polygon in c:
+                for ring in polygon:
+                    coords.extend(ring)
+                    rings.append(len(coords))
+                polygons.append(len(rings) - 1)
+            parts.append(len(polygons) - 1)
+        offsets = (rings, polygons, parts)
+
+    coords = np.asarray(coords, dtype=float)
+    if coords.ndim != 2 or coords.shape[1] < 2:
+        raise ValueError("invalid %s coordinates" % geo_type)
+    return coords[:, :2], tuple(np.asarray(o, dtype=np.int64) for o in offsets)
+
+
+def prepare_geometries(locations):
+    """
+    computes the GEOJson type, centroid and bounding envelope of many geometries at once
+        with Shapely 2 the geometries of each type are built from flat coordinate arrays and measured with single
+        vectorized calls instead of 1 shape() per geometry, Shapely 1.x falls back to shape()
+    :param locations: List[Dict]; GEOJson geometries (dataset's location)
+    :return: List[GeometryInfo]; (type, (lon, lat), (min_lon, min_lat, max_lon, max_lat)), None for unsupported types
+    """
+    results = [None] * len(locations)
+    by_type = {}
+    for i, loc in enumerate(locations):
+        geo_type = normalize_geojson_type(loc['type'])
+        if geo_type is not None:
+            by_type.setdefault(geo_type, []).append(i)
+
+    for geo_type, positions in by_type.items():
+        if not hasattr(shapely, 'from_ragged_array'):  # Shapely < 2.0
+            for i in positions:
+                results[i] = _prepare_geometry(geo_type, locations[i])
+            continue
+
+        try:
+            coords, offsets = ragged_array(geo_type, [locations[i]['coordinates'] for i in positions])
+            measures = measure_geometries(RAGGED_TYPES[geo_type], coords, offsets)
+        except Exception:  # invalid geometry somewhere in the batch, shape() reports which one
+            for i in positions:
+                results[i] = _prepare_geometry(geo_type, locations[i])
+            continue
+
+        for i, info in zip(positions, geometry_infos(geo_type, measures)):
+            results[i] = info
+    return results
+
+
+def measure_geometries(type_code, coords, offsets):
+    """
+    centroid and bounding envelope of geometries of the same type given as a ragged array (Shapely 2 only)
+    :param type_code: int, shapely.GeometryType value (see RAGGED_TYPES)
+    :param coords: numpy.ndarray; (N, 2) coordinates, see ragged_array()
+    :param offsets: Tuple[numpy.ndarray]
+    :return: numpy.ndarray; (n, 6) center lon, center lat, min lon, min lat, max lon, max lat of each geometry
+    """
+    geoms = shapely.from_ragged_array(type_code, coords, offsets or None)
+    centroids = shapely.centroid(geoms)
+    return np.column_stack((shapely.get_x(centroids), shapely.get_y(centroids), shapely.bounds(geoms)))
+
+
+def geometry_infos(geo_type, measures):
+    """
+    :param geo_type: str, GEOJson type
+    :param measures: numpy.ndarray; see measure_geometries()
+    :return: List[GeometryInfo]
+    """
+    return [GeometryInfo(geo_type, (m[0], m[1]), tuple(m[2:])) for m in measures.tolist()]
@@ -1,13 +1,240 @@
 from future import standard_library
 standard_library.install_aliases()
 
+import os
 import json
+import time
+import logging
+import traceback
 import elasticsearch.exceptions
 import opensearchpy.exceptions
+from collections import namedtuple
+
+from shapely.geometry import Polygon
 
 from grq2 import app, grq_es
+from grq2.lib.geocoder import LocalGeocoder
+from grq2.lib.continents import ContinentResolver
+from grq2.lib.offload import offload_lookups
 from hysds_commons.search_utils import JitteredBackoffException
 
+
+_local_geocoder = None
+_local_geocoder_loaded = False
+_continent_resolver = None
+_continent_resolver_retry_at = 0.
+
+
+def get_local_geocoder():
+    """
+    in-process geocoder built from the GEONAMES_SNAPSHOT file, loaded once per process
+    :return: LocalGeocoder, None if no snapshot is configured/available (queries fall back to ES)
+    """
+    global _local_geocoder, _local_geocoder_loaded
+
+    if _local_geocoder_loaded is True:
+        return _local_geocoder
+    _local_geocoder_loaded = True
+
+    snapshot = app.config.get('GEONAMES_SNAPSHOT', None)
+    if not snapshot:
+        return None
+    if not os.path.exists(snapshot):
+        app.logger.warning("geonames snapshot %s not found, falling back to Elasticsearch" % snapshot)
+        return None
+
+    try:
+        _local_geocoder = LocalGeocoder.from_snapshot(snapshot)
+        app.logger.info("loaded %d populated places from geonames snapshot %s" % (len(_local_geocoder), snapshot))
+    except Exception as e:
+        app.logger.error("unable to load geonames snapshot %s, falling back to Elasticsearch: %s\n%s" %
+                         (snapshot, str(e), traceback.format_exc()))
+    return _local_geocoder
+
+
+def get_cities_index():
+    """
+    :return: str, index (or alias) of the populated places queried by get_cities()/get_nearest_cities(), the compact
+             GEONAMES_CITIES_INDEX if set (see scripts/geonames/import_ES.py --cities-index), GEONAMES_INDEX otherwise
+    """
+    return app.config.get('GEONAMES_CITIES_INDEX', None) or app.config['GEONAMES_INDEX']
+
+
+CitiesQueryPlan = namedtuple('CitiesQueryPlan', ['bbox_prefilter', 'geo_shape', 'max_vertices', 'simplify_tolerance'])
+
+GEO_POLYGON_PLAN = CitiesQueryPlan(False, False, None, 0.)  # 1 geo_polygon per ring, as before the query planner
+
+COMPLEX_VERTICES = 100  # footprints with more vertices are queried with geo_shape (GEONAMES_CITIES_GEO_SHAPE)
+
+
+def get_cities_query_plan():
+    """
+    :return: CitiesQueryPlan; how get_cities() queries the footprints (GEONAMES_CITIES_* settings)
+    """
+    return CitiesQueryPlan(
+        app.config.get('GEONAMES_CITIES_BBOX_PREFILTER', False) is True,
+        app.config.get('GEONAMES_CITIES_GEO_SHAPE', False) is True,
+        int(app.config.get('GEONAMES_CITIES_MAX_VERTICES', 0) or 0) or None,
+        float(app.config.get('GEONAMES_CITIES_SIMPLIFY_TOLERANCE', 0.0005)),
+    )
+
+
+def simplify_rings(rings, max_vertices, tolerance):
+    """
+    simplifies (Douglas-Peucker, topology preserving) the rings of a footprint having more than max_vertices vertices,
+    the tolerance is doubled until the footprint fits (cities closer than the tolerance to the edge may change)
+    :param rings: List[List[List[float]]]
+    :param max_vertices: int
+    :param tolerance: float, initial tolerance (degrees)
+    :return: List[List[List[float]]]; the rings unchanged if they can't be simplified
+    """
+    if not max_vertices or tolerance <= 0 or sum(len(r) for r in rings) <= max_vertices:
+        return rings
+
+    try:
+        polygons = [Polygon([p[:2] for p in ring]) for ring in rings]
+    except (ValueError, TypeError, IndexError):
+        return rings
+
+    for _ in range(10):
+        simplified = []
+        for polygon in polygons:
+            geom = polygon.simplify(tolerance, preserve_topology=True)
+            if geom.is_empty or geom.geom_type != 'Polygon':
+                return rings
+            simplified.append([list(c) for c in geom.exterior.coords])
+        if sum(len(r) for r in simplified) <= max_vertices:
+            break
+        tolerance *= 2
+    return simplified
+
+
+def footprint_envelope(rings):
+    """
+    :param rings: List[List[List[float]]]
+    :return: Tuple[float, float, float, float]; min lon, min lat, max lon, max lat (None if empty or out of range)
+    """
+    lons = [p[0] for ring in rings for p in ring]
+    lats = [p[1] for ring in rings for p in ring]
+    if not lons:
+        return None
+    envelope = (min(lons), min(lats), max(lons), max(lats))
+    if envelope[0] < -180. or envelope[2] > 180. or envelope[1] < -90. or envelope[3] > 90.:
+        return None
+    return envelope
+
+
+def _closed_ring(ring):
+    ring = [[p[0], p[1]] for p in ring]
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+    return ring
+
+
+def cities_filters(polygon, multipolygon=False, plan=GEO_POLYGON_PLAN):
+    """
+    query planner of get_cities(), the footprint is matched with:
+        - a geo_bounding_box of its envelope (bbox_prefilter), a cheap filter run before the polygon test
+        - a single geo_shape intersects query (geo_shape) if multi-part or complex (> COMPLEX_VERTICES vertices),
+          instead of 1 geo_polygon per ring OR-ed together, each evaluated against the whole index
+        - the footprint simplified first if it has more than max_vertices vertices
+    geo_polygon is kept for the footprints spanning 180 degrees or more of longitude (geo_shape would split them at the
+    antimeridian)
+    :param polygon: List[List[float]], or List[List[List[float]]] if multipolygon
+    :param multipolygon: bool
+    :param plan: CitiesQueryPlan
+    :return: Tuple[List[Dict], List[Dict]]; filter clauses, should clauses (at least 1 must match)
+    """
+    rings = polygon if multipolygon else [polygon]
+    if plan.max_vertices:
+        rings = simplify_rings(rings, plan.max_vertices, plan.simplify_tolerance)
+
+    filters = []
+    envelope = footprint_envelope(rings) if plan.bbox_prefilter or plan.geo_shape else None
+    if plan.bbox_prefilter and envelope is not None:
+        min_lon, min_lat, max_lon, max_lat = envelope
+        filters.append({
+            "geo_bounding_box": {
+                "location": {
+                    "top_left": {"lat": max_lat, "lon": min_lon},
+                    "bottom_right": {"lat": min_lat, "lon": max_lon}
+                }
+            }
+        })
+
+    if (plan.geo_shape and envelope is not None and envelope[2] - envelope[0] < 180. and
+            (len(rings) > 1 or len(rings[0]) > COMPLEX_VERTICES) and all(len(r) >= 3 for r in rings)):
+        filters.append({
+            "geo_shape": {
+                "location": {
+                    "shape": {
+                        "type": "multipolygon",
+                        "coordinates": [[_closed_ring(r)] for r in rings]  # each ring is a part, matched as an OR
+                    },
+                    "relation": "intersects"
+                }
+            }
+        })
+        return filters, []
+
+    if multipolygon:
+        return filters, [{"geo_polygon": {"location": {"points": r}}} for r in rings]
+    filters.append({
+        "geo_polygon": {
+            "location": {
+                "points": rings[0],
+            }
+        }
+    })
+    return filters, []
+
+
+def cities_query(polygon, size=5, multipolygon=False, plan=None):
+    """
+    query DSL for get_cities()
+    :param polygon: List[List[float]], or List[List[List[float]]] if multipolygon
+    :param size: int
+    :param multipolygon: bool
+    :param plan: CitiesQueryPlan, see cities_filters() (default: get_cities_query_plan())
+    :return: Dict
+    """
+    # build query DSL
+    query = {
+        "size": size,
+        "sort": {
+            "population": {
+                "order": "desc"
+            }
+        },
+        "query": {
+            "bool": {
+                "filter": [
+                    {
+                        "term": {
+                            "feature_class": "P"
+                        }
+                    },
+                    {
+                        "range": {
+                            "population": {
+                                "gte": 1
+                            }
+                        }
+                    }
+                ]
+            }
+        }
+    }
+
+    filters, or_filters = cities_filters(polygon, multipolygon=multipolygon, plan=plan or get_cities_query_plan())
+    query['query']['bool']['filter'].extend(filters)
+    if or_filters:
+        # filtered is removed, using bool + should + minimum_should_match instead
+        query['query']['bool']['should'] = or_filters
+        query['query']['bool']['minimum_should_match'] = 1
+    return query
+
+
 def get_cities(polygon, size=5, multipolygon=False):
     """
     Spatial search of top populated cities within a bounding box.
@@ -53,62 +280,16 @@ def get_cities(polygon, size=5, multipolygon=False):
       }
     }
     """
+    geocoder = get_local_geocoder()
+    if geocoder is not None:
+        return geocoder.get_cities(polygon, size=size, multipolygon=multipolygon)
 
-    # build query DSL
-    query = {
-        "size": size,
-        "sort": {
-            "population": {
-                "order": "desc"
-            }
-        },
-        "query": {
-            "bool": {
-                "filter": [
-                    {
-                        "term": {
-                            "feature_class": "P"
-                        }
-                    },
-                    {
-                        "range": {
-                            "population": {
-                                "gte": 1
-                            }
-                        }
-                    }
-                ]
-            }
-        }
-    }
-
-    # multipolygon?
-    if multipolygon:
-        or_filters = []
-        for p in polygon:
-            or_filters.append({
-                "geo_polygon": {
-                    "location": {
-                        "points": p,
-                    }
-                }
-            })
-        # filtered is removed, using bool + should + minimum_should_match instead
-        query['query']['bool']['should'] = or_filters
-        query['query']['bool']['minimum_should_match'] = 1
-
-    else:
-        query['query']['bool']['filter'].append({  # noqa
-            "geo_polygon": {
-                "location": {
-                    "points": polygon,
-                }
-            }
-        })
-    index = app.config['GEONAMES_INDEX']
+    query = cities_query(polygon, size=size, multipolygon=multipolygon)
+    index = get_cities_index()
     try:
         res = grq_es.search(index=index, body=query)  # query for results
-        app.logger.debug("get_cities(): %s" % json.dumps(query))
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("get_cities(): %s" % json.dumps(query))
 
         results = []
         for hit in res['hits']['hits']:
@@ -122,12 +303,13 @@ def get_cities(polygon, size=5, multipolygon=False):
         raise Exception(e)
 
 
-def get_nearest_cities(lon, lat, size=5):
+def nearest_cities_query(lon, lat, size=5):
     """
+    query DSL for get_nearest_cities()
     :param lon: float lon of center (ex. -122.61067217547183)
     :param lat: float lat of center (ex. 40.6046338643702)
     :param size: return size of results
-    :return: List[Dict]
+    :return: Dict
     """
     query = {
         "size": size,
@@ -165,11 +347,27 @@ def get_nearest_cities(lon, lat, size=5):
             }
         }
     }
+    return query
 
-    index = app.config['GEONAMES_INDEX']  # query for results
+
+def get_nearest_cities(lon, lat, size=5):
+    """
+    :param lon: float lon of center (ex. -122.61067217547183)
+    :param lat: float lat of center (ex. 40.6046338643702)
+    :param size: return size of results
+    :return: List[Dict]
+    """
+    geocoder = get_local_geocoder()
+    if geocoder is not None:
+        return geocoder.get_nearest_cities(lon, lat, size=size)
+
+    query = nearest_cities_query(lon, lat, size=size)
+
+    index = get_cities_index()  # query for results
     try:
         res = grq_es.search(index=index, body=query)
-        app.logger.debug("get_continents(): %s" % json.dumps(query))
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("get_continents(): %s" % json.dumps(query))
 
         results = []
         for hit in res['hits']['hits']:
@@ -183,6 +381,44 @@ def get_nearest_cities(lon, lat, size=5):
         raise Exception(e)
 
 
+def continents_query(lon, lat):
+    """
+    query DSL for get_continents()
+    :param lon: float lon of center (ex. -122.61067217547183)
+    :param lat: float lat of center (ex. 40.6046338643702)
+    :return: Dict
+    """
+    # build query DSL
+    query = {
+        "sort": [
+            {
+                "_geo_distance": {
+                    "location": [lon, lat],
+                    "order": "asc",
+                    "unit": "km"
+                }
+            }
+        ],
+        "query": {
+            "bool": {
+                "filter": [
+                    {
+                        "term": {
+                            "feature_class": "L"
+                        }
+                    },
+                    {
+                        "term": {
+                            "feature_code": "CONT"
+                        }
+                    }
+                ]
+            }
+        }
+    }
+    return query
+
+
 def get_continents(lon, lat):
     """
     Spatial search of closest continents to the specified geo point.
@@ -218,40 +454,17 @@ def get_continents(lon, lat):
       }
     }
     """
+    geocoder = get_local_geocoder()
+    if geocoder is not None:
+        return geocoder.get_continents(lon, lat)
 
-    # build query DSL
-    query = {
-        "sort": [
-            {
-                "_geo_distance": {
-                    "location": [lon, lat],
-                    "order": "asc",
-                    "unit": "km"
-                }
-            }
-        ],
-        "query": {
-            "bool": {
-                "filter": [
-                    {
-                        "term": {
-                            "feature_class": "L"
-                        }
-                    },
-                    {
-                        "term": {
-                            "feature_code": "CONT"
-                        }
-                    }
-                ]
-            }
-        }
-    }
+    query = continents_query(lon, lat)
 
     index = app.config['GEONAMES_INDEX']  # query for results
     try:
         res = grq_es.search(index=index, body=query)
-        app.logger.debug("get_continents(): %s" % json.dumps(query))
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("get_continents(): %s" % json.dumps(query))
 
         results = []
         for hit in res['hits']['hits']:
@@ -263,3 +476,120 @@ def get_continents(lon, lat):
         return None
     except Exception as e:
         raise e
+
+
+QUERY_BUILDERS = {
+    'get_cities': cities_query,
+    'get_nearest_cities': nearest_cities_query,
+    'get_continents': continents_query,
+}
+
+CITIES_LOOKUPS = ('get_cities', 'get_nearest_cities')  # sent to get_cities_index()
+
+
+def batch_lookup(lookups):
+    """
+    runs many geonames lookups at once, using chunked multi-search requests (GEONAMES_MSEARCH_CHUNK searches each)
+    instead of 1 search per lookup, results are the same as calling the functions one by one
+    :param lookups: List[Tuple[str, Tuple]]; (function name, args), ex. ("get_continents", (lon, lat))
+    :return: List[List[Dict]]; results in the same order as lookups (None if the geonames index is not found)
+    """
+    geocoder = get_local_geocoder()
+    if geocoder is not None:
+        results = offload_lookups(lookups)  # GEOMETRY_WORKERS processes, if enabled
+        if results is not None:
+            return results
+        return [getattr(geocoder, name)(*args) for name, args in lookups]
+
+    index = app.config['GEONAMES_INDEX']
+    cities_index = get_cities_index()
+    chunk_size = int(app.config.get('GEONAMES_MSEARCH_CHUNK', 500))
+
+    results = []
+    for i in range(0, len(lookups), chunk_size):
+        body = []
+        for name, args in lookups[i:i + chunk_size]:
+            body.append({"index": cities_index if name in CITIES_LOOKUPS else index})
+            body.append(QUERY_BUILDERS[name](*args))
+
+        try:
+            res = grq_es.es.msearch(body=body)
+        except (elasticsearch.exceptions.NotFoundError, opensearchpy.exceptions.NotFoundError):
+            results.extend([None] * (len(body) // 2))
+            continue
+        app.logger.debug("batch_lookup(): %d searches" % (len(body) // 2))
+
+        for resp in res['responses']:
+            if 'error' in resp:
+                if resp.get('status') == 404:
+                    results.append(None)
+                    continue
+                raise Exception(resp['error'])
+            results.append([hit['_source'] for hit in resp['hits']['hits']])
+    return results
+
+
+def load_continents():
+    """
+    geonames continents (feature_class: L, feature_code: CONT), from the geonames snapshot or index
+    :return: List[Dict]
+    """
+    geocoder = get_local_geocoder()
+    if geocoder is not None:
+        return geocoder.continents
+
+    query = continents_query(0., 0.)
+    del query['sort']
+    query['size'] = 100
+    res = grq_es.search(index=app.config['GEONAMES_INDEX'], body=query)
+    return [hit['_source'] for hit in res['hits']['hits']]
+
+
+def get_continent_resolver():
+    """
+    in-memory continent resolver (CONTINENT_RESOLVER), the continents are loaded once per process from the geonames
+    snapshot (or index), with the optional CONTINENT_OUTLINES GeoJSON for point in polygon classification
+        if the continents can't be loaded, get_continents() is used for the next CONTINENT_RESOLVER_RETRY seconds
+        before trying again
+    :return: ContinentResolver, None if disabled or the continents can't be loaded (get_continents() is used instead)
+    """
+    global _continent_resolver, _continent_resolver_retry_at
+
+    if _continent_resolver is not None or app.config.get('CONTINENT_RESOLVER', False) is not True:
+        return _continent_resolver
+    if time.time() < _continent_resolver_retry_at:
+        return None
+
+    retry = float(app.config.get('CONTINENT_RESOLVER_RETRY', 300))
+    try:
+        continents = load_continents()
+        if not continents:
+            app.logger.warning("no continents found in geonames, using get_continents() for %ds" % retry)
+            _continent_resolver_retry_at = time.time() + retry
+            return None
+
+        outlines = None
+        outlines_file = app.config.get('CONTINENT_OUTLINES', None)
+        if outlines_file:
+            outlines = ContinentResolver.load_outlines(outlines_file)
+        _continent_resolver = ContinentResolver(continents, outlines=outlines)
+        app.logger.info("loaded %d continents (%d outlines)" % (len(continents), len(outlines or [])))
+    except Exception as e:
+        _continent_resolver_retry_at = time.time() + retry
+        app.logger.error("unable to load continents, using get_continents() for %ds: %s\n%s" %
+                         (retry, str(e), traceback.format_exc()))
+    return _continent_resolver
+
+
+def get_continent(lon, lat):
+    """
+    :param lon: float lon of center (ex. -122.61067217547183)
+    :param lat: float lat of center (ex. 40.6046338643702)
+    :return: str, name of the dataset's continent (None if not found)
+    """
+    resolver = get_continent_resolver()
+    if resolver is not None:
+        return resolver.resolve(lon, lat)
+
+    continents = get_continents(lon, lat)
+    return continents[0]['name'] if continents else None
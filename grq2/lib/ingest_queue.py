@@ -0,0 +1,317 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import os
+import copy
+import time
+import uuid
+import threading
+import traceback
+
+from redis import Redis
+
+from grq2 import app
+from grq2.lib import codec
+
+
+QUEUED = 'queued'
+PROCESSING = 'processing'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def new_ticket():
+    return uuid.uuid4().hex
+
+
+class RedisIngestQueue:
+    """
+    ingest queue stored in redis (shared by every GRQ worker/host using the same REDIS_URL)
+        payloads are moved from the queue list into a processing list (along with their claim time, in a single script
+        so no other worker sees a claimed payload without it) and removed once indexed, claims older than the
+        visibility timeout (ie. the worker died) are put back in the queue by recover()
+    """
+
+    # RPOPLPUSH + claim time of the payload's ticket, atomically
+    CLAIM_SCRIPT = """
+local raw = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+if raw then
+    redis.call('HSET', KEYS[3], cjson.decode(raw)['ticket'], ARGV[1])
+end
+return raw
+"""
+
+    def __init__(self, redis_url, name='grq_ingest', status_ttl=7 * 86400):
+        self.redis = Redis.from_url(redis_url)
+        self.status_ttl = status_ttl
+        self.queue_key = '{}:queue'.format(name)
+        self.processing_key = '{}:processing'.format(name)
+        self.claims_key = '{}:claims'.format(name)
+        self.status_prefix = '{}:status:'.format(name)
+        self._claim = self.redis.register_script(self.CLAIM_SCRIPT)
+
+    def put(self, datasets):
+        """
+        :param datasets: List[Dict]
+        :return: str, ticket id
+        """
+        ticket = new_ticket()
+        self.set_status(ticket, {'state': QUEUED, 'count': len(datasets)})
+        self.redis.lpush(self.queue_key, codec.dumpb({'ticket': ticket, 'datasets': datasets}))
+        return ticket
+
+    def _claim_one(self):
+        return self._claim(keys=[self.queue_key, self.processing_key, self.claims_key], args=[time.time()])
+
+    def claim(self, max_payloads, max_docs, timeout=1.):
+        """
+        :param max_payloads: int, max number of payloads claimed
+        :param max_docs: int, stops claiming once this many datasets are claimed
+        :param timeout: float, seconds to wait if the queue is empty
+        :return: List[Tuple[any, Dict]]; (handle for ack(), payload)
+        """
+        entries = []
+        docs = 0
+        raw = self._claim_one()
+        while raw is not None:
+            entry = codec.loads(raw)
+            entries.append((raw, entry))
+            docs += len(entry['datasets'])
+            if len(entries) >= max_payloads or docs >= max_docs:
+                break
+            raw = self._claim_one()
+
+        if not entries:
+            time.sleep(timeout)
+        return entries
+
+    def ack(self, handle, entry):
+        self.redis.lrem(self.processing_key, 1, handle)
+        self.redis.hdel(self.claims_key, entry['ticket'])
+
+    def recover(self, visibility_timeout):
+        """
+        puts payloads claimed more than visibility_timeout seconds ago back in the queue
+            a payload without a claim time (ie. claimed by a worker running an older version) is considered just
+            claimed, its claim time is recorded and it is re-queued if it's still there after visibility_timeout
+        """
+        now = time.time()
+        tickets = set()
+        for raw in self.redis.lrange(self.processing_key, 0, -1):
+            ticket = codec.loads(raw)['ticket']
+            tickets.add(ticket)
+            claimed_at = self.redis.hget(self.claims_key, ticket)
+            if claimed_at is None:
+                self.redis.hsetnx(self.claims_key, ticket, now)
+                continue
+            if now - float(claimed_at) < visibility_timeout:
+                continue
+            if self.redis.lrem(self.processing_key, 1, raw) == 1:  # another worker may have recovered it already
+                self.redis.rpush(self.queue_key, raw)
+                self.redis.hdel(self.claims_key, ticket)
+                app.logger.warning("re-queued stale ingest ticket %s" % ticket)
+
+        # claim times left behind by a payload acked while recover() was running
+        for ticket, claimed_at in self.redis.hgetall(self.claims_key).items():
+            if ticket.decode() not in tickets and now - float(claimed_at) >= visibility_timeout:
+                self.redis.hdel(self.claims_key, ticket)
+
+    def set_status(self, ticket, status):
+        self.redis.set(self.status_prefix + ticket, codec.dumpb(status), ex=self.status_ttl)
+
+    def get_status(self, ticket):
+        raw = self.redis.get(self.status_prefix + ticket)
+        return codec.loads(raw) if raw is not None else None
+
+
+class SpoolIngestQueue:
+    """
+    ingest queue stored as files in a local directory (shared by the GRQ workers of the host)
+        payloads are claimed by atomically renaming them from queue/ to processing/ (their mtime is the claim time)
+        and deleted once indexed
+    """
+
+    def __init__(self, directory, status_ttl=7 * 86400):
+        self.status_ttl = status_ttl
+        self.queue_dir = os.path.join(directory, 'queue')
+        self.processing_dir = os.path.join(directory, 'processing')
+        self.status_dir = os.path.join(directory, 'status')
+        for d in (self.queue_dir, self.processing_dir, self.status_dir):
+            os.makedirs(d, exist_ok=True)
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(codec.dumps(data))
+        os.replace(tmp_path, path)
+
+    def put(self, datasets):
+        ticket = new_ticket()
+        self.set_status(ticket, {'state': QUEUED, 'count': len(datasets)})
+        file_name = '{:020d}_{}.json'.format(time.time_ns(), ticket)  # sorts in FIFO order
+        self._write(os.path.join(self.queue_dir, file_name), {'ticket': ticket, 'datasets': datasets})
+        return ticket
+
+    def claim(self, max_payloads, max_docs, timeout=1.):
+        entries = []
+        docs = 0
+        for file_name in sorted(f for f in os.listdir(self.queue_dir) if f.endswith('.json')):
+            queued_path = os.path.join(self.queue_dir, file_name)
+            path = os.path.join(self.processing_dir, file_name)
+            try:
+                # claim time (used by recover()) set before the move, a claimed payload is never seen as stale
+                os.utime(queued_path)
+                os.rename(queued_path, path)
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            with open(path) as f:
+                entry = codec.loads(f.read())
+            entries.append((path, entry))
+            docs += len(entry['datasets'])
+            if len(entries) >= max_payloads or docs >= max_docs:
+                break
+
+        if not entries:
+            time.sleep(timeout)
+        return entries
+
+    def ack(self, handle, entry):
+        os.remove(handle)
+
+    def recover(self, visibility_timeout):
+        now = time.time()
+        for file_name in os.listdir(self.processing_dir):
+            path = os.path.join(self.processing_dir, file_name)
+            try:
+                if now - os.path.getmtime(path) >= visibility_timeout:
+                    os.rename(path, os.path.join(self.queue_dir, file_name))
+                    app.logger.warning("re-queued stale ingest payload %s" % file_name)
+            except FileNotFoundError:
+                continue
+        for file_name in os.listdir(self.status_dir):
+            path = os.path.join(self.status_dir, file_name)
+            try:
+                if now - os.path.getmtime(path) >= self.status_ttl:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+
+    def set_status(self, ticket, status):
+        self._write(os.path.join(self.status_dir, '{}.json'.format(ticket)), status)
+
+    def get_status(self, ticket):
+        if not all(c in '0123456789abcdef' for c in ticket):
+            return None
+        try:
+            with open(os.path.join(self.status_dir, '{}.json'.format(ticket))) as f:
+                return codec.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+
+def create_ingest_queue(config):
+    """
+    :param config: Dict; app config
+    :return: RedisIngestQueue|SpoolIngestQueue
+    """
+    status_ttl = int(config.get('ASYNC_INGEST_STATUS_TTL', 7 * 86400))
+    if config.get('ASYNC_INGEST_QUEUE', 'redis') == 'spool':
+        return SpoolIngestQueue(config['ASYNC_INGEST_SPOOL_DIR'], status_ttl=status_ttl)
+    return RedisIngestQueue(config['REDIS_URL'], name='{}_ingest'.format(config['GRQ_INDEX']), status_ttl=status_ttl)
+
+
+class IngestWriter(threading.Thread):
+    """
+    background writer draining the ingest queue, payloads from many requests are coalesced into the same bulk requests
+    """
+
+    def __init__(self, queue, process, max_docs=5000, max_payloads=100, poll_interval=1., visibility_timeout=600):
+        """
+        :param queue: RedisIngestQueue|SpoolIngestQueue
+        :param process: function(List[Dict]) -> Tuple[int, List[Dict]]; indexes datasets, returns (number of documents
+                        written, failed bulk items)
+        :param max_docs: int, max datasets coalesced per batch
+        :param max_payloads: int, max payloads coalesced per batch
+        :param poll_interval: float, seconds
+        :param visibility_timeout: int, seconds after which a claimed (but not finished) payload is re-queued
+        """
+        super().__init__(name='grq-ingest-writer', daemon=True)
+        self.queue = queue
+        self.process = process
+        self.max_docs = max_docs
+        self.max_payloads = max_payloads
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        last_recover = 0
+        while not self._stop_event.is_set():
+            try:
+                if time.time() - last_recover >= self.visibility_timeout / 2:
+                    self.queue.recover(self.visibility_timeout)
+                    last_recover = time.time()
+                self.drain_once()
+            except Exception as e:
+                app.logger.error("ingest writer error: %s\n%s" % (str(e), traceback.format_exc()))
+                time.sleep(self.poll_interval)
+
+    def drain_once(self):
+        """
+        claims a batch of payloads and indexes them
+        :return: int, number of payloads processed
+        """
+        entries = self.queue.claim(self.max_payloads, self.max_docs, timeout=self.poll_interval)
+        if not entries:
+            return 0
+
+        for _, entry in entries:
+            self.queue.set_status(entry['ticket'], {'state': PROCESSING, 'count': len(entry['datasets'])})
+
+        try:
+            self._index(entries)
+        except Exception as e:
+            if len(entries) == 1:
+                self._finish(entries[0], {'state': FAILED, 'message': f"{type(e)}:{e}\n{traceback.format_exc()}"})
+            else:  # isolates the bad payload(s) from the rest of the batch
+                app.logger.warning("coalesced ingest batch failed, indexing %d payloads separately" % len(entries))
+                for entry in entries:
+                    try:
+                        self._index([entry])
+                    except Exception as e:
+                        self._finish(entry, {'state': FAILED, 'message': f"{type(e)}:{e}\n{traceback.format_exc()}"})
+        return len(entries)
+
+    def _index(self, entries):
+        datasets = []
+        tickets = {}
+        for _, entry in entries:
+            for ds in entry['datasets']:
+                tickets[ds.get('id')] = entry['ticket']
+            datasets.extend(copy.deepcopy(entry['datasets']))  # payload stays intact if the batch is retried
+
+        _, failed = self.process(datasets)
+
+        failed_by_ticket = {}
+        for item in failed:
+            doc_info = next(iter(item.values()))
+            failed_by_ticket.setdefault(tickets.get(doc_info.get('_id')), []).append(item)
+
+        for entry in entries:
+            ticket_failed = failed_by_ticket.get(entry[1]['ticket'], [])
+            count = len(entry[1]['datasets'])
+            self._finish(entry, {
+                'state': FAILED if ticket_failed else SUCCEEDED,
+                'count': count,
+                'indexed': count - len(ticket_failed),
+                'message': ticket_failed if ticket_failed else "successfully indexed %d documents" % count,
+            })
+
+    def _finish(self, entry, status):
+        handle, payload = entry
+        self.queue.set_status(payload['ticket'], status)
+        self.queue.ack(handle, payload)
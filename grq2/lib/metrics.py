@@ -0,0 +1,236 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+
+MIXED = 'mixed'  # label value of a batch holding several dataset types/indices
+
+METRICS = {
+    'grq_ingest_stage_seconds': ('summary', "time spent per ingest stage"),
+    'grq_ingest_requests_total': ('counter', "dataset index requests"),
+    'grq_ingest_docs_total': ('counter', "datasets sent to Elasticsearch"),
+    'grq_ingest_bytes_total': ('counter', "bytes of the bulk request bodies"),
+    'grq_ingest_chunks_total': ('counter', "bulk requests sent"),
+    'grq_ingest_errors_total': ('counter', "datasets which failed to index"),
+    'grq_ingest_rollbacks_total': ('counter', "requests rolled back"),
+    'grq_footprint_cache_hits_total': ('counter', "dataset footprints found in the footprint cache"),
+    'grq_footprint_cache_misses_total': ('counter', "dataset footprints reverse geolocated (not cached)"),
+}
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Ingest metrics (counters and per stage timers) rendered in the Prometheus text format
+        labels set with context() (ie. the dataset type and index of the request) are added to every sample recorded
+        by the same thread/greenlet, every call is a no-op when disabled
+        the samples are recorded in process, with share() each worker process also writes its totals to a directory
+        shared by the workers of the host and render() sums the totals of every worker (same as the multiprocess mode
+        of prometheus_client), otherwise render() only has the samples of the process serving the scrape
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._values = {}  # (name, labels) -> float
+        self._summaries = {}  # (name, labels) -> [count, sum]
+        self._local = threading.local()
+        self.directory = None
+        self._path = None
+        self._flusher = None
+        self._flush_lock = threading.Lock()
+
+    def _labels(self, labels):
+        context = getattr(self._local, 'labels', None)
+        if context:
+            labels = {**context, **labels}
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @contextmanager
+    def context(self, **labels):
+        """labels added to the samples recorded within the block"""
+        if not self.enabled:
+            yield
+            return
+
+        previous = getattr(self._local, 'labels', None)
+        self._local.labels = {**(previous or {}), **labels}
+        try:
+            yield
+        finally:
+            self._local.labels = previous
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, self._labels(labels))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = [0, 0.]
+            summary[0] += 1
+            summary[1] += value
+
+    def timer(self, stage, **labels):
+        """
+        times a block into grq_ingest_stage_seconds{stage=...}
+        :param stage: str; ex. parse, geometry, geonames, serialize, bulk
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(stage, labels)
+
+    @contextmanager
+    def _timer(self, stage, labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('grq_ingest_stage_seconds', time.perf_counter() - t0, stage=stage, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+            self._summaries = {}
+
+    def share(self, directory, interval=5.):
+        """
+        writes the totals of this process to directory every interval seconds (and before rendering), render() then
+        returns the totals of every process writing to directory
+            the files of the workers which exited are kept so the counters don't go backwards, empty the directory
+            when GRQ is restarted
+        :param directory: str, directory shared by the worker processes (ie. on tmpfs)
+        :param interval: float, seconds
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # a restarted worker may get the pid of an exited one, the uuid keeps their files apart
+        self._path = os.path.join(directory, 'metrics_%d_%s.json' % (os.getpid(), uuid.uuid4().hex))
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, args=(interval,), name='grq-metrics-flusher',
+                                             daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.getLogger('grq2').warning("unable to write the metrics to %s: %s" % (self.directory, str(e)))
+
+    def flush(self):
+        """writes the totals of this process to the shared directory (see share())"""
+        if self._path is None:
+            return
+        with self._lock:
+            data = {
+                'values': [[name, labels, value] for (name, labels), value in self._values.items()],
+                'summaries': [[name, labels, c, total] for (name, labels), (c, total) in self._summaries.items()],
+            }
+        with self._flush_lock:  # flusher thread & scrapes
+            tmp_path = '%s.tmp' % self._path
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path)
+
+    def _collect(self):
+        """
+        :return: Tuple[Dict, Dict]; values & summaries of this process, or of every process sharing the directory
+        """
+        if self.directory is None:
+            with self._lock:
+                return dict(self._values), {k: list(v) for k, v in self._summaries.items()}
+
+        self.flush()
+        values = {}
+        summaries = {}
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced
+            for name, labels, value in data['values']:
+                key = (name, tuple(tuple(label) for label in labels))
+                values[key] = values.get(key, 0) + value
+            for name, labels, count, total in data['summaries']:
+                summary = summaries.setdefault((name, tuple(tuple(label) for label in labels)), [0, 0.])
+                summary[0] += count
+                summary[1] += total
+        return values, summaries
+
+    def render(self):
+        """
+        :return: str, Prometheus text exposition format (0.0.4)
+        """
+        values, summaries = self._collect()
+
+        lines = []
+        for name, (metric_type, description) in METRICS.items():
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            for (n, labels), value in sorted(values.items()):
+                if n == name:
+                    lines.append('%s%s %s' % (name, _format_labels(labels), _format_value(value)))
+            for (n, labels), (count, total) in sorted(summaries.items()):
+                if n == name:
+                    lines.append('%s_count%s %d' % (name, _format_labels(labels), count))
+                    lines.append('%s_sum%s %s' % (name, _format_labels(labels), _format_value(total)))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in labels)
+    return '{%s}' % ','.join('%s="%s"' % (k, v) for (k, _), v in zip(labels, escaped))
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def batch_labels(pairs):
+    """
+    :param pairs: Iterable[Tuple[str, str]]; (dataset type, index) of the datasets of a batch
+    :return: Dict; dataset & index labels, "mixed" if the batch has several
+    """
+    datasets = set()
+    indices = set()
+    for dataset, index in pairs:
+        datasets.add(dataset)
+        indices.add(index)
+    return {
+        'dataset': datasets.pop() if len(datasets) == 1 else MIXED,
+        'index': indices.pop() if len(indices) == 1 else MIXED,
+    }
+
+
+metrics = Metrics()
@@ -0,0 +1,237 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import os
+import queue
+import runpy
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import shapely
+
+from grq2 import app
+from grq2.lib.geometry import RAGGED_TYPES, normalize_geojson_type, ragged_array, geometry_infos, prepare_geometries
+from grq2.lib import offload_worker
+
+try:
+    from eventlet.hubs import trampoline
+    from eventlet.patcher import is_monkey_patched
+except ImportError:
+    trampoline = None
+
+
+'''
+process pool for the CPU bound part of the ingest (geometry centroids/envelopes and in-process geocoding), so green
+workers (eventlet) keep serving requests while a batch is being enriched
+
+the geometries are shipped to the worker processes as flat coordinate arrays (see grq2.lib.geometry.ragged_array)
+instead of GEOJson dicts, and the results come back as a single (n, 6) array per chunk
+
+the worker processes run grq2/lib/offload_worker.py, which loads only the geometry and geocoder modules (not the flask
+app) and the geonames snapshot given by path
+'''
+
+
+class WorkerError(Exception):
+    """exception raised by a task in a worker process (or the worker died)"""
+
+
+# request handling side
+
+def _wait_readable(conn):
+    """waits for a result without blocking the eventlet hub (other green threads keep running)"""
+    if trampoline is not None and is_monkey_patched('socket'):
+        trampoline(conn.fileno(), read=True)
+
+
+class ProcessPool:
+    """
+    fixed size pool of worker processes, 1 task at a time per worker over a pipe
+        callers wait on the pipe (cooperatively under eventlet), a dead worker is replaced on next use
+    :param workers: int, number of worker processes
+    :param start_method: str; spawn|forkserver|fork, spawn avoids inheriting the eventlet hub of the parent
+    :param snapshot: str, geonames snapshot loaded by each worker (in-process geocoding, see GEONAMES_SNAPSHOT)
+    """
+
+    def __init__(self, workers, start_method='spawn', snapshot=None):
+        self.workers = workers
+        self.snapshot = snapshot
+        self._context = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._processes = {}
+        for _ in range(workers):
+            self._idle.put(self._start())
+
+    def _start(self):
+        conn, child_conn = self._context.Pipe()
+        worker_globals = {'worker_conn': child_conn, 'worker_snapshot': self.snapshot}
+        process = self._context.Process(target=runpy.run_path, args=(os.path.abspath(offload_worker.__file__),),
+                                        kwargs={'init_globals': worker_globals, 'run_name': offload_worker.RUN_NAME},
+                                        daemon=True)
+        process.start()
+        child_conn.close()
+        self._processes[conn] = process
+        return conn
+
+    def _acquire(self):
+        """
+        idle worker, the ones dropped by _discard() are started again here
+        :return: multiprocessing Connection
+        """
+        conn = self._idle.get()
+        if conn is None:
+            try:
+                conn = self._start()
+            except Exception as e:
+                self._idle.put(None)
+                raise WorkerError("unable to start a worker process: %s" % str(e))
+        return conn
+
+    def _discard(self, conn):
+        process = self._processes.pop(conn, None)
+        conn.close()
+        if process is not None and process.is_alive():
+            process.terminate()
+
+    def call(self, name, *args):
+        """
+        runs a task in a worker process
+        :param name: str; geometry|geocode
+        :param args: task arguments (pickled)
+        :return: task result
+        """
+        conn = self._acquire()
+        try:
+            conn.send((name, args))
+            _wait_readable(conn)
+            ok, result = conn.recv()
+        except (EOFError, OSError) as e:
+            self._discard(conn)
+            conn = None  # the worker's slot, started again on next use
+            raise WorkerError("worker process lost: %s" % str(e))
+        finally:
+            self._idle.put(conn)
+
+        if not ok:
+            raise WorkerError(result)
+        return result
+
+    def map(self, name, args_list):
+        """
+        runs many tasks at once, at most 1 per worker process
+        :param name: str; geometry|geocode
+        :param args_list: List[Tuple]; arguments of each task
+        :return: List; results in the same order as args_list
+        """
+        if len(args_list) == 1:
+            return [self.call(name, *args_list[0])]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(args_list)))) as executor:
+            return list(executor.map(lambda args: self.call(name, *args), args_list))
+
+    def close(self):
+        for conn, process in self._processes.items():
+            try:
+                conn.send(None)
+            except (EOFError, OSError):
+                pass
+            conn.close()
+            process.join(timeout=5)
+        self._processes = {}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """
+    process pool of the current GRQ worker (GEOMETRY_WORKERS processes), started on first use
+    :return: ProcessPool, None if disabled or it couldn't be started (the work is done in-process)
+    """
+    global _pool
+
+    workers = int(app.config.get('GEOMETRY_WORKERS', 0) or 0)
+    if workers <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            start_method = app.config.get('GEOMETRY_WORKERS_START_METHOD', 'spawn')
+            snapshot = app.config.get('GEONAMES_SNAPSHOT', None)
+            try:
+                _pool = ProcessPool(workers, start_method=start_method, snapshot=snapshot)
+                app.logger.info("started %d geometry worker processes (%s)" % (workers, start_method))
+            except Exception as e:
+                app.logger.error("unable to start the geometry worker processes, running in-process: %s\n%s" %
+                                 (str(e), traceback.format_exc()))
+                _pool = False
+    return _pool or None
+
+
+def _chunks(seq, size):
+    return [seq[i:i + size] for i in range(0, len(seq), size)]
+
+
+def offload_geometries(locations):
+    """
+    same as grq2.lib.geometry.prepare_geometries(), computed in the worker processes for large enough batches
+    (GEOMETRY_OFFLOAD_MIN_BATCH geometries, split in chunks of GEOMETRY_OFFLOAD_CHUNK)
+    :param locations: List[Dict]; GEOJson geometries (dataset's location)
+    :return: List[GeometryInfo]
+    """
+    pool = get_process_pool()
+    if (pool is None or not hasattr(shapely, 'from_ragged_array') or
+            len(locations) < int(app.config.get('GEOMETRY_OFFLOAD_MIN_BATCH', 64))):
+        return prepare_geometries(locations)
+
+    chunk_size = int(app.config.get('GEOMETRY_OFFLOAD_CHUNK', 1000))
+    tasks = []  # (geo_type, positions, (type_code, coords, offsets))
+    local = []  # geometries which can't be flattened, shape() reports the error (same as prepare_geometries())
+    by_type = {}
+    for i, loc in enumerate(locations):
+        geo_type = normalize_geojson_type(loc['type'])
+        if geo_type is not None:
+            by_type.setdefault(geo_type, []).append(i)
+    for geo_type, positions in by_type.items():
+        for chunk in _chunks(positions, chunk_size):
+            try:
+                coords, offsets = ragged_array(geo_type, [locations[i]['coordinates'] for i in chunk])
+            except Exception:
+                local.extend(chunk)
+                continue
+            tasks.append((geo_type, chunk, (RAGGED_TYPES[geo_type], coords, offsets)))
+
+    results = [None] * len(locations)
+    try:
+        measures = pool.map('geometry', [args for _, _, args in tasks])
+    except WorkerError as e:
+        app.logger.warning("geometry worker failed, running in-process: %s" % str(e))
+        return prepare_geometries(locations)
+
+    for (geo_type, positions, _), chunk_measures in zip(tasks, measures):
+        for i, info in zip(positions, geometry_infos(geo_type, chunk_measures)):
+            results[i] = info
+    for i, info in zip(local, prepare_geometries([locations[i] for i in local])):
+        results[i] = info
+    return results
+
+
+def offload_lookups(lookups):
+    """
+    runs local geocoder lookups (see grq2.lib.geonames.batch_lookup()) in the worker processes
+    :param lookups: List[Tuple[str, Tuple]]; (function name, args)
+    :return: List[List[Dict]], None if the lookups should run in-process (pool disabled, batch too small or failed)
+    """
+    pool = get_process_pool()
+    if pool is None or not pool.snapshot or len(lookups) < int(app.config.get('GEOMETRY_OFFLOAD_MIN_BATCH', 64)):
+        return None
+
+    chunk_size = int(app.config.get('GEOMETRY_OFFLOAD_CHUNK', 1000))
+    try:
+        results = pool.map('geocode', [(chunk,) for chunk in _chunks(lookups, chunk_size)])
+    except WorkerError as e:
+        app.logger.warning("geocoding worker failed, running in-process: %s" % str(e))
+        return None
+    return [r for chunk in results for r in chunk]
@@ -0,0 +1,82 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import os
+import traceback
+import importlib.util
+
+
+'''
+worker process side of grq2.lib.offload
+
+the worker processes run this file with runpy.run_path() (see grq2.lib.offload.ProcessPool) instead of importing it,
+a spawned process importing grq2.lib.* would import the grq2 package first, ie. create the flask app, read settings.cfg
+and connect to the GRQ and Mozart ES; only the geometry and geocoder modules are loaded (by path) in the workers
+'''
+
+RUN_NAME = '__grq2_offload_worker__'
+
+
+def _load_module(name):
+    """
+    loads a module of grq2/lib without importing the grq2 package
+    :param name: str; module name (ie. geometry)
+    :return: module
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '%s.py' % name)
+    spec = importlib.util.spec_from_file_location('grq2_offload_worker.%s' % name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Tasks:
+    """
+    tasks run by a worker process
+    :param snapshot: str, path to the geonames snapshot loaded for the geocode tasks (None to skip)
+    """
+
+    def __init__(self, snapshot=None):
+        self._geometry = _load_module('geometry')
+        self._geocoder = None
+        if snapshot:
+            try:
+                self._geocoder = _load_module('geocoder').LocalGeocoder.from_snapshot(snapshot)
+            except Exception:
+                traceback.print_exc()
+
+    def geometry(self, type_code, coords, offsets):
+        return self._geometry.measure_geometries(type_code, coords, offsets)
+
+    def geocode(self, lookups):
+        if self._geocoder is None:
+            raise RuntimeError("no geonames snapshot loaded in the worker")
+        return [getattr(self._geocoder, name)(*args) for name, args in lookups]
+
+
+def worker_main(conn, snapshot):
+    """
+    worker process loop, runs the tasks received on conn until it is closed
+    :param conn: multiprocessing Connection
+    :param snapshot: str, path to the geonames snapshot loaded for the geocode tasks (None to skip)
+    """
+    tasks = Tasks(snapshot)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        name, args = message
+        try:
+            conn.send((True, getattr(tasks, name)(*args)))
+        except Exception as e:
+            conn.send((False, "%s: %s\n%s" % (type(e).__name__, str(e), traceback.format_exc())))
+    conn.close()
+
+
+if __name__ == RUN_NAME:
+    worker_main(worker_conn, worker_snapshot)  # noqa: F821, set by runpy.run_path(init_globals=...)
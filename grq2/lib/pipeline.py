@@ -0,0 +1,325 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import time
+import threading
+import traceback
+
+from grq2 import app, grq_es
+from grq2.lib.geocoder import EARTH_RADIUS_KM, NEAREST_CITIES_DISTANCE_KM
+
+
+DEFAULT_PIPELINE = 'dataset_enrich_pipeline'
+
+# same rules as grq2.lib.time_utils.getTemporalSpanInDays:
+#     YYYY-MM-DD[T ]HH:MM:SS[.ffffff][Z] or YYYY-MM-DD ('/' accepted as date separator)
+#     whole days between starttime & endtime, +1 if the remainder is >= 12 hours
+TEMPORAL_SPAN_SCRIPT = """
+LocalDateTime parseTime(String s) {
+    if (s.endsWith('Z')) {
+        s = s.substring(0, s.length() - 1);
+    }
+    if (s.length() == 10) {
+        s = s + 'T00:00:00';
+    }
+    if (s.length() < 19) {
+        throw new IllegalArgumentException('Failed to recognize date format: ' + s);
+    }
+    if (s.length() > 29) {
+        s = s.substring(0, 29);  // fractional seconds are ignored, LocalDateTime parses at most 9 digits
+    }
+    return LocalDateTime.parse(s.substring(0, 10).replace('/', '-') + 'T' + s.substring(11));
+}
+
+if (ctx.starttime instanceof String && ctx.endtime instanceof String) {
+    LocalDateTime start = parseTime(ctx.starttime);
+    LocalDateTime end = parseTime(ctx.endtime);
+    long diff = Math.abs(end.toEpochSecond(ZoneOffset.UTC) - start.toEpochSecond(ZoneOffset.UTC));
+    long span = diff / 86400;
+    if (diff % 86400 >= 43200) {
+        span += 1;
+    }
+    ctx.temporal_span = span;
+
+    if (params.date_parts) {
+        ctx.date_parts = [
+            'year': start.getYear(),
+            'month': start.getMonthValue(),
+            'day': start.getDayOfMonth(),
+            'day_of_year': start.getDayOfYear()
+        ];
+    }
+}
+"""
+
+GEO_MATCH_FIELD = '_grq_geo_match'  # temporary fields used by the reverse geocoding processors
+GEO_MATCHES_FIELD = '_grq_cities'
+ENRICH_SHAPE_FIELD = 'shape'  # geo_shape field of the enrich source index (see scripts/geonames/enrich_policy.py)
+ENRICH_MAX_MATCHES = 128  # max allowed by the enrich processor (geo_match matches beyond it are dropped)
+
+HAVERSINE_FUNCTION = """
+double haversine(double lon1, double lat1, double lon2, double lat2, double radius) {
+    double phi1 = Math.toRadians(lat1);
+    double phi2 = Math.toRadians(lat2);
+    double dPhi = phi2 - phi1;
+    double dLambda = Math.toRadians(lon2 - lon1);
+    double h = Math.pow(Math.sin(dPhi / 2), 2) + Math.cos(phi1) * Math.cos(phi2) * Math.pow(Math.sin(dLambda / 2), 2);
+    return 2 * radius * Math.asin(Math.min(1.0, Math.sqrt(h)));
+}
+
+boolean isPolygon(def location) {
+    if (!(location instanceof Map) || !(location.type instanceof String)) {
+        return false;
+    }
+    String type = location.type.toLowerCase();
+    return type == 'polygon' || type == 'multipolygon';
+}
+"""
+
+# shape matched against the cities of the enrich index: the dataset's (multi)polygon, or a circle of
+# params.distance km around its center for the other types (nearest cities)
+GEO_MATCH_SCRIPT = HAVERSINE_FUNCTION + """
+if (ctx.location != null && isPolygon(ctx.location)) {
+    ctx[params.match_field] = ctx.location;
+} else if (ctx.location != null && ctx.center instanceof Map && ctx.center.coordinates instanceof List) {
+    double phi1 = Math.toRadians(((Number) ctx.center.coordinates[1]).doubleValue());
+    double lambda1 = Math.toRadians(((Number) ctx.center.coordinates[0]).doubleValue());
+    double d = params.distance / params.earth_radius / Math.cos(Math.PI / params.vertices);  // circumscribed
+    List ring = new ArrayList();
+    for (int i = 0; i <= params.vertices; i++) {
+        double bearing = -2 * Math.PI * (i % params.vertices) / params.vertices;  // counterclockwise
+        double phi2 = Math.asin(Math.sin(phi1) * Math.cos(d) + Math.cos(phi1) * Math.sin(d) * Math.cos(bearing));
+        double lambda2 = lambda1 + Math.atan2(Math.sin(bearing) * Math.sin(d) * Math.cos(phi1),
+                                              Math.cos(d) - Math.sin(phi1) * Math.sin(phi2));
+        ring.add([Math.max(-180.0, Math.min(180.0, Math.toDegrees(lambda2))),
+                  Math.max(-90.0, Math.min(90.0, Math.toDegrees(phi2)))]);
+    }
+    ctx[params.match_field] = ['type': 'polygon', 'coordinates': [ring]];
+}
+"""
+
+# ranks the matched cities like get_cities() (top populated cities) / get_nearest_cities() (closest cities), the
+# continent is the one of the closest matched city, or the closest continent point (ContinentResolver.nearest) if no
+# city matched
+GEO_RESULTS_SCRIPT = HAVERSINE_FUNCTION + """
+def matches = ctx.remove(params.matches_field);
+ctx.remove(params.match_field);
+if (ctx.location != null && ctx.center instanceof Map && ctx.center.coordinates instanceof List) {
+    double lon = ((Number) ctx.center.coordinates[0]).doubleValue();
+    double lat = ((Number) ctx.center.coordinates[1]).doubleValue();
+
+    String continent = null;
+    if (matches instanceof List && !matches.isEmpty()) {
+        boolean polygon = isPolygon(ctx.location);
+        List ranked = new ArrayList();
+        double closest = 0;
+        for (def match : matches) {
+            Map city = new HashMap(match);
+            city.remove(params.shape_field);
+            double distance = haversine(lon, lat, ((Number) city.location.lon).doubleValue(),
+                                        ((Number) city.location.lat).doubleValue(), params.earth_radius);
+            if (city.continent_name instanceof String && (continent == null || distance < closest)) {
+                continent = city.continent_name;
+                closest = distance;
+            }
+            if (!polygon && distance > params.distance) {
+                continue;
+            }
+            long population = city.population == null ? 0 : ((Number) city.population).longValue();
+            ranked.add(['city': city, 'distance': distance, 'population': population]);
+        }
+        if (polygon) {
+            ranked.sort((a, b) -> Long.compare(b.population, a.population));
+        } else {
+            ranked.sort((a, b) -> Double.compare(a.distance, b.distance));
+        }
+        List cities = new ArrayList();
+        for (int i = 0; i < ranked.size() && i < params.size; i++) {
+            cities.add(ranked.get(i).city);
+        }
+        if (!cities.isEmpty()) {
+            ctx.city = cities;
+        }
+    }
+
+    if (continent == null) {
+        double best = 0;
+        for (def c : params.continents) {
+            double distance = haversine(lon, lat, c[1], c[2], params.earth_radius);
+            if (continent == null || distance < best) {
+                continent = c[0];
+                best = distance;
+            }
+        }
+    }
+    if (continent != null) {
+        ctx.continent = continent;
+    }
+}
+"""
+
+
+def geo_processors(policy, continents, size=5, distance=NEAREST_CITIES_DISTANCE_KM):
+    """
+    ingest processors adding the city & continent of the datasets (reverse geocoding on the ES ingest nodes)
+        the cities come from a geo_match enrich policy over the geonames populated places, the enrich processor
+        returns at most 128 matches per dataset (max_matches limit) in no particular order: footprints holding more
+        than 128 populated places get the top cities of an arbitrary subset of them, which can differ from get_cities()
+    :param policy: str, enrich policy name
+    :param continents: List[Dict]; geonames continent docs
+    :param size: int, max number of cities
+    :param distance: float, max distance (km) of the nearest cities (non polygon datasets)
+    :return: List[Dict]
+    """
+    params = {
+        "match_field": GEO_MATCH_FIELD,
+        "matches_field": GEO_MATCHES_FIELD,
+        "shape_field": ENRICH_SHAPE_FIELD,
+        "earth_radius": EARTH_RADIUS_KM,
+        "distance": distance,
+        "size": size,
+        "vertices": 32,
+        "continents": [[c['name'], c['location']['lon'], c['location']['lat']] for c in continents],
+    }
+    return [
+        {
+            "script": {
+                "lang": "painless",
+                "source": GEO_MATCH_SCRIPT,
+                "params": params
+            }
+        },
+        {
+            "enrich": {
+                "policy_name": policy,
+                "field": GEO_MATCH_FIELD,
+                "target_field": GEO_MATCHES_FIELD,
+                "shape_relation": "INTERSECTS",
+                "max_matches": ENRICH_MAX_MATCHES,
+                "ignore_missing": True
+            }
+        },
+        {
+            "script": {
+                "lang": "painless",
+                "source": GEO_RESULTS_SCRIPT,
+                "params": params
+            }
+        }
+    ]
+
+
+def enrich_pipeline(date_parts=False, geo_policy=None, continents=None):
+    """
+    ingest pipeline computing the fields GRQ otherwise adds in python before indexing a dataset:
+        @timestamp: time of ingestion
+        temporal_span: days between starttime & endtime
+        date_parts (optional): year, month, day & day of year of starttime
+        city & continent (optional): if an enrich policy is given, see geo_processors()
+    :param date_parts: bool
+    :param geo_policy: str, enrich policy name (see scripts/geonames/enrich_policy.py)
+    :param continents: List[Dict]; geonames continent docs, required with geo_policy
+    :return: Dict
+    """
+    pipeline = {
+        "description": "Adds the time of ingestion and the temporal span (in days) of the dataset",
+        "processors": [
+            {
+                "set": {
+                    "field": "@timestamp",
+                    "value": "{{_ingest.timestamp}}"
+                }
+            },
+            {
+                "script": {
+                    "lang": "painless",
+                    "source": TEMPORAL_SPAN_SCRIPT,
+                    "params": {
+                        "date_parts": date_parts
+                    }
+                }
+            }
+        ]
+    }
+    if geo_policy:
+        pipeline["description"] += ", its city and continent"
+        pipeline["processors"].extend(geo_processors(geo_policy, continents or []))
+    return pipeline
+
+
+def install_enrich_pipeline(es, name=DEFAULT_PIPELINE, date_parts=False, geo_policy=None, continents=None):
+    """
+    creates (or replaces) the enrichment pipeline
+    :param es: elasticsearch/opensearch client
+    :param name: str, pipeline id
+    :param date_parts: bool
+    :param geo_policy: str, enrich policy name (the policy must be executed already)
+    :param continents: List[Dict]; geonames continent docs
+    """
+    body = enrich_pipeline(date_parts=date_parts, geo_policy=geo_policy, continents=continents)
+    es.ingest.put_pipeline(id=name, body=body)
+
+
+def has_geo_processors(pipeline):
+    """
+    :param pipeline: Dict; pipeline definition
+    :return: bool, True if the pipeline adds the city & continent of the datasets (see geo_processors())
+    """
+    return any('enrich' in processor for processor in pipeline.get('processors', []))
+
+
+_pipeline = None
+_pipeline_checked_at = None
+_geo_enrich = False
+_pipeline_lock = threading.Lock()
+
+
+def get_ingest_pipeline():
+    """
+    ingest pipeline attached to the dataset bulk requests (INGEST_PIPELINE), installed with
+    scripts/install_ingest_pipeline.py --enrich
+    if set, @timestamp & temporal_span are computed on the ES ingest nodes instead of in GRQ
+        the workers only check that the pipeline exists, a missing pipeline (or a failed check) is checked again after
+        INGEST_PIPELINE_RETRY seconds, the datasets are enriched in GRQ meanwhile
+    :return: str, pipeline id (None if not set or not installed)
+    """
+    global _pipeline_checked_at
+
+    name = app.config.get('INGEST_PIPELINE', None)
+    if not name:
+        return None
+
+    with _pipeline_lock:
+        if _pipeline is None:
+            retry = float(app.config.get('INGEST_PIPELINE_RETRY', 60))
+            if _pipeline_checked_at is None or time.time() - _pipeline_checked_at >= retry:
+                _pipeline_checked_at = time.time()
+                _check_pipeline(name)
+    return _pipeline
+
+
+def _check_pipeline(name):
+    global _pipeline, _geo_enrich
+
+    try:
+        pipeline = grq_es.es.ingest.get_pipeline(id=name, ignore=404).get(name, None)
+    except Exception as e:
+        app.logger.error("unable to get ingest pipeline %s, enriching datasets in GRQ: %s\n%s" %
+                         (name, str(e), traceback.format_exc()))
+        return
+
+    if pipeline is None:
+        app.logger.warning("ingest pipeline %s not found (see scripts/install_ingest_pipeline.py --enrich), "
+                           "enriching datasets in GRQ" % name)
+        return
+    _pipeline = name
+    _geo_enrich = has_geo_processors(pipeline)
+    app.logger.info("using ingest pipeline %s%s" % (name, " (with reverse geocoding)" if _geo_enrich else ""))
+
+
+def is_geo_enriched():
+    """
+    :return: bool, True if the city & continent of the datasets are added by the ingest pipeline
+             (GEONAMES_ENRICH_POLICY)
+    """
+    return get_ingest_pipeline() is not None and _geo_enrich
@@ -0,0 +1,190 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import time
+import threading
+import traceback
+
+from grq2 import app, grq_es
+
+
+class AliasRegistry:
+    """
+    In-process cache of the index -> alias pairs of the cluster (refreshed from _cat/aliases every ttl seconds), used to
+    only send update_aliases requests (cluster state updates) for new pairs
+    """
+
+    def __init__(self, es, ttl=300):
+        """
+        :param es: elasticsearch/opensearch client
+        :param ttl: int, seconds before the cached aliases are refreshed
+        """
+        self.es = es
+        self.ttl = ttl
+        self._pairs = set()
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        aliases = self.es.cat.aliases(format='json')
+        with self._lock:
+            self._pairs = {(a['index'], a['alias']) for a in aliases}
+            self._refreshed_at = time.time()
+
+    def missing(self, index_aliases):
+        """
+        :param index_aliases: Iterable[Tuple[str, str]]; (index, alias)
+        :return: List[Tuple[str, str]]; pairs not in the cluster yet (de-duplicated, in order)
+        """
+        if self._refreshed_at is None or time.time() - self._refreshed_at >= self.ttl:
+            self.refresh()
+
+        missing = []
+        with self._lock:
+            for pair in index_aliases:
+                if pair not in self._pairs and pair not in missing:
+                    missing.append(pair)
+        return missing
+
+    def add(self, index_aliases):
+        """
+        adds the aliases which don't exist yet, with a single update_aliases request
+        :param index_aliases: Iterable[Tuple[str, str]]; (index, alias)
+        :return: List[Tuple[str, str]]; pairs added
+        """
+        missing = self.missing(index_aliases)
+        if not missing:
+            return []
+
+        actions = [{"add": {"index": index, "alias": alias}} for index, alias in missing]
+        self.es.indices.update_aliases({"actions": actions})
+        with self._lock:
+            self._pairs.update(missing)
+        return missing
+
+
+class IndexRegistry:
+    """
+    In-process cache of the GRQ indices (and aliases) of the cluster (refreshed from _cat/indices and _cat/aliases every
+    ttl seconds), used to create the missing indices explicitly before the bulk requests instead of letting the first
+    bulk write auto-create them (applying the index template and updating the cluster state while the bulk request
+    waits)
+    """
+
+    def __init__(self, es, pattern='grq_*', ttl=300):
+        """
+        :param es: elasticsearch/opensearch client
+        :param pattern: str, index pattern of the GRQ indices (same as the index template)
+        :param ttl: int, seconds before the cached indices are refreshed
+        """
+        self.es = es
+        self.pattern = pattern
+        self.ttl = ttl
+        self._indices = set()
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        indices = self.es.cat.indices(index=self.pattern, format='json', h='index')
+        aliases = self.es.cat.aliases(name=self.pattern, format='json', h='alias')  # can't be created as indices
+        with self._lock:
+            self._indices = {i['index'] for i in indices} | {a['alias'] for a in aliases}
+            self._refreshed_at = time.time()
+
+    def missing(self, indices):
+        """
+        :param indices: Iterable[str]
+        :return: List[str]; indices not in the cluster yet (de-duplicated, in order)
+        """
+        if self._refreshed_at is None or time.time() - self._refreshed_at >= self.ttl:
+            self.refresh()
+
+        missing = []
+        with self._lock:
+            for index in indices:
+                if index not in self._indices and index not in missing:
+                    missing.append(index)
+        return missing
+
+    def ensure(self, indices):
+        """
+        creates the indices which don't exist yet (the index template matching their name is applied by ES)
+            names which already exist (created meanwhile by another worker, or an alias such as a custom index suffix
+            pointing to the actual index) are cached the same as created indices, the bulk requests write through them
+        :param indices: Iterable[str]
+        :return: List[str]; indices created
+        """
+        created = []
+        for index in self.missing(indices):
+            resp = self.es.indices.create(index=index, ignore=400)
+            if 'error' not in resp:
+                created.append(index)
+            elif not _already_exists(resp['error']):
+                raise RuntimeError("unable to create index %s: %s" % (index, resp['error']))
+            with self._lock:
+                self._indices.add(index)
+        return created
+
+
+def _already_exists(error):
+    """
+    :param error: Dict|str; error of an index creation request
+    :return: bool, True if the name is taken by an index or an alias
+    """
+    error = str(error)
+    return 'resource_already_exists_exception' in error or 'already exists as alias' in error
+
+
+def index_name(version, dataset):
+    """
+    GRQ index of a dataset version: <GRQ_INDEX>_<version>_<dataset>
+    :param version: str
+    :param dataset: str
+    :return: str
+    """
+    return '{}_{}_{}'.format(app.config['GRQ_INDEX'], version, dataset).lower()
+
+
+_alias_registry = None
+_index_registry = None
+
+
+def get_alias_registry():
+    """
+    :return: AliasRegistry of GRQ's Elasticsearch
+    """
+    global _alias_registry
+
+    if _alias_registry is None:
+        _alias_registry = AliasRegistry(grq_es.es, ttl=int(app.config.get('ALIAS_REGISTRY_TTL', 300)))
+    return _alias_registry
+
+
+def get_index_registry():
+    """
+    :return: IndexRegistry of GRQ's Elasticsearch
+    """
+    global _index_registry
+
+    if _index_registry is None:
+        _index_registry = IndexRegistry(grq_es.es, pattern='{}_*'.format(app.config['GRQ_INDEX']),
+                                        ttl=int(app.config.get('INDEX_REGISTRY_TTL', 300)))
+    return _index_registry
+
+
+def ensure_indices(indices):
+    """
+    pre-creates the missing GRQ indices before a bulk request (INDEX_PRECREATE), errors are logged and left to the
+    index auto-creation of the bulk request
+    :param indices: Iterable[str]
+    """
+    if app.config.get('INDEX_PRECREATE', False) is not True:
+        return
+
+    try:
+        created = get_index_registry().ensure(indices)
+        if created:
+            app.logger.info("created indices: %s" % created)
+    except Exception as e:
+        app.logger.warning("unable to pre-create indices, leaving it to the bulk request: %s\n%s" %
+                           (str(e), traceback.format_exc()))
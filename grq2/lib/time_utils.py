@@ -2,9 +2,10 @@ from future import standard_library
 standard_library.install_aliases()
 import time as _time
 from datetime import tzinfo, timedelta, datetime, timezone
-import re
 import time
 
+from grq2.lib.fast_time import parse_time_elements, temporal_span_days
+
 ZERO = timedelta(0)
 HOUR = timedelta(hours=1)
 
@@ -202,18 +203,7 @@ def getMDY(t):
 def getTimeElementsFromString(dtStr):
     """Return tuple of (year,month,day,hour,minute,second) from date time string."""
 
-    match = re.match(
-        r'^(\d{4})[/-](\d{2})[/-](\d{2})[\s*T](\d{2}):(\d{2}):(\d{2})(?:\.\d+)?Z?$', dtStr)
-    if match:
-        (year, month, day, hour, minute, second) = list(map(int, match.groups()))
-    else:
-        match = re.match(r'^(\d{4})[/-](\d{2})[/-](\d{2})$', dtStr)
-        if match:
-            (year, month, day) = list(map(int, match.groups()))
-            (hour, minute, second) = (0, 0, 0)
-        else:
-            raise RuntimeError("Failed to recognize date format: %s" % dtStr)
-    return (year, month, day, hour, minute, second)
+    return parse_time_elements(dtStr)
 
 
 def getDatetimeFromString(dtStr, dayOnly=False):
@@ -231,13 +221,8 @@ def getTemporalSpanInDays(dt1, dt2):
     """Return temporal timespan in days."""
 
     # set temporal_span
-    dt1 = getDatetimeFromString(dt1)
-    dt2 = getDatetimeFromString(dt2)
-    temporal_diff = dt1 - dt2 if dt1 > dt2 else dt2 - dt1
-    temporal_span = abs(temporal_diff.days)
-    if abs(temporal_diff.seconds) >= 43200.:
-        temporal_span += 1
-    return temporal_span
+    return temporal_span_days(dt1, dt2)
+
 
 def datetime_iso_naive(datetime_value=None):
     """
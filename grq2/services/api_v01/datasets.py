@@ -1,7 +1,6 @@
 from future import standard_library
 standard_library.install_aliases()
 
-import json
 import traceback
 
 from flask import request
@@ -9,7 +8,28 @@ from flask_restx import Resource, fields
 
 from grq2 import app
 from .service import grq_ns
-from grq2.lib.dataset import update as update_dataset
+from grq2.lib.dataset import update as update_dataset, update_bulk
+from grq2.lib import codec
+from grq2.lib.coalescer import BulkCoalescer
+
+
+_coalescer = None
+
+
+def get_coalescer():
+    """
+    coalesces concurrent dataset index requests into bulk requests, None if INDEX_COALESCE_WINDOW is not set
+    :return: BulkCoalescer
+    """
+    global _coalescer
+
+    window = float(app.config.get('INDEX_COALESCE_WINDOW', 0))
+    if window <= 0:
+        return None
+    if _coalescer is None:
+        _coalescer = BulkCoalescer(update_bulk, window=window,
+                                   max_items=int(app.config.get('INDEX_COALESCE_MAX_DOCS', 100)))
+    return _coalescer
 
 
 @grq_ns.route('/dataset/index', endpoint='dataset_index')
@@ -35,7 +55,7 @@ class IndexDataset(Resource):
             return {'success': False, 'message': 'dataset_info must be supplied'}, 400
 
         try:
-            info = json.loads(info)
+            info = codec.loads(info)
         except Exception as e:
             message = "Failed to parse dataset info JSON."
             app.logger.debug(message)
@@ -46,6 +66,9 @@ class IndexDataset(Resource):
             }, 500
 
         try:
+            coalescer = get_coalescer()
+            if coalescer is not None:
+                return coalescer.submit(info)
             return update_dataset(info)
         except Exception as e:
             message = f"Failed index dataset. {type(e)}:{e}\n{traceback.format_exc()}"
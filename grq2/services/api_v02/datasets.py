@@ -1,12 +1,14 @@
 from future import standard_library
 standard_library.install_aliases()
 
-import json
+import copy
+import time
+import threading
 import traceback
-from datetime import datetime
 
 from flask import request
 from flask_restx import Resource, fields
+from werkzeug.exceptions import RequestEntityTooLarge
 
 from shapely.geometry import shape
 
@@ -16,10 +18,20 @@ import opensearchpy.exceptions
 
 from grq2 import app, grq_es
 from .service import grq_ns
-from grq2.lib.dataset import map_geojson_type
-
-from grq2.lib.geonames import get_cities, get_nearest_cities, get_continents
+from grq2.lib.dataset import map_geojson_type, add_aliases
+from grq2.lib import codec
+from grq2.lib.bulk import build_bulk_bodies, send_bulk_parallel, encode_bulk_item, index_bulk_items
+from grq2.lib.ingest_queue import create_ingest_queue, IngestWriter
+from grq2.lib.offload import offload_geometries
+from grq2.lib.footprint_cache import (get_footprint_cache, footprint_precision, footprint_key, footprint_entry,
+                                      apply_footprint_entry)
+from grq2.lib.pipeline import get_ingest_pipeline, is_geo_enriched
+from grq2.lib.registry import index_name, ensure_indices
+from grq2.lib.metrics import metrics, batch_labels
+
+from grq2.lib.geonames import get_cities, get_nearest_cities, get_continent, get_continent_resolver, batch_lookup
 from grq2.lib.time_utils import getTemporalSpanInDays, datetime_iso_naive
+from grq2.lib.fast_time import temporal_spans
 
 
 _POINT = 'Point'
@@ -38,18 +50,99 @@ def get_es_index(prod_json):
     :param prod_json: Dict[any]
     :return: str
     """
-    version = prod_json['version']  # get version
-    dataset = prod_json.get('dataset', "dataset")  # determine index name
-
-    index = '{}_{}_{}'.format(app.config['GRQ_INDEX'], version, dataset)  # get default index
+    index = peek_es_index(prod_json)
 
     aliases = []
     if 'index' in prod_json:
-        if 'suffix' in prod_json['index']:
-            index = '{}_{}'.format(app.config['GRQ_INDEX'], prod_json['index']['suffix'])
         aliases.extend(prod_json['index'].get('aliases', []))
         del prod_json['index']
-    return index.lower(), aliases
+    return index, aliases
+
+
+def peek_es_index(prod_json):
+    """
+    same ES index name as get_es_index(), without removing the custom index info from the dataset
+    :param prod_json: Dict[any]
+    :return: str
+    """
+    version = prod_json['version']  # get version
+    dataset = prod_json.get('dataset', "dataset")  # determine index name
+
+    index = index_name(version, dataset)  # get default index
+    if 'suffix' in prod_json.get('index', {}):
+        index = '{}_{}'.format(app.config['GRQ_INDEX'], prod_json['index']['suffix'])
+    return index.lower()
+
+
+def dataset_labels(datasets):
+    """
+    :param datasets: List[Dict]
+    :return: Dict; dataset & index metrics labels of the batch
+    """
+    return batch_labels((ds.get('dataset', "dataset"), peek_es_index(ds)) for ds in datasets)
+
+
+def _geolocation_lookups(prod_json):
+    """
+    normalizes the dataset's GEOJson type, adds its center (if missing) and returns the geonames lookups needed for its
+    city and continent
+    :param prod_json: Dict[any]; dataset metadata
+    :return: List[Tuple[str, Tuple]]; [(cities lookup), (continents lookup)], see grq2.lib.geonames.batch_lookup
+    """
+    if 'location' not in prod_json:
+        return []
+
+    location = {**prod_json['location']}  # copying location to be used to create a shapely geometry object
+    loc_type = location['type']
+
+    geo_json_type = map_geojson_type(loc_type)
+    location['type'] = geo_json_type  # setting proper GEOJson type, ex. multipolygon -> MultiPolygon
+    prod_json['location']['type'] = geo_json_type.lower()
+
+    # add center if missing
+    if 'center' not in prod_json:
+        geo_shape = shape(location)
+        centroid = geo_shape.centroid
+        prod_json['center'] = {
+            'type': 'point',
+            'coordinates': [centroid.x, centroid.y]
+        }
+
+    # extract coordinates from center
+    lon, lat = prod_json['center']['coordinates']
+
+    # add cities
+    if geo_json_type in (_POLYGON, _MULTIPOLYGON):
+        mp = True if geo_json_type == _MULTIPOLYGON else False
+        coords = location['coordinates'][0]
+        cities_lookup = ('get_cities', (coords, 5, mp))
+    elif geo_json_type in (_POINT, _MULTIPOINT, _LINESTRING, _MULTILINESTRING):
+        cities_lookup = ('get_nearest_cities', (lon, lat))
+    else:
+        raise TypeError('{} is not a valid GEOJson type (or un-supported): {}'.format(geo_json_type, GEOJSON_TYPES))
+
+    # add closest continent
+    return [cities_lookup, ('get_continents', (lon, lat))]
+
+
+def _set_geolocation(prod_json, cities, continent):
+    if cities:
+        prod_json['city'] = cities
+    if continent:
+        prod_json['continent'] = continent
+
+
+def _has_time_range(prod_json):
+    if prod_json.get('starttime', None) is not None and prod_json.get('endtime', None) is not None:
+        return isinstance(prod_json['starttime'], str) and isinstance(prod_json['endtime'], str)
+    return False
+
+
+def _set_temporal_span(prod_json):
+    if _has_time_range(prod_json):
+        start_time = prod_json['starttime']
+        end_time = prod_json['endtime']
+        prod_json['temporal_span'] = getTemporalSpanInDays(start_time, end_time)
 
 
 def reverse_geolocation(prod_json):
@@ -57,82 +150,328 @@ def reverse_geolocation(prod_json):
     retrieves the dataset's city, the nearest cities and continent
     :param prod_json: Dict[any]; dataset metadata
     """
-    if 'location' in prod_json:
-        location = {**prod_json['location']}  # copying location to be used to create a shapely geometry object
-        loc_type = location['type']
-
-        geo_json_type = map_geojson_type(loc_type)
-        location['type'] = geo_json_type  # setting proper GEOJson type, ex. multipolygon -> MultiPolygon
-        prod_json['location']['type'] = geo_json_type.lower()
-
-        # add center if missing
-        if 'center' not in prod_json:
-            geo_shape = shape(location)
-            centroid = geo_shape.centroid
-            prod_json['center'] = {
-                'type': 'point',
-                'coordinates': [centroid.x, centroid.y]
-            }
+    lookups = _geolocation_lookups(prod_json)
+    if lookups and not is_geo_enriched():  # otherwise added by the ingest pipeline
+        (cities_func, cities_args), (_, continents_args) = lookups
+        cities = get_cities(*cities_args) if cities_func == 'get_cities' else get_nearest_cities(*cities_args)
+        _set_geolocation(prod_json, cities, get_continent(*continents_args))
+
+    # set temporal_span
+    _set_temporal_span(prod_json)
 
-        # extract coordinates from center
-        lon, lat = prod_json['center']['coordinates']
-
-        # add cities
-        if geo_json_type in (_POLYGON, _MULTIPOLYGON):
-            mp = True if geo_json_type == _MULTIPOLYGON else False
-            coords = location['coordinates'][0]
-            cities = get_cities(coords, multipolygon=mp)
-            if cities:
-                prod_json['city'] = cities
-        elif geo_json_type in (_POINT, _MULTIPOINT, _LINESTRING, _MULTILINESTRING):
-            nearest_cities = get_nearest_cities(lon, lat)
-            if nearest_cities:
-                prod_json['city'] = nearest_cities
-        else:
-            raise TypeError('{} is not a valid GEOJson type (or un-supported): {}'.format(geo_json_type, GEOJSON_TYPES))
 
-        # add closest continent
-        continents = get_continents(lon, lat)
-        if continents:
-            prod_json['continent'] = continents[0]['name'] if len(continents) > 0 else None
+def reverse_geolocation_batch(datasets, temporal_span=True, geocode=True):
+    """
+    same as reverse_geolocation() but for a list of datasets, the geonames lookups of every dataset are sent together
+    (multi-search) instead of 1 request per lookup
+    footprints found in the footprint cache (FOOTPRINT_CACHE_SIZE) skip the centroid and geonames lookups, the datasets
+    of the batch sharing a footprint are looked up once
+    :param datasets: List[Dict[any]]; datasets metadata
+    :param temporal_span: bool, False if computed by the ingest pipeline
+    :param geocode: bool, False if the city & continent are added by the ingest pipeline (only the center is added)
+    """
+    # continents resolved in memory, otherwise looked up with the cities
+    resolver = get_continent_resolver() if geocode else None
+    cache = get_footprint_cache() if geocode else None
+
+    keys = [None] * len(datasets)
+    cached = {}
+    if cache is not None:
+        with metrics.timer('footprint_cache'):
+            precision = footprint_precision()
+            keys = [footprint_key(ds, precision) for ds in datasets]
+            cached = cache.get_many(key for key in keys if key is not None)
+            for prod_json, key in zip(datasets, keys):
+                if key in cached:
+                    apply_footprint_entry(prod_json, cached[key])
+
+    located = []  # (dataset, footprint key) looked up
+    duplicates = {}  # footprint key -> other datasets of the batch with the same footprint
+    lookups = []
+    centers = []
+    with metrics.timer('geometry'):
+        # centers of the datasets missing one, computed for the whole batch at once
+        no_center = [ds for ds in datasets if 'location' in ds and 'center' not in ds]
+        for prod_json, geometry in zip(no_center, offload_geometries([ds['location'] for ds in no_center])):
+            if geometry is not None:
+                prod_json['center'] = {
+                    'type': 'point',
+                    'coordinates': list(geometry.center)
+                }
+
+        for prod_json, key in zip(datasets, keys):
+            ds_lookups = _geolocation_lookups(prod_json)
+            if not ds_lookups or not geocode or key in cached:
+                continue
+            if key is not None:
+                if key in duplicates:
+                    duplicates[key].append(prod_json)
+                    continue
+                duplicates[key] = []
+
+            located.append((prod_json, key))
+            if resolver is None:
+                lookups.extend(ds_lookups)
+            else:
+                lookups.append(ds_lookups[0])
+                centers.append(ds_lookups[1][1])
 
     # set temporal_span
-    if prod_json.get('starttime', None) is not None and prod_json.get('endtime', None) is not None:
-        if isinstance(prod_json['starttime'], str) and isinstance(prod_json['endtime'], str):
-            start_time = prod_json['starttime']
-            end_time = prod_json['endtime']
-            prod_json['temporal_span'] = getTemporalSpanInDays(start_time, end_time)
+    with metrics.timer('temporal_span'):
+        timed = [ds for ds in datasets if _has_time_range(ds)] if temporal_span else []
+        for prod_json, span in zip(timed, temporal_spans([(ds['starttime'], ds['endtime']) for ds in timed])):
+            prod_json['temporal_span'] = span
+
+    entries = {}
+    with metrics.timer('geonames'):
+        results = batch_lookup(lookups)
+        if resolver is None:
+            geolocations = []
+            for i in range(len(located)):
+                continents = results[2 * i + 1]
+                geolocations.append((results[2 * i], continents[0]['name'] if continents else None))
+        else:
+            geolocations = zip(results, resolver.resolve_batch(centers))
+
+        for (prod_json, key), (cities, continent) in zip(located, geolocations):
+            _set_geolocation(prod_json, cities, continent)
+            if key is None:
+                continue
+            entry = footprint_entry(prod_json, cities, continent)
+            for duplicate in duplicates[key]:
+                apply_footprint_entry(duplicate, copy.deepcopy(entry))
+            if cities is not None:  # not cached if the geonames index wasn't found
+                entries[key] = entry
+
+    if cache is not None:
+        with metrics.timer('footprint_cache'):
+            cache.put_many(entries)
+
+
+def get_bulk_kwargs(pipeline=None):
+    """
+    request kwargs for the bulk API calls
+    :param pipeline: str, ingest pipeline of the indexed documents, the one prepare_bulk() was given
+    :return: Dict
+    """
+    # get bulk request timeout from config
+    # bulk_request_timeout = app.config.get('BULK_REQUEST_TIMEOUT', 10)
+
+    kwargs = {"timeout": "2m"}
+    if isinstance(grq_es.es, OpenSearch):
+        kwargs["timeout"] = 120
+
+    if pipeline is not None:
+        kwargs["pipeline"] = pipeline
+    return kwargs
 
 
-def split_array_chunk(data):
+def prepare_bulk(datasets, pipeline=None):
     """
-    Elasticsearch/Opensearch has a 100mb size limit when making API calls
-        function breaks each array into chunks
-    :param data: List[Dict]
-    :return: List[Dict]
+    adds the timestamp, reverse geolocation and temporal span to the datasets and creates the bulk actions
+    the timestamp and temporal span are left to the ingest pipeline if one is set (INGEST_PIPELINE)
+    :param datasets: List[Dict]
+    :param pipeline: str, ingest pipeline the bulk requests are sent with (see get_ingest_pipeline()), None if none
+    :return: Tuple[List[Dict], List[Tuple[str, str]]]; [action, doc, action, doc, ...], custom (index, alias) pairs
+    """
+    enrich = pipeline is None
+
+    indices = []
+    index_aliases = []
+    for ds in datasets:
+        index, aliases = get_es_index(ds)
+        if enrich:
+            ds["@timestamp"] = datetime_iso_naive() + 'Z'
+        indices.append(index)
+        index_aliases.extend([(index, alias) for alias in aliases])
+    reverse_geolocation_batch(datasets, temporal_span=enrich, geocode=enrich or not is_geo_enriched())
+    with metrics.timer('indices'):
+        ensure_indices(indices)  # new dataset versions don't wait for the index auto-creation in the bulk request
+
+    docs_bulk = []
+    for ds, index in zip(datasets, indices):
+        docs_bulk.append({"index": {"_index": index, "_id": ds["id"]}})
+        docs_bulk.append(ds)
+        metrics.inc('grq_ingest_docs_total', dataset=ds.get('dataset', "dataset"), index=index)
+    return docs_bulk, index_aliases
+
+
+def index_bulk(docs_bulk, delete_docs, **kwargs):
+    """
+    sends the bulk actions to ES in chunks of BULK_LIMIT bytes, stops at the first chunk with errors
+    if BULK_CONCURRENCY > 1 the chunks are sent in parallel and every chunk is sent
+    :param docs_bulk: List[Dict]; [action, doc, action, doc, ...]
+    :param delete_docs: List[Dict]; delete actions of the written docs are appended to it (in case of a rollback)
+    :param kwargs: bulk request kwargs
+    :return: List[Dict]; items with errors, empty if everything was indexed
     """
     bulk_limit = app.config.get("BULK_LIMIT", 1e+8)
+    concurrency = int(app.config.get("BULK_CONCURRENCY", 1))
+    with metrics.timer('serialize'):
+        data_chunks = build_bulk_bodies(docs_bulk, bulk_limit)  # serializing the data into 100MB chunks
+    app.logger.info("data split into %d chunk(s)" % len(data_chunks))
+    metrics.inc('grq_ingest_chunks_total', len(data_chunks))
+    metrics.inc('grq_ingest_bytes_total', sum(len(chunk) for chunk in data_chunks))
+
+    if concurrency <= 1 or len(data_chunks) <= 1:
+        for chunk in data_chunks:
+            with metrics.timer('bulk'):
+                resp = grq_es.es.bulk(body=chunk, **kwargs)
+            _track_written_docs(resp, delete_docs)
+            if resp["errors"] is True:
+                error_list = list(filter(lambda x: "error" in x["index"], resp["items"]))
+                metrics.inc('grq_ingest_errors_total', len(error_list))
+                return error_list
+        return []
+
+    error_list = []
+    with metrics.timer('bulk'):
+        responses = send_bulk_parallel(grq_es.es, data_chunks, concurrency, **kwargs)
+    for resp in responses:
+        if isinstance(resp, Exception):  # the whole chunk failed, the other chunks still need to be rolled back
+            error_list.append({"index": {"error": f"{type(resp)}:{resp}"}})
+            continue
+        _track_written_docs(resp, delete_docs)
+        if resp["errors"] is True:
+            error_list.extend(list(filter(lambda x: "error" in x["index"], resp["items"])))
+    metrics.inc('grq_ingest_errors_total', len(error_list))
+    return error_list
+
+
+def rollback_docs(delete_docs, **kwargs):
+    """
+    deletes the documents written by a failed request
+    :param delete_docs: List[Dict]; delete actions, see index_bulk()
+    :param kwargs: bulk request kwargs
+    """
+    metrics.inc('grq_ingest_rollbacks_total')
+    with metrics.timer('rollback'):
+        grq_es.es.bulk(body=delete_docs, **kwargs)
 
-    main_data = []
-    batch = []
-    cur_byte_count = 0
-    for i in range(0, len(data), 2):
-        action = data[i]
-        doc = data[i+1]
 
-        action_size = len(str.encode(json.dumps(action)))
-        doc_size = len(str.encode(json.dumps(doc)))
+def _track_written_docs(resp, delete_docs):
+    for item in resp["items"]:
+        doc_info = item["index"]
+        delete_docs.append({"delete": {"_index": doc_info["_index"], "_id": doc_info["_id"]}})
+
+
+def is_partial_mode():
+    """
+    partial failure mode (opt-in with ?partial=true, default is BULK_PARTIAL_FAILURE): failed documents are retried
+    and reported individually instead of rolling back the whole request
+    :return: bool
+    """
+    partial = request.args.get('partial', None)
+    if partial is None:
+        return app.config.get('BULK_PARTIAL_FAILURE', False) is True
+    return partial.lower() in ('1', 'true', 'yes')
+
+
+def index_bulk_partial(docs_bulk, **kwargs):
+    """
+    sends the bulk actions to ES, retrying only the documents which failed with a retryable status (429/503)
+    :param docs_bulk: List[Dict]; [action, doc, action, doc, ...]
+    :param kwargs: bulk request kwargs
+    :return: Tuple[int, List[Dict]]; number of documents written, items which failed permanently
+    """
+    with metrics.timer('serialize'):
+        items = [encode_bulk_item(docs_bulk[i], docs_bulk[i + 1]) for i in range(0, len(docs_bulk), 2)]
+    metrics.inc('grq_ingest_bytes_total', sum(len(item) for item in items))
+
+    with metrics.timer('bulk'):
+        written, failed = index_bulk_items(
+            grq_es.es,
+            items,
+            bulk_limit=app.config.get("BULK_LIMIT", 1e+8),
+            max_retries=int(app.config.get("BULK_MAX_RETRIES", 3)),
+            backoff=float(app.config.get("BULK_RETRY_BACKOFF", 1.)),
+            **kwargs
+        )
+    metrics.inc('grq_ingest_errors_total', len(failed))
+    return written, failed
+
+
+def partial_response(written, failed):
+    if failed:
+        app.logger.error("ERROR indexing %d documents in Elasticsearch, kept %d indexed documents" %
+                         (len(failed), written))
+        app.logger.error(failed)
+        return {
+            "success": False,
+            "message": failed,
+        }, 400
+
+    app.logger.info("successfully indexed %d documents" % written)
+    return {
+        "success": True,
+        "message": "successfully indexed %d documents" % written,
+    }
+
+
+def is_async_mode():
+    """
+    asynchronous ingest mode (?async=true, default is ASYNC_INGEST): datasets are queued and indexed in the background
+    :return: bool
+    """
+    async_ingest = request.args.get('async', None)
+    if async_ingest is None:
+        return app.config.get('ASYNC_INGEST', False) is True
+    return async_ingest.lower() in ('1', 'true', 'yes')
+
+
+def index_datasets(datasets):
+    """
+    indexes the datasets queued by the asynchronous ingest mode (partial failure semantics)
+    :param datasets: List[Dict]
+    :return: Tuple[int, List[Dict]]; number of documents written, items which failed permanently
+    """
+    with metrics.context(**(dataset_labels(datasets) if metrics.enabled else {})):
+        metrics.inc('grq_ingest_requests_total', endpoint='async')
+        pipeline = get_ingest_pipeline()
+        docs_bulk, index_aliases = prepare_bulk(datasets, pipeline)
+        written, failed = index_bulk_partial(docs_bulk, **get_bulk_kwargs(pipeline))
+        add_aliases(index_aliases)
+    return written, failed
 
-        if cur_byte_count + action_size + doc_size + 8 < bulk_limit:
-            batch.extend([action, doc])
-            cur_byte_count = cur_byte_count + action_size + doc_size + 8
-        else:
-            main_data.append(batch)
-            batch = [action, doc]
-            cur_byte_count = action_size + doc_size + 8
 
-    main_data.append(batch)
-    return main_data
+_ingest_queue = None
+_ingest_writer = None
+_ingest_lock = threading.Lock()
+
+
+def get_ingest_queue():
+    """
+    ingest queue of the asynchronous ingest mode, created on first use
+    :return: RedisIngestQueue|SpoolIngestQueue
+    """
+    global _ingest_queue
+
+    with _ingest_lock:
+        if _ingest_queue is None:
+            _ingest_queue = create_ingest_queue(app.config)
+    return _ingest_queue
+
+
+def start_ingest_writer():
+    """
+    starts the background writer of the ingest queue (once per worker process), called when the worker starts so the
+    queued tickets are indexed whether or not the worker serves asynchronous ingest requests
+    :return: IngestWriter
+    """
+    global _ingest_writer
+
+    queue = get_ingest_queue()
+    with _ingest_lock:
+        if _ingest_writer is None:
+            _ingest_writer = IngestWriter(
+                queue,
+                index_datasets,
+                max_docs=int(app.config.get('ASYNC_INGEST_MAX_DOCS', 5000)),
+                max_payloads=int(app.config.get('ASYNC_INGEST_MAX_PAYLOADS', 100)),
+                visibility_timeout=int(app.config.get('ASYNC_INGEST_VISIBILITY_TIMEOUT', 600)),
+            )
+            _ingest_writer.start()
+    return _ingest_writer
 
 
 @grq_ns.route('/dataset/index', endpoint='dataset_index')
@@ -145,6 +484,7 @@ class IndexDataset(Resource):
         'message': fields.String(required=True, description="message describing success or failure"),
         'objectid': fields.String(required=True, description="ID of indexed dataset"),
         'index': fields.String(required=True, description="dataset index name"),
+        'ticket': fields.String(required=False, description="ingest ticket ID (asynchronous mode)"),
     })
 
     parser = grq_ns.parser()
@@ -153,55 +493,59 @@ class IndexDataset(Resource):
     @grq_ns.marshal_with(resp_model)
     @grq_ns.expect(parser, validate=True)
     def post(self):
-        # get bulk request timeout from config
-        # bulk_request_timeout = app.config.get('BULK_REQUEST_TIMEOUT', 10)
-
-        kwargs = {"timeout": "2m"}
-        if isinstance(grq_es.es, OpenSearch):
-            kwargs["timeout"] = 120
+        pipeline = get_ingest_pipeline()  # resolved once, the documents are prepared for it
+        kwargs = get_bulk_kwargs(pipeline)
 
         try:
-            datasets = json.loads(request.json)
-
-            docs_bulk = []
-            for ds in datasets:
-                _id = ds["id"]
-                index, aliases = get_es_index(ds)
-                ds["@timestamp"] = datetime_iso_naive() + 'Z'
-                reverse_geolocation(ds)
-                docs_bulk.append({"index": {"_index": index, "_id": _id}})
-                docs_bulk.append(ds)
-
-            errors = False
-            error_list = []
-            _delete_docs = []  # keep track of docs if they need to be rolled back
-            data_chunks = split_array_chunk(docs_bulk)  # splitting the data into 100MB chunks
-            app.logger.info("data split into %d chunk(s)" % len(data_chunks))
-
-            for chunk in data_chunks:
-                resp = grq_es.es.bulk(body=chunk, **kwargs)
-                for item in resp["items"]:
-                    doc_info = item["index"]
-                    _delete_docs.append({"delete": {"_index": doc_info["_index"], "_id": doc_info["_id"]}})
-                if resp["errors"] is True:
-                    errors = True
-                    error_list.extend(list(filter(lambda x: "error" in x["index"], resp["items"])))
-                    break
-
-            if errors is True:
-                app.logger.error("ERROR indexing documents in Elasticsearch, rolling back...")
-                app.logger.error(error_list)
-                grq_es.es.bulk(body=_delete_docs, **kwargs)
+            t0 = time.perf_counter()
+            datasets = codec.loads(request.json)
+            parse_time = time.perf_counter() - t0
+
+            with metrics.context(**(dataset_labels(datasets) if metrics.enabled else {})):
+                metrics.inc('grq_ingest_requests_total', endpoint='index')
+                metrics.observe('grq_ingest_stage_seconds', parse_time, stage='parse')
+
+                if is_async_mode():
+                    start_ingest_writer()  # no-op if started with the worker (ASYNC_INGEST_WRITER)
+                    ticket = get_ingest_queue().put(datasets)
+                    app.logger.info("queued %d documents, ticket: %s" % (len(datasets), ticket))
+                    return {
+                        "success": True,
+                        "message": "queued %d documents" % len(datasets),
+                        "ticket": ticket,
+                    }, 202
+
+                docs_bulk, index_aliases = prepare_bulk(datasets, pipeline)
+
+                if is_partial_mode():
+                    written, failed = index_bulk_partial(docs_bulk, **kwargs)
+                    add_aliases(index_aliases)
+                    return partial_response(written, failed)
+
+                _delete_docs = []  # keep track of docs if they need to be rolled back
+                error_list = index_bulk(docs_bulk, _delete_docs, **kwargs)
+
+                if error_list:
+                    app.logger.error("ERROR indexing documents in Elasticsearch, rolling back...")
+                    app.logger.error(error_list)
+                    rollback_docs(_delete_docs, **kwargs)
+                    return {
+                        "success": False,
+                        "message": error_list,
+                    }, 400
+
+                add_aliases(index_aliases)
+                app.logger.info("successfully indexed %d documents" % len(datasets))
                 return {
-                    "success": False,
-                    "message": error_list,
-                }, 400
-
-            app.logger.info("successfully indexed %d documents" % len(datasets))
+                    "success": True,
+                    "message": "successfully indexed %d documents" % len(datasets),
+                }
+        except RequestEntityTooLarge as e:  # decompressed body larger than MAX_DECOMPRESSED_LENGTH
+            app.logger.error(e.description)
             return {
-                "success": True,
-                "message": "successfully indexed %d documents" % len(datasets),
-            }
+                'success': False,
+                'message': e.description
+            }, 413
         except (elasticsearch.exceptions.ElasticsearchException, opensearchpy.exceptions.OpenSearchException) as e:
             message = f"Failed index dataset. {type(e)}:{e}\n{traceback.format_exc()}"
             app.logger.error(message)
@@ -216,3 +560,161 @@ class IndexDataset(Resource):
                 'success': False,
                 'message': message
             }, 400
+
+
+@grq_ns.route('/dataset/index/status/<string:ticket>', endpoint='dataset_index_status')
+@grq_ns.doc(responses={200: "Success", 404: "Ticket not found"}, description="Asynchronous dataset index status.")
+class IndexDatasetStatus(Resource):
+    """Status of datasets queued with the asynchronous dataset indexing API."""
+
+    resp_model = grq_ns.model('IndexStatusResponse', {
+        'success': fields.Boolean(required=True, description="Boolean, whether the API was successful"),
+        'ticket': fields.String(required=True, description="ingest ticket ID"),
+        'state': fields.String(description="queued, processing, succeeded or failed"),
+        'count': fields.Integer(description="number of datasets"),
+        'indexed': fields.Integer(description="number of datasets indexed"),
+        'message': fields.String(description="message describing success or failure"),
+    })
+
+    @grq_ns.marshal_with(resp_model)
+    def get(self, ticket):
+        status = get_ingest_queue().get_status(ticket)
+        if status is None:
+            return {
+                'success': False,
+                'ticket': ticket,
+                'message': "ticket not found (or expired)",
+            }, 404
+        return {
+            'success': True,
+            'ticket': ticket,
+            **status
+        }
+
+
+@grq_ns.route('/dataset/index/stream', endpoint='dataset_index_stream')
+@grq_ns.doc(responses={200: "Success", 400: "Execution failed"},
+            description="Dataset index, newline delimited JSON body (1 dataset per line, can be gzip/zstd compressed)")
+class IndexDatasetStream(Resource):
+    """
+    Streaming dataset indexing API
+    the request body is parsed incrementally and indexed every STREAM_CHUNK_SIZE datasets (or BULK_LIMIT bytes), so
+    memory usage is bounded by the chunk size instead of the request size
+        unless in partial mode, the ids of the written documents are kept to roll the whole stream back on failure, a
+        stream writing more than STREAM_ROLLBACK_LIMIT documents is rolled back and rejected (use ?partial=true), the
+        custom aliases are added once the whole stream is indexed
+    """
+
+    resp_model = grq_ns.model('StreamJsonResponse', {
+        'success': fields.Boolean(required=True, description="Boolean, whether the API was successful"),
+        'message': fields.String(required=True, description="message describing success or failure"),
+    })
+
+    @grq_ns.marshal_with(resp_model)
+    def post(self):
+        kwargs = get_bulk_kwargs()  # rollbacks, the chunks are indexed with their own (see index_chunk())
+        chunk_size = int(app.config.get("STREAM_CHUNK_SIZE", 500))
+        bulk_limit = app.config.get("BULK_LIMIT", 1e+8)
+        rollback_limit = int(app.config.get("STREAM_ROLLBACK_LIMIT", 100000))
+
+        stream = request.stream  # decompressed by the DecompressedRequest middleware (Content-Encoding)
+
+        partial = is_partial_mode()
+        total = 0
+        failed = []
+        _delete_docs = []  # keep track of docs if they need to be rolled back (at most STREAM_ROLLBACK_LIMIT)
+        index_aliases = set()  # custom aliases, added once every chunk is indexed
+        metrics.inc('grq_ingest_requests_total', endpoint='stream')
+        try:
+            datasets = []
+            byte_count = 0
+            parse_time = 0.
+            for line in stream:
+                line = line.strip()
+                if not line:
+                    continue
+                t0 = time.perf_counter()
+                datasets.append(codec.loads(line))
+                parse_time += time.perf_counter() - t0
+                byte_count += len(line)
+                if len(datasets) < chunk_size and byte_count < bulk_limit:
+                    continue
+
+                error_list = self.index_chunk(datasets, partial, failed, _delete_docs, index_aliases, parse_time)
+                if error_list:
+                    return self.rollback(error_list, _delete_docs, **kwargs)
+                if len(_delete_docs) > rollback_limit:
+                    return self.rollback("stream larger than %d documents (STREAM_ROLLBACK_LIMIT), send it in smaller "
+                                         "requests or with ?partial=true" % rollback_limit, _delete_docs, **kwargs)
+                total += len(datasets)
+                datasets = []
+                byte_count = 0
+                parse_time = 0.
+
+            if datasets:
+                error_list = self.index_chunk(datasets, partial, failed, _delete_docs, index_aliases, parse_time)
+                if error_list:
+                    return self.rollback(error_list, _delete_docs, **kwargs)
+                total += len(datasets)
+
+            if partial is not True:
+                add_aliases(sorted(index_aliases))
+            if partial is True:
+                return partial_response(total - len(failed), failed)
+
+            app.logger.info("successfully indexed %d documents" % total)
+            return {
+                "success": True,
+                "message": "successfully indexed %d documents" % total,
+            }
+        except RequestEntityTooLarge as e:  # decompressed body larger than MAX_DECOMPRESSED_LENGTH
+            app.logger.error(e.description)
+            if _delete_docs:
+                app.logger.error("rolling back %d documents..." % len(_delete_docs))
+                rollback_docs(_delete_docs, **kwargs)
+            return {
+                'success': False,
+                'message': e.description
+            }, 413
+        except Exception as e:
+            message = f"Error: {type(e)}:{e}\n{traceback.format_exc()}"
+            app.logger.error(message)
+            if _delete_docs:
+                app.logger.error("rolling back %d documents..." % len(_delete_docs))
+                rollback_docs(_delete_docs, **kwargs)
+            return {
+                'success': False,
+                'message': message
+            }, 400
+
+    @staticmethod
+    def index_chunk(datasets, partial, failed, delete_docs, index_aliases, parse_time=0.):
+        """
+        the ingest pipeline is resolved once per chunk, the chunk is prepared and sent for the same pipeline
+        :param index_aliases: Set[Tuple[str, str]]; custom (index, alias) pairs of the stream, added to it (the aliases
+                              are added right away in partial mode, nothing is rolled back)
+        :return: List[Dict]; items with errors if the request needs to be rolled back
+        """
+        with metrics.context(**(dataset_labels(datasets) if metrics.enabled else {})):
+            metrics.observe('grq_ingest_stage_seconds', parse_time, stage='parse')
+            pipeline = get_ingest_pipeline()
+            kwargs = get_bulk_kwargs(pipeline)
+            docs_bulk, chunk_aliases = prepare_bulk(datasets, pipeline)
+            if partial is True:
+                _, chunk_failed = index_bulk_partial(docs_bulk, **kwargs)
+                failed.extend(chunk_failed)
+                add_aliases(chunk_aliases)
+                return []
+
+            index_aliases.update(chunk_aliases)
+            return index_bulk(docs_bulk, delete_docs, **kwargs)
+
+    @staticmethod
+    def rollback(error_list, delete_docs, **kwargs):
+        app.logger.error("ERROR indexing documents in Elasticsearch, rolling back...")
+        app.logger.error(error_list)
+        rollback_docs(delete_docs, **kwargs)
+        return {
+            "success": False,
+            "message": error_list,
+        }, 400
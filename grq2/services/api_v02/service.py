@@ -1,9 +1,10 @@
 from future import standard_library
 standard_library.install_aliases()
 
-from flask import Blueprint
+from flask import Blueprint, make_response
 from flask_restx import Api, apidoc, Namespace
 
+from grq2.lib.codec import dumpb
 from .specs import hysds_io_ns
 
 
@@ -13,6 +14,15 @@ api = Api(services, ui=False, version="0.2", title="GRQ API", description="API f
 NAMESPACE = "grq"
 grq_ns = Namespace(NAMESPACE, description="GRQ operations")
 
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    """marshalled responses are serialized with the JSON codec selected in settings.cfg (JSON_CODEC)"""
+    resp = make_response(dumpb(data) + b'\n', code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
 api.add_namespace(grq_ns)
 api.add_namespace(hysds_io_ns)
 
@@ -0,0 +1,19 @@
+from future import standard_library
+standard_library.install_aliases()
+from flask import Blueprint, Response
+
+from grq2.lib.metrics import metrics
+
+
+mod = Blueprint('services/metrics', __name__)
+
+
+@mod.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Ingest metrics in the Prometheus text format (METRICS_ENABLED), summed over the workers sharing METRICS_DIR, or of
+    this worker process only if METRICS_DIR is not set.
+    """
+    if not metrics.enabled:
+        return Response("metrics are disabled (METRICS_ENABLED)\n", status=404, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+from future import standard_library
+standard_library.install_aliases()
+
+import os
+import json
+import copy
+import time
+import argparse
+
+from grq2.lib import codec
+from grq2.lib.bulk import build_bulk_bodies
+
+
+'''
+micro-benchmark of the JSON codecs (see JSON_CODEC in settings.cfg) on HySDS dataset docs:
+    - decoding an ingest payload (POST /api/v0.2/grq/dataset/index)
+    - encoding the bulk request bodies
+    - encoding a search response (list of dataset docs)
+    - decoding the ES responses
+the docs are built from test/output.json (a dataset doc) with the fields added by GRQ (location, city, continent, ...)
+'''
+
+
+SAMPLE_DOC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test', 'output.json')
+
+
+def build_docs(path, count):
+    with open(path) as f:
+        template = json.load(f)
+    template.update({
+        'location': {
+            'type': 'polygon',
+            'coordinates': [[[-118.3, 34.1], [-117.9, 34.1], [-117.9, 34.4], [-118.3, 34.4], [-118.3, 34.1]]],
+        },
+        'center': {'type': 'point', 'coordinates': [-118.1, 34.25]},
+        'city': [{
+            'name': 'Pasadena', 'country_code': 'US', 'admin1_code': 'CA', 'population': 141029,
+            'location': {'lon': -118.14452, 'lat': 34.14778}, 'feature_class': 'P', 'feature_code': 'PPL',
+        }],
+        'continent': 'North America',
+        'temporal_span': 0,
+        '@timestamp': '2024-01-01T00:00:00.000Z',
+    })
+
+    docs = []
+    for i in range(count):
+        doc = copy.deepcopy(template)
+        doc['id'] = doc['objectid'] = '%s-%06d' % (template['id'], i)
+        docs.append(doc)
+    return docs
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+def run(docs, repeat):
+    payload = json.dumps(json.dumps(docs))  # the dataset index API receives a JSON encoded string
+    docs_bulk = []
+    for doc in docs:
+        docs_bulk.append({'index': {'_index': 'grq_v1.0_dataset', '_id': doc['id']}})
+        docs_bulk.append(doc)
+    search_response = {'hits': {'total': {'value': len(docs)}, 'hits': [{'_source': doc} for doc in docs]}}
+    raw_response = json.dumps(search_response)
+
+    return {
+        'ingest payload (loads)': best_of(lambda: codec.loads(codec.loads(payload)), repeat),
+        'bulk bodies (dumps)': best_of(lambda: build_bulk_bodies(docs_bulk), repeat),
+        'API response (dumps)': best_of(lambda: codec.dumpb(search_response, sort_keys=True), repeat),
+        'ES response (loads)': best_of(lambda: codec.loads(raw_response), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark of the JSON codecs on HySDS dataset docs")
+    parser.add_argument('--docs', type=int, default=1000, help="number of dataset docs")
+    parser.add_argument('--repeat', type=int, default=5, help="best of N runs")
+    parser.add_argument('--sample', default=SAMPLE_DOC, help="dataset doc used as template")
+    args = parser.parse_args()
+
+    docs = build_docs(args.sample, args.docs)
+    print("%d docs, %.1f MB" % (len(docs), len(json.dumps(docs)) / 1e6))
+
+    results = {}
+    for name in codec.available_codecs():
+        codec.set_codec(name)
+        results[name] = run(docs, args.repeat)
+
+    baseline = results[codec.DEFAULT_CODEC]
+    for name, timings in results.items():
+        print("\n%s" % name)
+        for op, seconds in timings.items():
+            print("  %-24s %9.2f ms  (x%.1f)" % (op, seconds * 1000, baseline[op] / seconds))
+
+
+if __name__ == '__main__':
+    main()
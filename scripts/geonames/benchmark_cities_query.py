@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+from future import standard_library
+standard_library.install_aliases()
+
+import json
+import math
+import time
+import random
+import argparse
+
+from grq2 import app, grq_es
+from grq2.lib.geonames import CitiesQueryPlan, GEO_POLYGON_PLAN, cities_query, get_cities_index
+
+
+'''
+benchmark of the get_cities() query plans (GEONAMES_CITIES_* in settings.cfg) against the geonames (cities) index, on
+dense SAR like footprints: swaths (~250 x 170 km) whose outline has thousands of jittered vertices (as the footprints
+traced from the valid data of a frame), optionally split into burst polygons (multipolygon)
+    geo_polygon:                1 geo_polygon per ring (OR-ed for multipolygons), the query before the planner
+    bbox prefilter:             geo_bounding_box of the footprint envelope + geo_polygon
+    bbox + geo_shape:           geo_bounding_box + single geo_shape intersects query
+    bbox + geo_shape + simplify: same, with the footprints simplified down to --max-vertices
+
+the footprints are centered on random populated places, each query runs with the request cache disabled (best of
+--repeat), the cities found by each plan are compared with the geo_polygon ones
+'''
+
+
+EARTH_KM_PER_DEGREE = 111.32
+
+
+def sample_places(es, index, count, seed):
+    """
+    :return: List[Tuple[float, float]]; (lon, lat) of random populated places
+    """
+    query = {
+        "size": count,
+        "_source": ["location"],
+        "query": {
+            "function_score": {
+                "query": {
+                    "bool": {
+                        "filter": [
+                            {"term": {"feature_class": "P"}},
+                            {"range": {"population": {"gte": 1000}}}
+                        ]
+                    }
+                },
+                "random_score": {"seed": seed, "field": "_seq_no"}
+            }
+        }
+    }
+    res = es.search(index=index, body=query)
+    return [(hit['_source']['location']['lon'], hit['_source']['location']['lat']) for hit in res['hits']['hits']]
+
+
+def sar_footprint(rng, lon, lat, vertices, parts=1, length_km=250., width_km=170., jitter_km=0.2):
+    """
+    :param rng: random.Random
+    :param lon: float, center of the footprint
+    :param lat: float
+    :param vertices: int, total number of vertices
+    :param parts: int, number of bursts (> 1: multipolygon)
+    :return: Tuple[List, bool]; get_cities() polygon & multipolygon arguments
+    """
+    heading = math.radians(rng.choice((-12., 12.)) + rng.uniform(-2., 2.))  # ascending/descending track
+    km_lat = 1. / EARTH_KM_PER_DEGREE
+    km_lon = 1. / (EARTH_KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.1))
+    per_edge = max(2, vertices // parts // 4)
+
+    rings = []
+    for k in range(parts):
+        y0 = -length_km / 2 + k * length_km / parts
+        y1 = y0 + length_km / parts * 1.05  # bursts overlap
+        corners = [(-width_km / 2, y0), (width_km / 2, y0), (width_km / 2, y1), (-width_km / 2, y1)]
+        ring = []
+        for (x0, y0_), (x1, y1_) in zip(corners, corners[1:] + corners[:1]):
+            for i in range(per_edge):
+                t = i / per_edge
+                x = x0 + (x1 - x0) * t + rng.uniform(-jitter_km, jitter_km)
+                y = y0_ + (y1_ - y0_) * t + rng.uniform(-jitter_km, jitter_km)
+                east = x * math.cos(heading) + y * math.sin(heading)
+                north = -x * math.sin(heading) + y * math.cos(heading)
+                ring.append([lon + east * km_lon, max(-90., min(90., lat + north * km_lat))])
+        ring.append(ring[0])
+        rings.append(ring)
+    return (rings, True) if parts > 1 else (rings[0], False)
+
+
+def run_plan(es, index, footprints, plan, size, repeat):
+    """
+    :return: Dict; server (took) & client timings (ms) per footprint, cities found, query body sizes
+    """
+    took, wall, cities, body_bytes = [], [], [], 0
+    for polygon, multipolygon in footprints:
+        query = cities_query(polygon, size=size, multipolygon=multipolygon, plan=plan)
+        body_bytes += len(json.dumps(query))
+        best_took = best_wall = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            res = es.search(index=index, body=query, request_cache=False)
+            elapsed = (time.perf_counter() - t0) * 1000
+            best_took = res['took'] if best_took is None else min(best_took, res['took'])
+            best_wall = elapsed if best_wall is None else min(best_wall, elapsed)
+        took.append(best_took)
+        wall.append(best_wall)
+        cities.append([hit['_id'] for hit in res['hits']['hits']])
+    return {'took': took, 'wall': wall, 'cities': cities, 'body_bytes': body_bytes}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100. * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark of the get_cities() query plans on dense SAR footprints")
+    parser.add_argument('--index', default=get_cities_index(), help="geonames (cities) index")
+    parser.add_argument('--footprints', type=int, default=100, help="number of footprints")
+    parser.add_argument('--vertices', type=int, default=4000, help="vertices per footprint")
+    parser.add_argument('--parts', type=int, default=1, help="burst polygons per footprint (> 1: multipolygons)")
+    parser.add_argument('--max-vertices', type=int, default=500, help="simplify plan: max vertices per footprint")
+    parser.add_argument('--tolerance', type=float, default=app.config.get('GEONAMES_CITIES_SIMPLIFY_TOLERANCE', 0.0005),
+                        help="simplify plan: initial tolerance (degrees)")
+    parser.add_argument('--size', type=int, default=5, help="cities per footprint")
+    parser.add_argument('--repeat', type=int, default=3, help="best of N runs per query")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    es = grq_es.es
+    rng = random.Random(args.seed)
+    centers = sample_places(es, args.index, args.footprints, args.seed)
+    while len(centers) < args.footprints:  # not enough populated places indexed
+        centers.append((rng.uniform(-180., 180.), rng.uniform(-60., 70.)))
+    footprints = [sar_footprint(rng, lon, lat, args.vertices, parts=args.parts) for lon, lat in centers]
+    print("%d footprints, %d vertices, %d part(s) each, index %s" %
+          (len(footprints), args.vertices, args.parts, args.index))
+
+    plans = [
+        ('geo_polygon', GEO_POLYGON_PLAN),
+        ('bbox prefilter', CitiesQueryPlan(True, False, None, args.tolerance)),
+        ('bbox + geo_shape', CitiesQueryPlan(True, True, None, args.tolerance)),
+        ('bbox + geo_shape + simplify', CitiesQueryPlan(True, True, args.max_vertices, args.tolerance)),
+    ]
+
+    baseline = None
+    print("\n  %-28s %10s %10s %10s %10s %10s" % ('plan', 'took p50', 'took p95', 'wall p50', 'body KB', 'diffs'))
+    for name, plan in plans:
+        try:
+            result = run_plan(es, args.index, footprints, plan, args.size, args.repeat)
+        except Exception as e:  # ex. geo_shape on geo_point not supported by the cluster
+            print("  %-28s failed: %s" % (name, str(e)[:200]))
+            continue
+        if baseline is None:
+            baseline = result
+        diffs = sum(1 for a, b in zip(result['cities'], baseline['cities']) if a != b)
+        print("  %-28s %8.1f ms %8.1f ms %8.1f ms %10.1f %10d" % (
+            name, percentile(result['took'], 50), percentile(result['took'], 95), percentile(result['wall'], 50),
+            result['body_bytes'] / 1024. / len(footprints), diffs))
+
+
+if __name__ == '__main__':
+    main()
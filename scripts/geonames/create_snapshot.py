@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+from future import standard_library
+standard_library.install_aliases()
+
+import gzip
+import json
+import argparse
+from datetime import datetime
+
+from elasticsearch import Elasticsearch, helpers as es_helpers
+from opensearchpy import helpers as os_helpers
+
+from grq2 import app, grq_es
+
+
+'''
+dumps the geonames docs needed for reverse geocoding (populated places & continents) into a newline delimited JSON
+file, set GEONAMES_SNAPSHOT in settings.cfg to its path to geocode datasets in memory (see grq2.lib.geocoder)
+'''
+
+
+QUERY = {
+    "query": {
+        "bool": {
+            "should": [
+                {
+                    "bool": {
+                        "filter": [
+                            {"term": {"feature_class": "P"}},
+                            {"range": {"population": {"gte": 1}}}
+                        ]
+                    }
+                },
+                {
+                    "bool": {
+                        "filter": [
+                            {"term": {"feature_class": "L"}},
+                            {"term": {"feature_code": "CONT"}}
+                        ]
+                    }
+                }
+            ],
+            "minimum_should_match": 1
+        }
+    }
+}
+
+
+def create_snapshot(es, index, output_file, size=5000):
+    """
+    :param es: elasticsearch/opensearch client
+    :param index: str; geonames index
+    :param output_file: str; gzip compressed if ends with .gz
+    :param size: int; scroll size
+    :return: int, number of docs written
+    """
+    helpers = es_helpers if isinstance(es, Elasticsearch) else os_helpers
+    opener = gzip.open if output_file.endswith('.gz') else open
+
+    count = 0
+    with opener(output_file, 'wt') as f:
+        for doc in helpers.scan(es, index=index, query=QUERY, size=size, scroll='10m'):
+            f.write(json.dumps(doc['_source']) + '\n')
+            count += 1
+            if count % 100000 == 0:
+                print('%d documents written at %s' % (count, datetime.now().isoformat()))
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create snapshot of the geonames index for in-memory geocoding')
+    parser.add_argument('--index', type=str, default=app.config['GEONAMES_INDEX'], help="geonames index")
+    parser.add_argument('--output', type=str, default='geonames_snapshot.jsonl.gz', help="snapshot file")
+    parser.add_argument('--size', type=int, default=5000, help="scroll size")
+    args = parser.parse_args()
+
+    print("script start time: %s" % datetime.now().isoformat())
+    total = create_snapshot(grq_es.es, args.index, args.output, size=args.size)
+    print("%d documents written to %s at %s" % (total, args.output, datetime.now().isoformat()))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+from future import standard_library
+standard_library.install_aliases()
+
+import argparse
+
+from grq2 import app, grq_es
+from grq2.lib.geonames import load_continents, get_cities_index
+from grq2.lib.pipeline import DEFAULT_PIPELINE, ENRICH_SHAPE_FIELD, install_enrich_pipeline
+
+
+'''
+manages the geo_match enrich policy used to reverse geocode the datasets on the ES ingest nodes
+(GEONAMES_ENRICH_POLICY in settings.cfg, Elasticsearch 7.5+ only, Opensearch has no enrich processor)
+
+    create:  copies the populated places of the geonames index into GEONAMES_ENRICH_INDEX (with a geo_shape field),
+             creates & executes the enrich policy and installs the ingest pipeline (INGEST_PIPELINE)
+    refresh: re-copies the populated places and re-executes the policy, to run after the geonames index is updated
+
+the enrich processor returns at most 128 matches per dataset (geo_match max_matches limit), in no particular order:
+footprints holding more populated places get their cities out of an arbitrary subset of 128 of them
+'''
+
+
+POPULATED_PLACES_QUERY = {
+    "bool": {
+        "filter": [
+            {"term": {"feature_class": "P"}},
+            {"range": {"population": {"gte": 1}}}
+        ]
+    }
+}
+
+# geo_match needs a geo_shape field in the source index, the geonames index has a geo_point
+SHAPE_SCRIPT = "ctx._source.%s = ['type': 'point', 'coordinates': [ctx._source.location.lon, ctx._source.location.lat]]"
+
+SOURCE_MAPPING = {
+    "properties": {
+        ENRICH_SHAPE_FIELD: {"type": "geo_shape"},
+        "location": {"type": "geo_point"},
+        "population": {"type": "long"},
+    }
+}
+
+ENRICH_FIELDS = [
+    'geonameid', 'name', 'asciiname', 'alternatename', 'latitude', 'longitude', 'feature_class', 'feature_code',
+    'country_code', 'cc2', 'admin1_code', 'admin2_code', 'admin3_code', 'admin4_code', 'population', 'elevation',
+    'dem', 'timezone', 'modification_date', 'location', 'continent_code', 'continent_name', 'country_name',
+    'admin1_name', 'admin2_name'
+]
+
+
+def build_source_index(es, geonames_index, source_index):
+    """
+    (re)creates the enrich source index from the populated places of the geonames index
+    :param es: elasticsearch client
+    :param geonames_index: str
+    :param source_index: str
+    """
+    es.indices.delete(index=source_index, ignore=404)
+    es.indices.create(index=source_index, body={"mappings": SOURCE_MAPPING})
+    body = {
+        "source": {"index": geonames_index, "query": POPULATED_PLACES_QUERY},
+        "dest": {"index": source_index},
+        "script": {"lang": "painless", "source": SHAPE_SCRIPT % ENRICH_SHAPE_FIELD}
+    }
+    res = es.reindex(body=body, wait_for_completion=True, request_timeout=3600)
+    if res.get('failures'):
+        raise RuntimeError("failed to copy the populated places into %s: %s" % (source_index, res['failures'][:10]))
+    es.indices.refresh(index=source_index)
+    print("copied %d populated places into %s" % (res['created'] + res.get('updated', 0), source_index))
+
+
+def create_policy(es, policy, source_index):
+    """enrich policies can't be updated, an existing policy is kept (delete it and its pipelines to change it)"""
+    if es.enrich.get_policy(name=policy).get('policies'):
+        print("enrich policy %s already exists" % policy)
+        return
+
+    body = {
+        "geo_match": {
+            "indices": source_index,
+            "match_field": ENRICH_SHAPE_FIELD,
+            "enrich_fields": ENRICH_FIELDS
+        }
+    }
+    es.enrich.put_policy(name=policy, body=body)
+    print("created enrich policy %s" % policy)
+
+
+def execute_policy(es, policy):
+    es.enrich.execute_policy(name=policy, wait_for_completion=True, request_timeout=3600)
+    print("executed enrich policy %s" % policy)
+
+
+def manage_policy(es, action, policy, source_index, geonames_index):
+    """
+    :param es: elasticsearch client
+    :param action: str, create or refresh
+    :param policy: str, enrich policy name
+    :param source_index: str, enrich source index
+    :param geonames_index: str, index of the populated places (compact cities index if set)
+    """
+    build_source_index(es, geonames_index, source_index)
+
+    if action == 'create':
+        create_policy(es, policy, source_index)
+    execute_policy(es, policy)  # the pipelines using the policy pick up the new enrich index
+
+    if action == 'create':
+        pipeline = app.config.get('INGEST_PIPELINE', None) or DEFAULT_PIPELINE
+        install_enrich_pipeline(es, pipeline, date_parts=app.config.get('INGEST_PIPELINE_DATE_PARTS', False),
+                                geo_policy=policy, continents=load_continents())
+        print("installed ingest pipeline %s" % pipeline)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="manages the geonames enrich policy (server-side reverse geocoding)")
+    parser.add_argument('action', choices=['create', 'refresh'])
+    parser.add_argument('--policy', default=app.config.get('GEONAMES_ENRICH_POLICY', None) or 'geonames_cities')
+    parser.add_argument('--source-index', default=app.config.get('GEONAMES_ENRICH_INDEX', 'geonames_enrich'))
+    args = parser.parse_args()
+
+    manage_policy(grq_es.es, args.action, args.policy, args.source_index, get_cities_index())
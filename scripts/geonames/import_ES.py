@@ -2,14 +2,20 @@
 from future import standard_library
 standard_library.install_aliases()
 
+import os
+import json
+import time
 import traceback
 import argparse
-from datetime import datetime
+from collections import deque
+from datetime import date, datetime, timedelta
 import urllib3
 
 import boto3
-from elasticsearch import Elasticsearch
-from opensearchpy import OpenSearch, AWSV4SignerAuth
+from elasticsearch import Elasticsearch, helpers as es_helpers
+from opensearchpy import OpenSearch, AWSV4SignerAuth, helpers as os_helpers
+
+from row_parser import parse_blocks
 
 urllib3.disable_warnings()
 
@@ -74,6 +80,7 @@ FIELD_NAMES = [
 
 
 INDEX = 'geonames'
+WATERMARK_KEY = 'delta_watermark'  # _meta key of the last daily modifications applied
 MAPPING = {
     'properties': {
         'geonameid': {'type': 'keyword'},
@@ -126,6 +133,37 @@ MAPPING = {
 }
 
 
+# compact index of the populated places queried when reverse geocoding datasets (GEONAMES_CITIES_INDEX), only the
+# fields the queries use are indexed (the docs are kept whole in _source) and the segments are sorted by population
+CITIES_QUERY = {
+    'bool': {
+        'filter': [
+            {'term': {'feature_class': 'P'}},
+            {'range': {'population': {'gte': 1}}}
+        ]
+    }
+}
+CITIES_MAPPING = {
+    'dynamic': False,
+    'properties': {
+        'geonameid': {'type': 'keyword'},
+        'feature_class': {'type': 'keyword'},
+        'feature_code': {'type': 'keyword'},
+        'country_code': {'type': 'keyword'},
+        'population': {'type': 'long'},
+        'location': {'type': 'geo_point'},
+    }
+}
+
+
+def is_populated_place(row):
+    """
+    :param row: Dict; geonames doc
+    :return: bool, True if the doc belongs in the cities index (same filter as CITIES_QUERY)
+    """
+    return row.get('feature_class') == 'P' and (row.get('population') or 0) >= 1
+
+
 def get_admin_dict(admin_file):
     d = {}
     with open(admin_file) as f:
@@ -158,99 +196,359 @@ def create_geonames_mapping(es):
     print('%s index created!!' % INDEX)
 
 
-def parse(es, csv_file, start_position=0):
+def get_watermark(es, index=INDEX):
     """
-    index geonames docs into the geonames index
-    :param csv_file: string
+    :param es: elasticsearch/opensearch client
+    :param index: str
+    :return: date, last day of the geonames modifications applied to the index (see update_deltas.py), None if unknown
+    """
+    res = es.indices.get_mapping(index=index)
+    meta = next(iter(res.values()))['mappings'].get('_meta', {})
+    value = meta.get(WATERMARK_KEY)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def set_watermark(es, day, index=INDEX):
+    """
+    records the watermark in the index mapping's _meta, so it goes away with the index (a full reload sets a new one)
+    :param es: elasticsearch/opensearch client
+    :param day: date
+    :param index: str
+    """
+    res = es.indices.get_mapping(index=index)
+    meta = next(iter(res.values()))['mappings'].get('_meta', {})
+    meta[WATERMARK_KEY] = day.isoformat()
+    es.indices.put_mapping(index=index, body={'_meta': meta})
+
+
+def dump_watermark(csv_file):
+    """
+    :param csv_file: str; allCountries.txt (wget keeps the server's modification time)
+    :return: date, the day before the dump was generated, its modifications may be missing from the dump
+    """
+    return date.fromtimestamp(os.path.getmtime(csv_file)) - timedelta(days=1)
+
+
+def parse_row(line, adm1, adm2, cntries):
+    """
+    :param line: str; allCountries.txt line
+    :param adm1: Dict; see get_admin_dict()
+    :param adm2: Dict
+    :param cntries: Dict; see get_country_dict()
+    :return: Dict; geonames doc
+    """
+    row = dict(list(zip(FIELD_NAMES, line.strip().split('\t'))))  # creates a dictionary per row
+
+    for k in row:
+        if row[k] == '':
+            if k in ('alternatename', 'cc2'):
+                row[k] = []
+            else:
+                row[k] = None
+        else:
+            if k in ('alternatename', 'cc2'):
+                row[k] = list(map(str.strip, row[k].split(',')))
+        if k in ('latitude', 'longitude'):
+            row[k] = float(row[k])
+        if k in ('population', 'elevation'):
+            if row[k] is not None:
+                row[k] = int(row[k])
+
+    # add geo_point location for spatial query
+    row['location'] = {
+        'lon':  row['longitude'],
+        'lat':  row['latitude']
+    }
+
+    # add continent, adm1 and amd2 names
+    row['continent_code'] = None
+    row['continent_name'] = None
+    row['country_name'] = row['country_code']
+    row['admin1_name'] = None
+    row['admin2_name'] = None
+    if row['country_code'] is not None:
+        if row['country_code'] in cntries:
+            row['country_name'] = cntries[row['country_code']][3]
+            row['continent_code'] = cntries[row['country_code']][7]
+            row['continent_name'] = CONTINENT_CODES[row['continent_code']]
+        if row['admin1_code'] is not None:
+            adm1_code = '{}.{}'.format(
+                row['country_code'], row['admin1_code'])
+            row['admin1_name'] = adm1.get(adm1_code, [None])[0]
+            if row['admin2_code'] is not None:
+                adm2_code = '{}.{}'.format(
+                    adm1_code, row['admin2_code'])
+                row['admin2_name'] = adm2.get(adm2_code, [None])[0]
+    return row
+
+
+def read_lines(csv_file, start_position=0):
+    """
+    :param csv_file: str
+    :param start_position: int, byte offset to start at
+    :return: Generator[Tuple[str, int]]; non empty lines and the byte offset following each of them
+    """
+    with open(csv_file, 'rb') as f:
+        f.seek(start_position)
+        position = start_position
+        for line in f:
+            position += len(line)
+            if line.strip():
+                yield line.decode('utf-8'), position
+
+
+def load_checkpoint(checkpoint_file, csv_file):
+    """
+    :param checkpoint_file: str
+    :param csv_file: str
+    :return: Dict, state saved by save_checkpoint() (None if missing, or saved for another version of csv_file)
+    """
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file) as f:
+        state = json.load(f)
+
+    stat = os.stat(csv_file)
+    if state.get('size') != stat.st_size or state.get('mtime') != int(stat.st_mtime):
+        print('checkpoint %s was saved for another version of %s, ignoring it' % (checkpoint_file, csv_file))
+        return {'settings': state.get('settings')}
+    return state
+
+
+def save_checkpoint(checkpoint_file, csv_file, position, docs, settings):
+    """
+    records the byte offset up to which every line of csv_file is indexed (written atomically)
+    :param checkpoint_file: str
+    :param csv_file: str
+    :param position: int
+    :param docs: int, number of docs indexed so far
+    :param settings: Dict; index settings to restore once loaded (see get_index_settings())
+    """
+    stat = os.stat(csv_file)
+    state = {
+        'file': os.path.abspath(csv_file),
+        'size': stat.st_size,
+        'mtime': int(stat.st_mtime),
+        'position': position,
+        'docs': docs,
+        'settings': settings,
+        'updated': datetime.now().isoformat(),
+    }
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def get_index_settings(es, index):
+    """
+    :return: Dict; refresh_interval and number_of_replicas of the index (None if not set explicitly)
+    """
+    res = es.indices.get_settings(index=index, flat_settings=True)
+    settings = next(iter(res.values()))['settings']
+    return {
+        'refresh_interval': settings.get('index.refresh_interval'),
+        'number_of_replicas': settings.get('index.number_of_replicas'),
+    }
+
+
+def set_index_settings(es, index, settings):
+    """
+    :param settings: Dict; refresh_interval and number_of_replicas, None resets a setting to its default
+    """
+    es.indices.put_settings(index=index, body={'index': settings})
+
+
+class Throughput:
+    """docs and bytes per second since the start of the load (not counting what was loaded before resuming)"""
+
+    def __init__(self, start_docs, start_position, total_bytes):
+        self.t0 = time.time()
+        self.start_docs = start_docs
+        self.start_position = start_position
+        self.total_bytes = total_bytes
+
+    def report(self, docs, failed, position):
+        elapsed = max(time.time() - self.t0, 1e-6)
+        rate = (docs - self.start_docs) / elapsed
+        read = position - self.start_position
+        return '%d documents (%d failed) in %.0fs, %.0f docs/s, %.1f MB/s, position %d (%.1f%%)' % (
+            docs, failed, elapsed, rate, read / elapsed / 1e6, position, 100. * position / max(self.total_bytes, 1))
+
+
+def parse(es, csv_file, start_position=0, workers=4, chunk_size=5000, max_chunk_bytes=10 * 1024 * 1024,
+          checkpoint_file=None, checkpoint_every=100000, restart=False, parse_workers=0, failed_file=None):
+    """
+    index geonames docs into the geonames index with parallel bulk requests
+        the byte offset up to which every line is indexed is saved to checkpoint_file, a new run resumes from it
+        the checkpoint doesn't move past a failed doc, the load goes on and fails at the end (re-run to retry)
+        refresh and replicas are turned off during the load and restored afterwards (also if the load fails)
     :param es: elasticsearch-py's es object
-    :param start_position: file position to start loop at (if we don't want to start from the beginning)
-    :return:
+    :param csv_file: string
+    :param start_position: file position to start at (overrides the checkpoint)
+    :param workers: int, number of bulk requests in flight
+    :param chunk_size: int, docs per bulk request
+    :param max_chunk_bytes: int, max size of a bulk request
+    :param checkpoint_file: str, defaults to <csv_file>.checkpoint
+    :param checkpoint_every: int, docs between checkpoints
+    :param restart: bool, ignore the checkpoint and start from the beginning (or start_position)
+    :param parse_workers: int, number of processes parsing the file (see row_parser.py), 0 to parse in this process
+    :param failed_file: str, bulk errors of the failed docs (JSON lines), defaults to <csv_file>.failed
+    :return: int, docs indexed
     """
+    helpers = es_helpers if isinstance(es, Elasticsearch) else os_helpers
+    checkpoint_file = checkpoint_file or csv_file + '.checkpoint'
+    failed_file = failed_file or csv_file + '.failed'
+
     adm1 = get_admin_dict('admin1CodesASCII.txt')  # get adm dicts
     adm2 = get_admin_dict('admin2Codes.txt')
     cntries = get_country_dict('countryInfo.txt')  # get country dict
 
-    line_number = 0
-    line_position = 0  # tracking line_position in case we don't want to start from the beginning
+    state = load_checkpoint(checkpoint_file, csv_file) or {}
+    docs = 0
+    if start_position == 0 and not restart and state.get('position'):
+        start_position = state['position']
+        docs = state.get('docs', 0)
+        print('resuming from checkpoint %s: position %d, %d documents indexed' %
+              (checkpoint_file, start_position, docs))
+
+    # a checkpoint left by an interrupted load has the settings from before the load
+    settings = state.get('settings') or get_index_settings(es, INDEX)
+    set_index_settings(es, INDEX, {'refresh_interval': '-1', 'number_of_replicas': 0})
+    save_checkpoint(checkpoint_file, csv_file, start_position, docs, settings)
+
+    # offset following each queued doc (None within a parsed block), the bulk results come back in the same order
+    positions = deque()
+
+    def _actions():
+        if parse_workers > 0:
+            tables = (FIELD_NAMES, CONTINENT_CODES, adm1, adm2, cntries)
+            for end_position, block in parse_blocks(csv_file, tables, start_position, workers=parse_workers):
+                for i, (geonameid, source) in enumerate(block, 1):
+                    positions.append(end_position if i == len(block) else None)
+                    yield {'_index': INDEX, '_id': geonameid, '_source': source}  # JSON encoded by the workers
+            return
+
+        for line, end_position in read_lines(csv_file, start_position):
+            row = parse_row(line, adm1, adm2, cntries)
+            positions.append(end_position)
+            yield {'_index': INDEX, '_id': row['geonameid'], '_source': row}
+
+    stats = Throughput(docs, start_position, os.path.getsize(csv_file))
+    failed = 0
+    position = start_position
+    position_docs = docs  # docs up to position
     try:
-        with open(csv_file) as f:
-            if start_position > 0:
-                f.seek(start_position)  # if we do not want to start from beginning
-
-            while True:
-                line_position = f.tell()  # change current line position
-                line = f.readline()
-                if not line:
-                    break
-
-                row = dict(list(zip(FIELD_NAMES, line.strip().split('\t'))))  # creates a dictionary per row
-                line_number += 1
-
-                for k in row:
-                    if row[k] == '':
-                        if k in ('alternatename', 'cc2'):
-                            row[k] = []
-                        else:
-                            row[k] = None
-                    else:
-                        if k in ('alternatename', 'cc2'):
-                            row[k] = list(map(str.strip, row[k].split(',')))
-                    if k in ('latitude', 'longitude'):
-                        row[k] = float(row[k])
-                    if k in ('population', 'elevation'):
-                        if row[k] is not None:
-                            row[k] = int(row[k])
-
-                # add geo_point location for spatial query
-                row['location'] = {
-                    'lon':  row['longitude'],
-                    'lat':  row['latitude']
-                }
-
-                # add continent, adm1 and amd2 names
-                row['continent_code'] = None
-                row['continent_name'] = None
-                row['country_name'] = row['country_code']
-                row['admin1_name'] = None
-                row['admin2_name'] = None
-                if row['country_code'] is not None:
-                    if row['country_code'] in cntries:
-                        row['country_name'] = cntries[row['country_code']][3]
-                        row['continent_code'] = cntries[row['country_code']][7]
-                        row['continent_name'] = CONTINENT_CODES[row['continent_code']]
-                    if row['admin1_code'] is not None:
-                        adm1_code = '{}.{}'.format(
-                            row['country_code'], row['admin1_code'])
-                        row['admin1_name'] = adm1.get(adm1_code, [None])[0]
-                        if row['admin2_code'] is not None:
-                            adm2_code = '{}.{}'.format(
-                                adm1_code, row['admin2_code'])
-                            row['admin2_name'] = adm2.get(adm2_code, [None])[0]
-
-                es.index(index=INDEX, id=row['geonameid'], body=row)
-                if line_number % 10000 == 0:
-                    print('%d documents ingested at %s, position: %d' % (line_number, datetime.now().isoformat(),
-                                                                         line_position))
-    except Exception as e:
+        with open(failed_file, 'w') as failed_out:
+            results = helpers.parallel_bulk(es, _actions(), thread_count=workers, chunk_size=chunk_size,
+                                            max_chunk_bytes=max_chunk_bytes, queue_size=workers, raise_on_error=False)
+            for ok, item in results:
+                end_position = positions.popleft()
+                docs += 1
+                if not ok:
+                    failed += 1
+                    failed_out.write(json.dumps(item) + '\n')
+                    if failed <= 10:
+                        print('failed to index document: %s' % json.dumps(item))
+                elif end_position is not None and failed == 0:
+                    position, position_docs = end_position, docs
+                if docs % checkpoint_every == 0:
+                    failed_out.flush()
+                    save_checkpoint(checkpoint_file, csv_file, position, position_docs, settings)
+                    print('%s, at %s' % (stats.report(docs, failed, position), datetime.now().isoformat()))
+    except BaseException:
         traceback.print_exc()
-        print('line_number: %d' % line_number)
-        print('failed position %d' % line_position)
-        print('failed at %s' % datetime.now().isoformat())
-        raise e
-
-
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Create and populate geonames index')
+        save_checkpoint(checkpoint_file, csv_file, position, position_docs, settings)
+        print('failed at %s, position %d saved to %s (re-run to resume)' %
+              (datetime.now().isoformat(), position, checkpoint_file))
+        raise
+    finally:
+        set_index_settings(es, INDEX, settings)
+
+    es.indices.refresh(index=INDEX)
+    print(stats.report(docs, failed, position))
+    if failed > 0:
+        save_checkpoint(checkpoint_file, csv_file, position, position_docs, settings)
+        raise RuntimeError("%d documents failed (see %s), checkpoint left at position %d in %s (re-run to retry)" %
+                           (failed, failed_file, position, checkpoint_file))
+    os.remove(checkpoint_file)
+    os.remove(failed_file)
+    return docs
+
+
+def build_cities_index(es, alias, shards=1, replicas=1, source_index=INDEX):
+    """
+    (re)builds the compact cities index from the geonames index, a new index is filled then swapped into the alias so
+    the lookups are never without an index
+        a concrete index named like the alias (ie. created before the alias was used) is replaced by the alias in the
+        same atomic swap
+    :param es: elasticsearch/opensearch client
+    :param alias: str; GEONAMES_CITIES_INDEX
+    :param shards: int, number of primary shards (the populated places fit in 1)
+    :param replicas: int, number of replicas once built
+    :param source_index: str
+    :return: str, name of the new index
+    """
+    is_alias = es.indices.exists_alias(name=alias)
+    concrete = not is_alias and es.indices.exists(index=alias)
+    if concrete:
+        print('%s is an index, it will be replaced by an alias of the new cities index' % alias)
+
+    index = '%s_%s' % (alias, datetime.now().strftime('%Y%m%d%H%M%S'))
+    body = {
+        'settings': {
+            'index': {
+                'number_of_shards': shards,
+                'number_of_replicas': 0,
+                'refresh_interval': '-1',
+                'sort.field': 'population',
+                'sort.order': 'desc',
+            }
+        },
+        'mappings': CITIES_MAPPING
+    }
+    es.indices.create(index=index, body=body)
 
+    reindex_body = {
+        'source': {'index': source_index, 'query': CITIES_QUERY, 'size': 5000},
+        'dest': {'index': index}
+    }
+    res = es.reindex(body=reindex_body, wait_for_completion=True, request_timeout=3600)
+    if res.get('failures'):
+        raise RuntimeError("failed to copy the populated places into %s: %s" % (index, res['failures'][:10]))
+
+    set_index_settings(es, index, {'refresh_interval': None, 'number_of_replicas': replicas})
+    es.indices.forcemerge(index=index, max_num_segments=1, request_timeout=3600)
+    es.indices.refresh(index=index)
+
+    previous = list(es.indices.get_alias(name=alias).keys()) if is_alias else []
+    actions = [{'remove': {'index': i, 'alias': alias}} for i in previous]
+    if concrete:
+        actions.append({'remove_index': {'index': alias}})
+    actions.append({'add': {'index': index, 'alias': alias}})
+    es.indices.update_aliases(body={'actions': actions})
+    for i in previous:
+        es.indices.delete(index=i, ignore=404)
+    print('%d populated places indexed into %s (alias %s)' % (res['created'] + res.get('updated', 0), index, alias))
+    return index
+
+
+def add_es_arguments(parser):
+    """
+    :param parser: argparse.ArgumentParser; adds the ES connection arguments (see get_es_client())
+    """
     parser.add_argument('--engine', type=str, default="elasticsearch", help="elasticsearch/opensearch")
     parser.add_argument('--es-url', action='store', default='http://localhost:9200', help="ES endpoint")
     parser.add_argument('--aws', action='store_true', default=False, help="AWS managed Elasticsearch/OpenSearch")
     parser.add_argument('--region', action='store', default='us-west-1', help="AWS region")
     parser.add_argument('--verify-certs', action='store_true', default=False, help='verify SSL if using https')
-    parser.add_argument('--start-position', type=int, default=0, help='file position to start at')
 
-    args = parser.parse_args()
 
+def get_es_client(args):
+    """
+    :param args: argparse.Namespace; see add_es_arguments()
+    :return: elasticsearch/opensearch client
+    """
     region = args.region  # us-west-1
     engine = args.engine
     aws = args.aws
@@ -294,9 +592,53 @@ if __name__ == '__main__':
             )
         else:
             grq_es = Elasticsearch([es_url])
+    return grq_es
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create and populate geonames index')
+
+    add_es_arguments(parser)
+    parser.add_argument('--start-position', type=int, default=0,
+                        help='file position to start at (default: resume from the checkpoint, if any)')
+    parser.add_argument('--workers', type=int, default=4, help='number of bulk requests in flight')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='documents per bulk request')
+    parser.add_argument('--max-chunk-bytes', type=int, default=10 * 1024 * 1024, help='max size of a bulk request')
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help='checkpoint file (default: allCountries.txt.checkpoint)')
+    parser.add_argument('--checkpoint-every', type=int, default=100000, help='documents between checkpoints')
+    parser.add_argument('--restart', action='store_true', default=False, help='ignore the checkpoint')
+    parser.add_argument('--failed-file', type=str, default=None,
+                        help='bulk errors of the failed documents (default: allCountries.txt.failed)')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='number of processes parsing the file (0: parse in the loading process)')
+    parser.add_argument('--cities-index', type=str, default=None,
+                        help='alias of the compact populated places index built after the load '
+                             '(GEONAMES_CITIES_INDEX)')
+    parser.add_argument('--cities-shards', type=int, default=1, help='number of shards of the cities index')
+    parser.add_argument('--cities-replicas', type=int, default=1, help='number of replicas of the cities index')
+    parser.add_argument('--cities-only', action='store_true', default=False,
+                        help='only (re)build the cities index from the existing geonames index')
+
+    args = parser.parse_args()
+    grq_es = get_es_client(args)
 
     print("script start time: %s" % datetime.now().isoformat())
+    if args.cities_only:
+        build_cities_index(grq_es, args.cities_index or 'geonames_cities', args.cities_shards, args.cities_replicas)
+        raise SystemExit(0)
+
     create_geonames_mapping(grq_es)  # create geonames index with mapping
 
     countries_csv_file = 'allCountries.txt'
-    parse(grq_es, countries_csv_file, args.start_position)
+    total = parse(grq_es, countries_csv_file, args.start_position, workers=args.workers,
+                  chunk_size=args.chunk_size, max_chunk_bytes=args.max_chunk_bytes, checkpoint_file=args.checkpoint,
+                  checkpoint_every=args.checkpoint_every, restart=args.restart, parse_workers=args.parse_workers,
+                  failed_file=args.failed_file)
+    watermark = dump_watermark(countries_csv_file)
+    set_watermark(grq_es, watermark)  # daily modifications are applied from the next day on (see update_deltas.py)
+    print("%d documents indexed, watermark %s, script end time: %s" %
+          (total, watermark.isoformat(), datetime.now().isoformat()))
+
+    if args.cities_index:
+        build_cities_index(grq_es, args.cities_index, args.cities_shards, args.cities_replicas)
@@ -0,0 +1,203 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import os
+import json
+import multiprocessing
+from collections import deque
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+'''
+parallel parse stage of import_ES.py: allCountries.txt is split into blocks of lines (byte ranges) parsed by worker
+processes into ready to bulk documents (geonameid, JSON encoded doc), the blocks come back in file order so the byte
+offset following each block can be checkpointed
+
+the per row work is reduced to a split, a column-wise coercion plan computed once (only the non-string columns are
+touched) and dict lookups into admin/country tables pre-joined on their codes, the docs are the same as
+import_ES.parse_row()'s (JSON encoded with orjson if installed)
+'''
+
+
+LIST_FIELDS = ('alternatename', 'cc2')  # comma separated, [] if empty
+FLOAT_FIELDS = ('latitude', 'longitude')
+INT_FIELDS = ('population', 'elevation')
+
+
+def _to_list(value):
+    return [v.strip() for v in value.split(',')] if value else []
+
+
+def _to_float(value):
+    return float(value) if value else float(None)  # same error as parse_row() if missing
+
+
+def _to_int(value):
+    return int(value) if value else None
+
+
+class GeonamesParser:
+    """
+    parses allCountries.txt lines into geonames docs
+    :param field_names: List[str]; columns of allCountries.txt (import_ES.FIELD_NAMES)
+    :param continent_codes: Dict[str, str]; continent code -> name
+    :param adm1: Dict; admin1CodesASCII.txt, see import_ES.get_admin_dict()
+    :param adm2: Dict; admin2Codes.txt
+    :param cntries: Dict; countryInfo.txt, see import_ES.get_country_dict()
+    """
+
+    def __init__(self, field_names, continent_codes, adm1, adm2, cntries):
+        self.field_names = list(field_names)
+        self.size = len(self.field_names)
+
+        # (column, coercion) of the non-string columns, the other columns are only turned into None if empty
+        self.plan = []
+        for i, name in enumerate(self.field_names):
+            if name in LIST_FIELDS:
+                self.plan.append((i, _to_list))
+            elif name in FLOAT_FIELDS:
+                self.plan.append((i, _to_float))
+            elif name in INT_FIELDS:
+                self.plan.append((i, _to_int))
+
+        columns = {name: i for i, name in enumerate(self.field_names)}
+        self.geonameid = columns['geonameid']
+        self.latitude = columns['latitude']
+        self.longitude = columns['longitude']
+        self.country_code = columns['country_code']
+        self.admin1_code = columns['admin1_code']
+        self.admin2_code = columns['admin2_code']
+
+        # country code -> (country name, continent code, continent name)
+        self.countries = {cc: (vals[3], vals[7], continent_codes.get(vals[7])) for cc, vals in cntries.items()}
+
+        # country code -> admin1 code -> admin1 name, country code -> "<admin1 code>.<admin2 code>" -> admin2 name
+        self.admin1 = {}
+        for code, vals in adm1.items():
+            cc, a1 = code.split('.', 1)
+            self.admin1.setdefault(cc, {})[a1] = vals[0] if vals else None
+        self.admin2 = {}
+        for code, vals in adm2.items():
+            cc, a12 = code.split('.', 1)
+            self.admin2.setdefault(cc, {})[a12] = vals[0] if vals else None
+
+    def parse(self, line):
+        """
+        :param line: str; allCountries.txt line
+        :return: Dict; geonames doc, same as import_ES.parse_row()
+        """
+        raw = line.strip().split('\t')
+        if len(raw) < self.size:
+            raw.extend([''] * (self.size - len(raw)))
+
+        values = [v or None for v in raw]
+        for i, coerce in self.plan:
+            values[i] = coerce(raw[i])
+
+        row = dict(zip(self.field_names, values))
+        row['location'] = {
+            'lon': values[self.longitude],
+            'lat': values[self.latitude]
+        }
+
+        cc = values[self.country_code]
+        country = self.countries.get(cc) if cc is not None else None
+        if country is not None:
+            row['continent_code'] = country[1]
+            row['continent_name'] = country[2]
+            row['country_name'] = country[0]
+        else:
+            row['continent_code'] = None
+            row['continent_name'] = None
+            row['country_name'] = cc
+
+        admin1_name = None
+        admin2_name = None
+        a1 = values[self.admin1_code]
+        if cc is not None and a1 is not None:
+            admin1_name = self.admin1.get(cc, {}).get(a1)
+            a2 = values[self.admin2_code]
+            if a2 is not None:
+                admin2_name = self.admin2.get(cc, {}).get(a1 + '.' + a2)
+        row['admin1_name'] = admin1_name
+        row['admin2_name'] = admin2_name
+        return row
+
+    def parse_block(self, data):
+        """
+        :param data: bytes; whole lines of allCountries.txt
+        :return: List[Tuple[str, str]]; (geonameid, JSON encoded doc) of each non empty line
+        """
+        if orjson is not None:
+            def dumps(row):
+                return orjson.dumps(row).decode('utf-8')
+        else:
+            dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+        docs = []
+        for line in data.decode('utf-8').split('\n'):
+            if line.strip():
+                row = self.parse(line)
+                docs.append((row['geonameid'], dumps(row)))
+        return docs
+
+
+def block_ranges(path, start_position=0, block_size=4 * 1024 * 1024):
+    """
+    splits the file into byte ranges of whole lines
+    :param path: str
+    :param start_position: int, byte offset of a line start
+    :param block_size: int, approximate size of the ranges
+    :return: Generator[Tuple[int, int]]; (start, end) byte offsets
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = start_position
+        while start < size:
+            f.seek(min(start + block_size, size))
+            f.readline()  # end of the line the block ends in
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
+
+
+_parser = None
+
+
+def _init_worker(tables):
+    global _parser
+    _parser = GeonamesParser(*tables)
+
+
+def _parse_range(args):
+    path, start, end = args
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return end, _parser.parse_block(data)
+
+
+def parse_blocks(path, tables, start_position=0, workers=None, block_size=4 * 1024 * 1024, prefetch=2):
+    """
+    parses the file in worker processes, with at most prefetch blocks per worker parsed ahead of the consumer
+    :param path: str
+    :param tables: Tuple; GeonamesParser arguments (field_names, continent_codes, adm1, adm2, cntries)
+    :param start_position: int, byte offset of a line start
+    :param workers: int, number of processes (default: number of CPUs)
+    :param block_size: int, approximate size of the blocks
+    :param prefetch: int, blocks in flight per worker
+    :return: Generator[Tuple[int, List[Tuple[str, str]]]]; (byte offset following the block, docs), in file order
+    """
+    workers = workers or os.cpu_count() or 1
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(tables,)) as pool:
+        pending = deque()
+        for start, end in block_ranges(path, start_position, block_size):
+            pending.append(pool.apply_async(_parse_range, ((path, start, end),)))
+            if len(pending) >= workers * prefetch:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
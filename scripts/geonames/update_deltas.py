@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+from future import standard_library
+standard_library.install_aliases()
+
+import os
+import argparse
+import traceback
+import urllib.error
+import urllib.request
+from datetime import date, datetime, timedelta
+
+from elasticsearch import Elasticsearch, helpers as es_helpers
+from opensearchpy import helpers as os_helpers
+
+from import_ES import (INDEX, add_es_arguments, get_es_client, get_admin_dict, get_country_dict, parse_row,
+                       read_lines, get_watermark, set_watermark, is_populated_place)
+
+
+'''
+applies the daily geonames modifications to the geonames index instead of reloading the whole dump:
+    modifications-<YYYY-MM-DD>.txt: added/modified records, same columns as allCountries.txt (upserted)
+    deletes-<YYYY-MM-DD>.txt: deleted records, geonameid <tab> name <tab> comment (deleted)
+every day after the watermark (recorded in the index, set by import_ES.py after a full load) is applied in order, up
+to yesterday, the watermark moves forward after each day so an interrupted update resumes where it stopped
+the compact cities index (GEONAMES_CITIES_INDEX, --cities-index) gets the same changes for its populated places
+
+run it daily (ie. cron) from the directory with the admin/country files (get_data.sh), then refresh the derived data:
+enrich policy (enrich_policy.py refresh) and geocoder snapshot (create_snapshot.py) if used
+'''
+
+
+DUMP_URL = 'http://download.geonames.org/export/dump/'
+
+
+def download(name, work_dir):
+    """
+    :param name: str; file of the geonames dump
+    :param work_dir: str
+    :return: str, local path (None if the file isn't published)
+    """
+    path = os.path.join(work_dir, name)
+    try:
+        urllib.request.urlretrieve(DUMP_URL + name, path)
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+    return path
+
+
+def read_deletes(path):
+    """
+    :param path: str; deletes-<YYYY-MM-DD>.txt
+    :return: List[str]; geonameids
+    """
+    ids = []
+    for line, _ in read_lines(path):
+        geonameid = line.split('\t', 1)[0].strip()
+        if geonameid:
+            ids.append(geonameid)
+    return ids
+
+
+def delta_actions(modifications, deletes, adm1, adm2, cntries, index=INDEX, cities=False):
+    """
+    bulk actions of a day, the upserts first so a record both modified and deleted ends up deleted
+    :param modifications: str; modifications file
+    :param deletes: str; deletes file
+    :param index: str
+    :param cities: bool, True for the cities index: records which are not (or no longer) populated places are deleted
+    :return: Generator[Dict]
+    """
+    for line, _ in read_lines(modifications):
+        row = parse_row(line, adm1, adm2, cntries)
+        if cities and not is_populated_place(row):
+            yield {'_op_type': 'delete', '_index': index, '_id': row['geonameid']}
+        else:
+            yield {'_op_type': 'index', '_index': index, '_id': row['geonameid'], '_source': row}
+    for geonameid in read_deletes(deletes):
+        yield {'_op_type': 'delete', '_index': index, '_id': geonameid}
+
+
+def bulk_apply(es, actions, chunk_size=5000):
+    """
+    :param es: elasticsearch/opensearch client
+    :param actions: Iterable[Dict]; see delta_actions()
+    :param chunk_size: int
+    :return: Tuple[int, int, int]; upserted, deleted, failed
+    """
+    helpers = es_helpers if isinstance(es, Elasticsearch) else os_helpers
+
+    upserted = deleted = failed = 0
+    for ok, item in helpers.streaming_bulk(es, actions, chunk_size=chunk_size, raise_on_error=False):
+        op_type, info = next(iter(item.items()))
+        if op_type == 'delete':
+            if ok or info.get('status') == 404:  # already gone
+                deleted += 1
+                continue
+        elif ok:
+            upserted += 1
+            continue
+
+        failed += 1
+        if failed <= 10:
+            print('failed to %s %s: %s' % (op_type, info.get('_id'), info.get('error')))
+    return upserted, deleted, failed
+
+
+def apply_day(es, day, work_dir, adm1, adm2, cntries, chunk_size=5000, cities_index=None):
+    """
+    :param es: elasticsearch/opensearch client
+    :param day: date
+    :param work_dir: str
+    :param cities_index: str, alias of the compact cities index (None if not used)
+    :return: Tuple[int, int, int]; upserted, deleted, failed (None if the day's files aren't published yet)
+    """
+    modifications = download('modifications-%s.txt' % day.isoformat(), work_dir)
+    deletes = download('deletes-%s.txt' % day.isoformat(), work_dir)
+    if modifications is None or deletes is None:
+        return None
+
+    actions = delta_actions(modifications, deletes, adm1, adm2, cntries)
+    upserted, deleted, failed = bulk_apply(es, actions, chunk_size=chunk_size)
+
+    if cities_index:
+        actions = delta_actions(modifications, deletes, adm1, adm2, cntries, index=cities_index, cities=True)
+        cities_upserted, cities_deleted, cities_failed = bulk_apply(es, actions, chunk_size=chunk_size)
+        print('%s: %d upserted, %d deleted, %d failed' % (cities_index, cities_upserted, cities_deleted, cities_failed))
+        failed += cities_failed
+    return upserted, deleted, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply the daily geonames modifications and deletions')
+    add_es_arguments(parser)
+    parser.add_argument('--since', type=str, default=None,
+                        help='apply the days after this one (YYYY-MM-DD), default: the index watermark')
+    parser.add_argument('--until', type=str, default=None, help='last day to apply (YYYY-MM-DD), default: yesterday')
+    parser.add_argument('--work-dir', type=str, default='deltas', help='directory of the downloaded daily files')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='documents per bulk request')
+    parser.add_argument('--cities-index', type=str, default=None,
+                        help='alias of the compact cities index to update as well (GEONAMES_CITIES_INDEX)')
+    args = parser.parse_args()
+
+    es = get_es_client(args)
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    if args.since:
+        watermark = datetime.strptime(args.since, '%Y-%m-%d').date()
+    else:
+        watermark = get_watermark(es)
+        if watermark is None:
+            raise RuntimeError("no watermark recorded in the %s index, use --since" % INDEX)
+    until = datetime.strptime(args.until, '%Y-%m-%d').date() if args.until else date.today() - timedelta(days=1)
+
+    adm1 = get_admin_dict('admin1CodesASCII.txt')
+    adm2 = get_admin_dict('admin2Codes.txt')
+    cntries = get_country_dict('countryInfo.txt')
+
+    print('watermark %s, applying modifications up to %s' % (watermark.isoformat(), until.isoformat()))
+    day = watermark + timedelta(days=1)
+    while day <= until:
+        try:
+            counts = apply_day(es, day, args.work_dir, adm1, adm2, cntries, chunk_size=args.chunk_size,
+                               cities_index=args.cities_index)
+        except Exception:
+            traceback.print_exc()
+            raise RuntimeError("failed to apply the modifications of %s, watermark left at %s" %
+                               (day.isoformat(), watermark.isoformat()))
+
+        if counts is None:
+            print('modifications of %s not published yet, stopping' % day.isoformat())
+            break
+        upserted, deleted, failed = counts
+        print('%s: %d upserted, %d deleted, %d failed' % (day.isoformat(), upserted, deleted, failed))
+        if failed > 0:
+            raise RuntimeError("%d documents of %s failed, watermark left at %s" %
+                               (failed, day.isoformat(), watermark.isoformat()))
+
+        es.indices.refresh(index=INDEX)
+        if args.cities_index:
+            es.indices.refresh(index=args.cities_index)
+        set_watermark(es, day)
+        watermark = day
+        day += timedelta(days=1)
+
+    print('watermark %s at %s' % (watermark.isoformat(), datetime.now().isoformat()))
+
+
+if __name__ == '__main__':
+    main()
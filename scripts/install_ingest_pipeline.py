@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 import os
 import json
+import argparse
 
-from grq2 import grq_es
+from grq2 import app, grq_es
+from grq2.lib.geonames import load_continents
+from grq2.lib.pipeline import DEFAULT_PIPELINE, enrich_pipeline
 
 
 current_directory = os.path.dirname(__file__)
@@ -13,13 +16,30 @@ ingest_file = os.path.normpath(ingest_file)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="installs the dataset ingest pipeline")
+    parser.add_argument('--enrich', action='store_true',
+                        help="install the pipeline computing @timestamp, temporal_span (and city/continent if "
+                             "GEONAMES_ENRICH_POLICY is set), see INGEST_PIPELINE")
+    parser.add_argument('--date-parts', action='store_true', default=app.config.get('INGEST_PIPELINE_DATE_PARTS'),
+                        help="also add the date parts of starttime (--enrich only)")
+    args = parser.parse_args()
+
     # TODO: delete pipeline here with a try except
 
-    with open(ingest_file) as f:
-        pipeline_settings = json.load(f)
+    if args.enrich:
+        pipeline_name = app.config.get('INGEST_PIPELINE', None) or DEFAULT_PIPELINE
+        geo_policy = app.config.get('GEONAMES_ENRICH_POLICY', None)
+        pipeline_settings = enrich_pipeline(date_parts=args.date_parts is True, geo_policy=geo_policy,
+                                            continents=load_continents() if geo_policy else None)
         print(json.dumps(pipeline_settings, indent=2))
+        grq_es.es.ingest.put_pipeline(id=pipeline_name, body=pipeline_settings)
+        print("installed ingest pipeline %s" % pipeline_name)
+    else:
+        with open(ingest_file) as f:
+            pipeline_settings = json.load(f)
+            print(json.dumps(pipeline_settings, indent=2))
 
-        pipeline_name = 'dataset_pipeline'
+            pipeline_name = 'dataset_pipeline'
 
-        # https://elasticsearch-py.readthedocs.io/en/master/api.html#elasticsearch.client.IngestClient
-        grq_es.es.ingest.put_pipeline(id=pipeline_name, body=pipeline_settings, ignore=400)
+            # https://elasticsearch-py.readthedocs.io/en/master/api.html#elasticsearch.client.IngestClient
+            grq_es.es.ingest.put_pipeline(id=pipeline_name, body=pipeline_settings, ignore=400)
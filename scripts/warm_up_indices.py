@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+from future import standard_library
+standard_library.install_aliases()
+
+import argparse
+
+from grq2 import app
+from grq2.lib.registry import index_name, get_index_registry
+
+
+'''
+creates the GRQ indices of upcoming dataset versions ahead of a campaign, so their first bulk writes don't wait for
+the index auto-creation (the index template is applied by ES), ex.
+    ./warm_up_indices.py v3.0:S1-GUNW v3.0:S1-GUNW-MERGED
+    ./warm_up_indices.py --file upcoming_datasets.txt  (one <version>:<dataset> per line)
+'''
+
+
+def parse_spec(spec):
+    """
+    :param spec: str, <version>:<dataset>
+    :return: str, index name
+    """
+    version, sep, dataset = spec.strip().partition(':')
+    if not sep or not version or not dataset:
+        raise ValueError("invalid dataset version %s, expected <version>:<dataset>" % spec)
+    return index_name(version, dataset)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="pre-creates the GRQ indices of upcoming dataset versions")
+    parser.add_argument('specs', nargs='*', help="<version>:<dataset>")
+    parser.add_argument('--file', help="file with a <version>:<dataset> per line")
+    args = parser.parse_args()
+
+    specs = list(args.specs)
+    if args.file:
+        with open(args.file) as f:
+            specs.extend(line for line in f if line.strip() and not line.startswith('#'))
+    if not specs:
+        parser.error("no dataset versions given")
+
+    indices = [parse_spec(spec) for spec in specs]
+    registry = get_index_registry()
+    created = registry.ensure(indices)
+
+    for index in indices:
+        print("%s: %s" % (index, "created" if index in created else "exists"))
+    print("created %d of %d indices (%s_* template applied)" %
+          (len(created), len(set(indices)), app.config['GRQ_INDEX']))
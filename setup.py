@@ -9,7 +9,8 @@ setup(
     zip_safe=False,
     python_requires='>=3.12',
     install_requires=[
-        'Flask<2.3.0',  # TODO: remove kluge when Flask-DebugToolbar fixes import error
+        # 2.2+: app.json providers (grq2.lib.codec)
+        'Flask>=2.2,<2.3',  # TODO: remove kluge when Flask-DebugToolbar fixes import error
         'flask-restx>=0.5.1',
         "elasticsearch>=7.0.0,<7.14.0",
         'opensearch-py>=2.3.0,<3.0.0',
@@ -28,6 +29,12 @@ setup(
         "werkzeug<3.0.0",
     ],
     extras_require={
+        'fastjson': [
+            'orjson>=3.9.0',
+        ],
+        'zstd': [
+            'zstandard>=0.21.0',
+        ],
         'dev': [
             'pytest>=7.4.0',
             'pytest-cov>=4.1.0',
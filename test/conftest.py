@@ -0,0 +1,70 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import os
+import sys
+import types
+
+import pytest
+from flask import Flask
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+GEONAMES_SCRIPTS = os.path.join(ROOT, 'scripts', 'geonames')  # import_ES.py & co. import each other as top level
+for path in (ROOT, GEONAMES_SCRIPTS):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# settings of config/settings.cfg.tmpl the modules under test read at import time or without a default
+TEST_CONFIG = {
+    'GRQ_INDEX': 'grq',
+    'GEONAMES_INDEX': 'geonames',
+    'REDIS_URL': 'redis://localhost:6379/0',
+    'HYSDS_IOS_INDEX': 'hysds_ios-grq',
+    'JOB_SPECS_INDEX': 'job_specs',
+    'USER_RULES_INDEX': 'user_rules-grq',
+}
+
+
+def _register_grq2():
+    """
+    registers the grq2 package without running grq2/__init__.py (which reads settings.cfg and connects to the GRQ and
+    Mozart Elasticsearch), the modules under test get a bare Flask app and ES client placeholders set by the tests
+    """
+    if 'grq2' in sys.modules:
+        return
+    package = types.ModuleType('grq2')
+    package.__path__ = [os.path.join(ROOT, 'grq2')]
+    package.__file__ = os.path.join(ROOT, 'grq2', '__init__.py')
+    package.app = Flask('grq2')
+    package.app.config.update(TEST_CONFIG)
+    package.grq_es = types.SimpleNamespace(es=None)
+    package.mozart_es = types.SimpleNamespace(es=None)
+    sys.modules['grq2'] = package
+
+
+_register_grq2()
+
+
+@pytest.fixture
+def app():
+    from grq2 import app
+    return app
+
+
+@pytest.fixture
+def config(app, monkeypatch):
+    """sets app.config keys for the duration of a test: config(KEY=value, ...)"""
+    def set_config(**kwargs):
+        for key, value in kwargs.items():
+            monkeypatch.setitem(app.config, key, value)
+    return set_config
+
+
+@pytest.fixture
+def grq_es(monkeypatch):
+    """replaces grq2.grq_es, the tests set grq_es.es (and grq_es.search if used)"""
+    import grq2
+    es = types.SimpleNamespace(es=None)
+    monkeypatch.setattr(grq2, 'grq_es', es)
+    return es
@@ -0,0 +1,74 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import pytest
+
+from grq2.lib import geonames
+
+
+class FakeMsearchES:
+    def __init__(self, status=None):
+        self.bodies = []
+        self.status = status  # per search, ex. {1: 404}
+
+    def msearch(self, body):
+        self.bodies.append(body)
+        responses = []
+        for header, query in zip(body[::2], body[1::2]):
+            n = sum(len(b) // 2 for b in self.bodies[:-1]) + len(responses)
+            status = (self.status or {}).get(n)
+            if status is not None:
+                responses.append({'status': status, 'error': {'type': 'error %d' % status}})
+            else:
+                source = {'n': n, 'index': header['index'], 'size': query.get('size')}
+                responses.append({'hits': {'hits': [{'_source': source}]}})
+        return {'responses': responses}
+
+
+@pytest.fixture
+def no_local_geocoder(monkeypatch):
+    monkeypatch.setattr(geonames, '_local_geocoder', None)
+    monkeypatch.setattr(geonames, '_local_geocoder_loaded', True)
+
+
+LOOKUPS = [
+    ('get_cities', ([[0, 0], [1, 0], [1, 1], [0, 0]], 5, False)),
+    ('get_continents', (0.5, 0.5)),
+    ('get_nearest_cities', (10., 20.)),
+    ('get_continents', (10., 20.)),
+    ('get_nearest_cities', (30., 40., 3)),
+]
+
+
+def test_batch_lookup_chunks_and_order(no_local_geocoder, grq_es, config, monkeypatch):
+    monkeypatch.setattr(geonames, 'grq_es', grq_es)
+    grq_es.es = FakeMsearchES()
+    config(GEONAMES_MSEARCH_CHUNK=2)
+
+    results = geonames.batch_lookup(LOOKUPS)
+
+    assert [len(b) // 2 for b in grq_es.es.bodies] == [2, 2, 1]
+    assert [r[0]['n'] for r in results] == [0, 1, 2, 3, 4]
+    assert results[4][0]['size'] == 3
+    # the queries are the ones of the single lookup functions
+    body = [q for b in grq_es.es.bodies for q in b[1::2]]
+    assert body[1] == geonames.continents_query(0.5, 0.5)
+    assert body[2] == geonames.nearest_cities_query(10., 20.)
+
+
+def test_batch_lookup_missing_index_and_errors(no_local_geocoder, grq_es, monkeypatch):
+    monkeypatch.setattr(geonames, 'grq_es', grq_es)
+    grq_es.es = FakeMsearchES(status={1: 404})
+    results = geonames.batch_lookup(LOOKUPS[:3])
+    assert results[1] is None and results[0] and results[2]
+
+    grq_es.es = FakeMsearchES(status={0: 500})
+    with pytest.raises(Exception):
+        geonames.batch_lookup(LOOKUPS[:1])
+
+
+def test_batch_lookup_empty(no_local_geocoder, grq_es, monkeypatch):
+    monkeypatch.setattr(geonames, 'grq_es', grq_es)
+    grq_es.es = FakeMsearchES()
+    assert geonames.batch_lookup([]) == []
+    assert grq_es.es.bodies == []
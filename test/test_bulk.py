@@ -0,0 +1,49 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import json
+
+from grq2.lib.bulk import build_bulk_bodies, encode_bulk_item, group_bulk_items, pack_bulk_items
+
+
+def docs_bulk(count, size=100):
+    bulk = []
+    for i in range(count):
+        bulk.append({'index': {'_index': 'grq_v1.0_test', '_id': 'ds-%03d' % i}})
+        bulk.append({'id': 'ds-%03d' % i, 'payload': 'x' * size})
+    return bulk
+
+
+def parse_body(body):
+    assert body.endswith(b'\n')
+    return [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+
+def test_encode_bulk_item():
+    assert encode_bulk_item({'delete': {'_id': '1'}}) == b'{"delete":{"_id":"1"}}\n'
+    lines = encode_bulk_item({'index': {'_id': '1'}}, {'a': 'é'}).split(b'\n')
+    assert lines[2] == b'' and json.loads(lines[1]) == {'a': 'é'}
+
+
+def test_bodies_round_trip_in_order():
+    bulk = docs_bulk(50)
+    bodies = build_bulk_bodies(bulk, bulk_limit=1e+8)
+    assert len(bodies) == 1
+    assert parse_body(bodies[0]) == bulk
+
+
+def test_bodies_respect_the_limit_and_keep_items_whole():
+    bulk = docs_bulk(40)
+    item_size = len(encode_bulk_item(bulk[0], bulk[1]))
+    limit = item_size * 5 + 10
+    bodies = build_bulk_bodies(bulk, bulk_limit=limit)
+
+    assert len(bodies) == 8
+    assert all(len(body) < limit for body in bodies)
+    assert [doc for body in bodies for doc in parse_body(body)] == bulk
+
+
+def test_item_larger_than_the_limit_gets_its_own_body():
+    items = [b'a' * 10 + b'\n', b'b' * 100 + b'\n', b'c' * 10 + b'\n']
+    assert group_bulk_items(items, bulk_limit=50) == [[items[0]], [items[1]], [items[2]]]
+    assert pack_bulk_items([], bulk_limit=50) == []
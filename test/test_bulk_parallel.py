@@ -0,0 +1,73 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import threading
+import time
+
+from grq2.lib.bulk import send_bulk_parallel, build_bulk_bodies
+
+
+class FakeBulkES:
+    def __init__(self, fail_bodies=(), delay=0.01):
+        self.fail_bodies = set(fail_bodies)
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def bulk(self, body, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if body in self.fail_bodies:
+                raise ConnectionError("connection lost")
+            lines = body.decode('utf-8').splitlines()
+            return {'errors': False, 'items': [{'index': {'_id': line}} for line in lines[::2]], 'kwargs': kwargs}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def test_responses_in_order_and_concurrency_bounded():
+    es = FakeBulkES()
+    bodies = [b'{"index":{}}\n{"n":%d}\n' % i for i in range(12)]
+    responses = send_bulk_parallel(es, bodies, 3, timeout=120)
+    assert [r['items'][0]['index']['_id'] for r in responses] == ['{"index":{}}'] * 12
+    assert all(r['kwargs'] == {'timeout': 120} for r in responses)
+    assert 1 < es.max_in_flight <= 3
+
+
+def test_failed_request_is_returned_not_raised():
+    bodies = build_bulk_bodies([{'index': {'_id': str(i)}} if j == 0 else {'n': i} for i in range(4) for j in (0, 1)],
+                               bulk_limit=30)
+    es = FakeBulkES(fail_bodies=[bodies[1]])
+    responses = send_bulk_parallel(es, bodies, 4)
+    assert isinstance(responses[1], ConnectionError)
+    assert all(isinstance(r, dict) for i, r in enumerate(responses) if i != 1)
+
+
+def test_index_bulk_parallel_tracks_every_written_chunk(config, monkeypatch):
+    from grq2.services.api_v02 import datasets as api
+
+    docs_bulk = []
+    for i in range(6):
+        docs_bulk.append({'index': {'_index': 'grq_test', '_id': 'ds-%d' % i}})
+        docs_bulk.append({'id': 'ds-%d' % i})
+
+    class Es:
+        def bulk(self, body, **kwargs):
+            lines = body.decode('utf-8').splitlines()
+            if '"ds-2"' in lines[0]:
+                raise ConnectionError("chunk lost")
+            return {'errors': False, 'items': [{'index': {'_index': 'grq_test', '_id': line.split('"_id":"')[1][:4]}}
+                                               for line in lines[::2]]}
+
+    monkeypatch.setattr(api.grq_es, 'es', Es(), raising=False)
+    item = b'{"index":{"_index":"grq_test","_id":"ds-0"}}\n{"id":"ds-0"}\n'
+    config(BULK_CONCURRENCY=4, BULK_LIMIT=len(item) * 2 + 1)  # 2 docs per chunk
+    delete_docs = []
+    errors = api.index_bulk(docs_bulk, delete_docs)
+    assert len(errors) == 1
+    assert sorted(d['delete']['_id'] for d in delete_docs) == ['ds-0', 'ds-1', 'ds-4', 'ds-5']
@@ -0,0 +1,78 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import json
+
+import pytest
+import elasticsearch.exceptions
+
+from grq2.lib import bulk
+from grq2.lib.bulk import encode_bulk_item, index_bulk_items, backoff_delay, is_retryable
+
+
+class ScriptedES:
+    """bulk responses scripted per attempt: statuses[attempt][doc id] (missing: 201), or an exception to raise"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requests = []
+
+    def bulk(self, body, **kwargs):
+        ids = [json.loads(line)['index']['_id'] for line in body.decode('utf-8').splitlines()[::2]]
+        attempt = min(len(self.requests), len(self.statuses) - 1)
+        self.requests.append(ids)
+        script = self.statuses[attempt]
+        if isinstance(script, Exception):
+            raise script
+        items = []
+        for _id in ids:
+            status = script.get(_id, 201)
+            item = {'_index': 'grq_test', '_id': _id, 'status': status}
+            if status >= 300:
+                item['error'] = {'type': 'error %d' % status}
+            items.append({'index': item})
+        return {'errors': any('error' in i['index'] for i in items), 'items': items}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(bulk.time, 'sleep', lambda seconds: None)
+
+
+def items(count):
+    return [encode_bulk_item({'index': {'_index': 'grq_test', '_id': str(i)}}, {'n': i}) for i in range(count)]
+
+
+def test_only_retryable_items_are_resent():
+    es = ScriptedES([{'1': 429, '2': 400}, {}])
+    written, failed = index_bulk_items(es, items(4), max_retries=3)
+    assert written == 3
+    assert [f['index']['_id'] for f in failed] == ['2']
+    assert es.requests == [['0', '1', '2', '3'], ['1']]
+
+
+def test_items_still_throttled_after_max_retries_are_reported():
+    es = ScriptedES([{'0': 503}])
+    written, failed = index_bulk_items(es, items(2), max_retries=2)
+    assert written == 1
+    assert [f['index']['status'] for f in failed] == [503]
+    assert len(es.requests) == 3
+
+
+def test_request_errors():
+    retryable = elasticsearch.exceptions.ConnectionError('N/A', 'connection refused', None)
+    es = ScriptedES([retryable, {}])
+    assert index_bulk_items(es, items(3), max_retries=1) == (3, [])
+
+    es = ScriptedES([ValueError('bad request')])
+    written, failed = index_bulk_items(es, items(2), max_retries=3)
+    assert written == 0 and len(es.requests) == 1
+    assert [f['index']['_id'] for f in failed] == ['0', '1']
+    assert 'bad request' in failed[0]['index']['error']
+
+
+def test_is_retryable_and_backoff():
+    assert is_retryable(elasticsearch.exceptions.ConnectionError('N/A', 'refused', None))
+    assert is_retryable(elasticsearch.exceptions.TransportError(429, 'too many requests'))
+    assert not is_retryable(elasticsearch.exceptions.TransportError(400, 'bad request'))
+    assert all(0 <= backoff_delay(attempt, 1., max_delay=5.) <= min(5., 2 ** attempt) for attempt in range(10))
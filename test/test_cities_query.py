@@ -0,0 +1,84 @@
+import math
+
+import pytest
+
+from grq2.lib.geonames import (COMPLEX_VERTICES, GEO_POLYGON_PLAN, CitiesQueryPlan, cities_filters, cities_query,
+                               get_cities_query_plan)
+
+
+SQUARE = [[-118., 34.], [-117., 34.], [-117., 35.], [-118., 35.], [-118., 34.]]
+OTHER_SQUARE = [[10., 10.], [11., 10.], [11., 11.], [10., 11.], [10., 10.]]
+BBOX_PLAN = CitiesQueryPlan(True, False, None, 0.)
+GEO_SHAPE_PLAN = CitiesQueryPlan(False, True, None, 0.)
+
+
+def circle(vertices, lon=-118., lat=34., radius=1.):
+    ring = [[lon + radius * math.cos(2 * math.pi * i / vertices), lat + radius * math.sin(2 * math.pi * i / vertices)]
+            for i in range(vertices)]
+    return ring + [ring[0]]
+
+
+def test_default_plan(app, monkeypatch):
+    for key in ('GEONAMES_CITIES_BBOX_PREFILTER', 'GEONAMES_CITIES_GEO_SHAPE', 'GEONAMES_CITIES_MAX_VERTICES'):
+        monkeypatch.delitem(app.config, key, raising=False)
+    assert get_cities_query_plan() == CitiesQueryPlan(False, False, None, 0.0005)
+
+
+def test_geo_polygon():
+    assert cities_filters(SQUARE) == ([{'geo_polygon': {'location': {'points': SQUARE}}}], [])
+    assert cities_filters([SQUARE, OTHER_SQUARE], multipolygon=True) == ([], [
+        {'geo_polygon': {'location': {'points': SQUARE}}},
+        {'geo_polygon': {'location': {'points': OTHER_SQUARE}}},
+    ])
+
+
+def test_bbox_prefilter():
+    filters, should = cities_filters(SQUARE, plan=BBOX_PLAN)
+    assert filters == [
+        {'geo_bounding_box': {'location': {'top_left': {'lat': 35., 'lon': -118.},
+                                           'bottom_right': {'lat': 34., 'lon': -117.}}}},
+        {'geo_polygon': {'location': {'points': SQUARE}}},
+    ]
+    assert should == []
+
+    out_of_range = [[170., 34.], [190., 34.], [190., 35.], [170., 34.]]
+    assert cities_filters(out_of_range, plan=BBOX_PLAN) == cities_filters(out_of_range)
+
+
+def test_geo_shape_multi_part():
+    filters, should = cities_filters([SQUARE, OTHER_SQUARE[:-1]], multipolygon=True, plan=GEO_SHAPE_PLAN)
+    assert should == []
+    assert filters == [{'geo_shape': {'location': {
+        'shape': {'type': 'multipolygon', 'coordinates': [[SQUARE], [OTHER_SQUARE]]},  # closed rings
+        'relation': 'intersects'
+    }}}]
+
+
+def test_geo_shape_complex_footprint():
+    ring = circle(COMPLEX_VERTICES + 1)
+    filters, _ = cities_filters(ring, plan=GEO_SHAPE_PLAN)
+    assert list(filters[0]) == ['geo_shape']
+    assert cities_filters(SQUARE, plan=GEO_SHAPE_PLAN) == cities_filters(SQUARE)  # simple, kept as geo_polygon
+
+
+def test_geo_shape_not_across_the_antimeridian():
+    wide = [[[-179., 0.], [179., 0.], [179., 1.], [-179., 0.]], SQUARE]
+    assert cities_filters(wide, multipolygon=True, plan=GEO_SHAPE_PLAN) == cities_filters(wide, multipolygon=True)
+
+
+def test_simplified_footprint():
+    ring = circle(1000)
+    filters, _ = cities_filters(ring, plan=CitiesQueryPlan(False, False, 100, 0.0005))
+    points = filters[0]['geo_polygon']['location']['points']
+    assert 3 < len(points) <= 100
+    assert cities_filters(SQUARE, plan=CitiesQueryPlan(False, False, 100, 0.0005)) == cities_filters(SQUARE)
+
+
+@pytest.mark.parametrize('plan, should', [(GEO_POLYGON_PLAN, 2), (GEO_SHAPE_PLAN, 0)])
+def test_cities_query(plan, should):
+    query = cities_query([SQUARE, OTHER_SQUARE], size=3, multipolygon=True, plan=plan)
+    assert query['size'] == 3
+    assert query['query']['bool']['filter'][:2] == [{'term': {'feature_class': 'P'}},
+                                                    {'range': {'population': {'gte': 1}}}]
+    assert len(query['query']['bool'].get('should', [])) == should
+    assert ('minimum_should_match' in query['query']['bool']) is (should > 0)
@@ -0,0 +1,120 @@
+import json
+import uuid
+import decimal
+import dataclasses
+from datetime import datetime, date
+
+import numpy as np
+import pytest
+from flask.json.provider import DefaultJSONProvider
+from markupsafe import Markup
+from elasticsearch import Elasticsearch
+from elasticsearch.serializer import JSONSerializer
+from opensearchpy import OpenSearch
+
+from grq2.lib import codec
+from grq2.lib.codec import CodecSerializer, install_es_serializer
+
+
+@pytest.fixture(params=codec.available_codecs())
+def json_codec(request):
+    yield codec.set_codec(request.param)
+    codec.set_codec(codec.DEFAULT_CODEC)
+
+
+DOC = {
+    'id': 'S1-GUNW-A-R-064-tops-20200101_20191220-015048-00121W_00038N-PP-b9a9-v2_0_4',
+    'location': {'type': 'polygon', 'coordinates': [[[-118.1, 34.2], [-117.0, 34.2], [-118.1, 34.2]]]},
+    'metadata': {'unicode': 'Île-de-France', 'url': 'https://example.com/a/b', 'count': 2 ** 40, 'ok': True,
+                 'nothing': None},
+}
+
+
+def test_round_trip(json_codec):
+    assert json_codec.loads(json_codec.dumps(DOC)) == DOC
+    assert json_codec.loads(json_codec.dumpb(DOC)) == DOC
+    assert json.loads(codec.dumpb(DOC, sort_keys=True)) == DOC
+
+
+def test_big_integers(json_codec):
+    assert json_codec.loads(json_codec.dumps({'n': 2 ** 70})) == {'n': 2 ** 70}
+
+
+def test_extra_types_like_es_serializer(json_codec):
+    uid = uuid.uuid4()
+    data = {
+        'decimal': decimal.Decimal('1.5'),
+        'int64': np.int64(7),
+        'uint8': np.uint8(255),
+        'float32': np.float32(0.5),
+        'bool': np.bool_(True),
+        'array': np.array([1, 2, 3]),
+        'datetime': datetime(2020, 1, 1, 12, 30),
+        'date': date(2020, 1, 1),
+        'uuid': uid,
+    }
+    expected = json.loads(JSONSerializer().dumps(data))
+    assert json_codec.loads(json_codec.dumps(data)) == expected
+    assert expected['decimal'] == 1.5 and expected['int64'] == 7
+
+
+def test_unsupported_type(json_codec):
+    with pytest.raises(TypeError):
+        json_codec.dumps({'object': object()})
+
+
+def test_serializer_delegates_unknown_types():
+    class Point:
+        def __init__(self, x, y):
+            self.x, self.y = x, y
+
+    serializer = CodecSerializer(default=lambda o: [o.x, o.y])
+    assert json.loads(serializer.dumps({'p': Point(1, 2)})) == {'p': [1, 2]}
+    assert serializer.dumps('{"raw": 1}') == '{"raw": 1}'
+    assert serializer.dumps(b'{"raw": 1}') == b'{"raw": 1}'
+
+
+@pytest.mark.parametrize('client_class', [Elasticsearch, OpenSearch])
+def test_install_es_serializer(client_class):
+    client = client_class(['http://localhost:9200'])
+    install_es_serializer(client)
+
+    serializer = client.transport.serializer
+    assert isinstance(serializer, CodecSerializer)
+    assert client.transport.deserializer.serializers['application/json'] is serializer
+    assert json.loads(serializer.dumps({'n': np.int32(3), 'd': decimal.Decimal('2.25')})) == {'n': 3, 'd': 2.25}
+
+
+def test_flask_json_provider(app, json_codec, monkeypatch):
+    monkeypatch.setattr(app, 'json', codec.CodecJSONProvider(app))
+    with app.app_context():
+        assert json.loads(app.json.dumps(DOC)) == DOC
+        assert app.json.loads(app.json.dumps(DOC)) == DOC
+
+
+@dataclasses.dataclass
+class Version:
+    major: int
+    minor: int
+
+
+def test_flask_json_provider_types(app, json_codec, monkeypatch):
+    monkeypatch.setattr(app, 'json', codec.CodecJSONProvider(app))
+    data = {
+        'datetime': datetime(2020, 1, 1, 12, 30),
+        'date': date(2020, 1, 1),
+        'uuid': uuid.UUID('12345678123456781234567812345678'),
+        'decimal': decimal.Decimal('1.5'),
+        'dataclass': Version(1, 2),
+        'html': Markup('<b>grq</b>'),
+        'unicode': 'Île-de-France',
+    }
+    with app.app_context():
+        flask_provider = DefaultJSONProvider(app)
+        assert json.loads(app.json.dumps(data)) == json.loads(flask_provider.dumps(data))
+        assert json.loads(app.json.dumps({'n': np.int64(3)})) == {'n': 3}  # the codec's types
+        assert 'Île' in app.json.dumps(data)
+        assert list(json.loads(app.json.dumps({'b': 1, 'a': 2}))) == ['a', 'b']  # sort_keys
+
+        monkeypatch.setattr(app.json, 'ensure_ascii', True)
+        assert app.json.dumps(data) == flask_provider.dumps(data)
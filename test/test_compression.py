@@ -0,0 +1,145 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from flask import Flask, request
+from werkzeug.test import EnvironBuilder
+
+from grq2.lib import compression
+from grq2.lib.compression import DEFAULT_MAX_DECOMPRESSED_LENGTH, DecompressedRequest, max_decompressed_length
+
+
+BODY = json.dumps([{'id': 'ds-%d' % i, 'metadata': {'value': 'x' * 100}} for i in range(200)]).encode('utf-8')
+
+
+@pytest.fixture
+def client():
+    app = Flask('compression_test')
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return {'length': len(request.get_data()), 'items': len(request.get_json(force=True)),
+                'encoding': request.environ.get('grq.content_encoding')}
+
+    app.wsgi_app = DecompressedRequest(app.wsgi_app, max_length=len(BODY))
+    return app.test_client()
+
+
+def post(client, data, encoding=None):
+    headers = {'Content-Type': 'application/json'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return client.post('/echo', data=data, headers=headers)
+
+
+def test_identity_body(client):
+    resp = post(client, BODY)
+    assert resp.status_code == 200
+    assert resp.json == {'length': len(BODY), 'items': 200, 'encoding': None}
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'x-gzip', 'GZip'])
+def test_gzip_body(client, encoding):
+    resp = post(client, gzip.compress(BODY), encoding)
+    assert resp.status_code == 200
+    assert resp.json == {'length': len(BODY), 'items': 200, 'encoding': encoding.lower()}
+
+
+def test_zstd_body(client):
+    zstandard = pytest.importorskip('zstandard')
+    resp = post(client, zstandard.ZstdCompressor().compress(BODY), 'zstd')
+    assert resp.status_code == 200
+    assert resp.json['length'] == len(BODY)
+
+
+def test_unsupported_encoding(client, monkeypatch):
+    monkeypatch.setattr(compression, 'zstandard', None)
+    assert post(client, BODY, 'br').status_code == 415
+    assert post(client, BODY, 'zstd').status_code == 415
+
+
+def test_corrupted_body(client):
+    assert post(client, b'not gzip at all', 'gzip').status_code == 400
+    assert post(client, gzip.compress(BODY)[:-20], 'gzip').status_code == 400  # truncated
+
+
+def test_decompressed_length_limit(client):
+    assert post(client, gzip.compress(BODY + b' '), 'gzip').status_code == 413
+
+
+def gzip_bomb(length, chunk=1024 * 1024):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)  # gzip container
+    zeros = b'0' * chunk
+    parts = [compressor.compress(zeros) for _ in range(length // chunk + 1)]
+    return b''.join(parts) + compressor.flush()
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'zstd'])
+def test_decompression_bomb_default_limit(encoding):
+    """bodies decompressing past the default limit get a 413, the bomb is read up to the limit only"""
+    seen = {}
+
+    def app(environ, start_response):
+        stream = environ['wsgi.input']
+        seen['read'] = 0
+        while stream.read(1024 * 1024):  # RequestEntityTooLarge past the limit, handled by flask
+            seen['read'] += 1024 * 1024
+        start_response('200 OK', [])
+        return [b'']
+
+    length = DEFAULT_MAX_DECOMPRESSED_LENGTH + 1024 * 1024
+    if encoding == 'zstd':
+        zstandard = pytest.importorskip('zstandard')
+        bomb = zstandard.ZstdCompressor().compress(b'0' * length)
+    else:
+        bomb = gzip_bomb(length)
+    assert len(bomb) < length / 500
+
+    flask_app = Flask('compression_bomb_test')
+    flask_app.route('/echo', methods=['POST'])(lambda: app(request.environ, lambda *args: None))
+    flask_app.wsgi_app = DecompressedRequest(flask_app.wsgi_app)  # default limit
+    resp = flask_app.test_client().post('/echo', data=bomb, headers={'Content-Encoding': encoding})
+    assert resp.status_code == 413
+    assert seen['read'] <= DEFAULT_MAX_DECOMPRESSED_LENGTH
+
+
+def test_max_decompressed_length():
+    assert max_decompressed_length({}) == DEFAULT_MAX_DECOMPRESSED_LENGTH
+    assert max_decompressed_length({'MAX_DECOMPRESSED_LENGTH': None, 'BULK_LIMIT': 1e+7}) == 10000000
+    assert max_decompressed_length({'MAX_CONTENT_LENGTH': 5000000, 'BULK_LIMIT': 1e+7}) == 5000000
+    assert max_decompressed_length({'MAX_DECOMPRESSED_LENGTH': 1e+9, 'MAX_CONTENT_LENGTH': 5000000}) == 1000000000
+
+
+def test_reads_only_the_request_body():
+    """the compressed body is followed by the next request's bytes on a keep-alive connection"""
+    seen = {}
+
+    def app(environ, start_response):
+        seen['body'] = environ['wsgi.input'].read()
+        seen['content_length'] = environ.get('CONTENT_LENGTH')
+        start_response('200 OK', [])
+        return [b'']
+
+    compressed = gzip.compress(BODY)
+    builder = EnvironBuilder(method='POST', data=compressed + b'GET / HTTP/1.1\r\n',
+                             headers={'Content-Encoding': 'gzip'})
+    environ = builder.get_environ()
+    environ['CONTENT_LENGTH'] = str(len(compressed))
+    environ['wsgi.input_terminated'] = False
+    DecompressedRequest(app)(environ, lambda *args: None)
+
+    assert seen == {'body': BODY, 'content_length': None}
+    assert 'HTTP_CONTENT_ENCODING' not in environ
+
+
+@pytest.mark.parametrize('client_module, client_class', [('elasticsearch', 'Elasticsearch'),
+                                                         ('opensearchpy', 'OpenSearch')])
+def test_enable_http_compress(client_module, client_class):
+    module = pytest.importorskip(client_module)
+    es = getattr(module, client_class)(['http://localhost:9200'])
+    compression.enable_http_compress(es)
+    assert es.transport.kwargs['http_compress'] is True
+    for connection in es.transport.connection_pool.connections:
+        assert connection.http_compress is True
+        assert connection.headers['accept-encoding'] == 'gzip,deflate'
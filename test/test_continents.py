@@ -0,0 +1,85 @@
+import pytest
+from shapely.geometry import box
+
+from grq2.lib import geonames, continents
+from grq2.lib.continents import ContinentResolver
+
+
+CONTINENTS = [
+    {'name': 'Europe', 'location': {'lon': 9.14062, 'lat': 48.69096}},
+    {'name': 'Africa', 'location': {'lon': 21.09375, 'lat': 7.1881}},
+    {'name': 'North America', 'location': {'lon': -100.54688, 'lat': 46.07323}},
+]
+
+
+def test_resolver_nearest_continent():
+    resolver = ContinentResolver(CONTINENTS)
+    assert len(resolver) == 3
+    assert resolver.resolve(2.35, 48.85) == 'Europe'
+    assert resolver.resolve(-118.24, 34.05) == 'North America'
+    assert resolver.resolve_batch([(31.23, 30.04), (13.4, 52.5)]) == ['Africa', 'Europe']
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_resolver_outlines(monkeypatch, vectorized):
+    if not vectorized:  # Shapely 1.x
+        monkeypatch.delattr(continents.shapely, 'contains_xy')
+    # the outline puts a point closer to the Europe point in Africa
+    resolver = ContinentResolver(CONTINENTS, outlines=[('Africa', box(-20., -35., 52., 37.5))])
+    assert resolver.resolve_batch([(10., 37.), (10., 38.), (-100., 40.)]) == ['Africa', 'Europe', 'North America']
+
+
+@pytest.mark.skipif(not hasattr(continents.shapely, 'prepare'), reason="shapely 2.0+")
+def test_resolver_prepares_outlines():
+    outline = box(-20., -35., 52., 37.5)
+    ContinentResolver(CONTINENTS, outlines=[('Africa', outline)])
+    assert continents.shapely.is_prepared(outline)
+
+
+@pytest.fixture
+def resolver_state(monkeypatch, config):
+    monkeypatch.setattr(geonames, '_continent_resolver', None)
+    monkeypatch.setattr(geonames, '_continent_resolver_retry_at', 0.)
+    config(CONTINENT_RESOLVER=True, CONTINENT_OUTLINES=None, CONTINENT_RESOLVER_RETRY=300)
+
+    now = [1000.]
+    monkeypatch.setattr(geonames.time, 'time', lambda: now[0])
+    return now
+
+
+def test_get_continent_resolver_backs_off(monkeypatch, resolver_state):
+    calls = []
+
+    def load_continents():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("geonames index unavailable")
+        return CONTINENTS
+
+    monkeypatch.setattr(geonames, 'load_continents', load_continents)
+
+    assert geonames.get_continent_resolver() is None
+    assert geonames.get_continent_resolver() is None
+    assert len(calls) == 1  # not retried (nor logged) for every dataset
+
+    resolver_state[0] += 300
+    resolver = geonames.get_continent_resolver()
+    assert isinstance(resolver, ContinentResolver)
+    assert geonames.get_continent_resolver() is resolver
+    assert len(calls) == 2
+
+
+def test_get_continent_resolver_no_continents(monkeypatch, resolver_state):
+    calls = []
+    monkeypatch.setattr(geonames, 'load_continents', lambda: calls.append(1) or [])
+
+    assert geonames.get_continent_resolver() is None
+    resolver_state[0] += 299
+    assert geonames.get_continent_resolver() is None
+    assert len(calls) == 1
+
+
+def test_get_continent_resolver_disabled(monkeypatch, resolver_state, config):
+    config(CONTINENT_RESOLVER=False)
+    monkeypatch.setattr(geonames, 'load_continents', lambda: pytest.fail("continents loaded"))
+    assert geonames.get_continent_resolver() is None
@@ -0,0 +1,169 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import gzip
+import json
+
+import pytest
+
+from grq2.lib.compression import DecompressedRequest
+from grq2.services.api_v02 import datasets as api
+from grq2.services.api_v02.service import services
+
+
+@pytest.fixture
+def client(app):
+    if services.name not in app.blueprints:
+        app.register_blueprint(services)
+    return app.test_client()
+
+
+class FakeIngest:
+    """stands in for the prepare/index/rollback/alias steps of the v0.2 dataset APIs"""
+
+    def __init__(self, monkeypatch, fail_chunk=None):
+        self.fail_chunk = fail_chunk
+        self.chunks = []
+        self.rolled_back = []
+        self.aliases = []
+        monkeypatch.setattr(api, 'get_bulk_kwargs', lambda pipeline=None: {})
+        monkeypatch.setattr(api, 'prepare_bulk', self.prepare_bulk)
+        monkeypatch.setattr(api, 'index_bulk', self.index_bulk)
+        monkeypatch.setattr(api, 'index_bulk_partial', self.index_bulk_partial)
+        monkeypatch.setattr(api, 'rollback_docs', lambda delete_docs, **kwargs: self.rolled_back.extend(delete_docs))
+        monkeypatch.setattr(api, 'add_aliases', lambda index_aliases: self.aliases.append(list(index_aliases)))
+
+    @staticmethod
+    def prepare_bulk(datasets, pipeline=None):
+        docs_bulk = []
+        for ds in datasets:
+            docs_bulk.append({'index': {'_index': 'grq_1_test', '_id': ds['id']}})
+            docs_bulk.append(ds)
+        return docs_bulk, [('grq_1_test', 'custom_%s' % ds['alias']) for ds in datasets if 'alias' in ds]
+
+    def index_bulk(self, docs_bulk, delete_docs, **kwargs):
+        self.chunks.append([doc['id'] for doc in docs_bulk[1::2]])
+        delete_docs.extend({'delete': action['index']} for action in docs_bulk[::2])
+        if len(self.chunks) == self.fail_chunk:
+            return [{'index': {'error': 'failed'}}]
+        return []
+
+    def index_bulk_partial(self, docs_bulk, **kwargs):
+        self.chunks.append([doc['id'] for doc in docs_bulk[1::2]])
+        return len(docs_bulk) // 2, []
+
+
+def ndjson(count, alias_every=None):
+    lines = []
+    for i in range(count):
+        ds = {'id': 'ds-%d' % i}
+        if alias_every and i % alias_every == 0:
+            ds['alias'] = str(i)
+        lines.append(json.dumps(ds))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def test_stream_indexes_in_chunks_and_adds_aliases_at_the_end(client, config, monkeypatch):
+    config(STREAM_CHUNK_SIZE=2)
+    ingest = FakeIngest(monkeypatch)
+    resp = client.post('/api/v0.2/grq/dataset/index/stream', data=ndjson(5, alias_every=2))
+    assert resp.status_code == 200 and resp.json['success'] is True
+    assert ingest.chunks == [['ds-0', 'ds-1'], ['ds-2', 'ds-3'], ['ds-4']]
+    assert ingest.aliases == [[('grq_1_test', 'custom_0'), ('grq_1_test', 'custom_2'), ('grq_1_test', 'custom_4')]]
+    assert ingest.rolled_back == []
+
+
+def test_stream_failure_rolls_back_everything_without_aliases(client, config, monkeypatch):
+    config(STREAM_CHUNK_SIZE=2)
+    ingest = FakeIngest(monkeypatch, fail_chunk=3)
+    resp = client.post('/api/v0.2/grq/dataset/index/stream', data=ndjson(6, alias_every=1))
+    assert resp.status_code == 400 and resp.json['success'] is False
+    assert [d['delete']['_id'] for d in ingest.rolled_back] == ['ds-%d' % i for i in range(6)]
+    assert ingest.aliases == []
+
+
+def test_stream_over_rollback_limit_is_rejected(client, config, monkeypatch):
+    config(STREAM_CHUNK_SIZE=2, STREAM_ROLLBACK_LIMIT=3)
+    ingest = FakeIngest(monkeypatch)
+    resp = client.post('/api/v0.2/grq/dataset/index/stream', data=ndjson(10))
+    assert resp.status_code == 400
+    assert 'STREAM_ROLLBACK_LIMIT' in resp.json['message']
+    assert len(ingest.chunks) == 2 and len(ingest.rolled_back) == 4
+    assert ingest.aliases == []
+
+
+def test_stream_partial_mode_is_not_limited(client, config, monkeypatch):
+    config(STREAM_CHUNK_SIZE=2, STREAM_ROLLBACK_LIMIT=3)
+    ingest = FakeIngest(monkeypatch)
+    resp = client.post('/api/v0.2/grq/dataset/index/stream?partial=true', data=ndjson(10, alias_every=5))
+    assert resp.status_code == 200
+    assert len(ingest.chunks) == 5 and ingest.rolled_back == []
+    assert [a for a in ingest.aliases if a] == [[('grq_1_test', 'custom_0')], [('grq_1_test', 'custom_5')]]
+
+
+def test_stream_over_decompressed_length_is_rolled_back(client, app, config, monkeypatch):
+    config(STREAM_CHUNK_SIZE=100)
+    ingest = FakeIngest(monkeypatch)
+    body = ndjson(20000)  # larger than the decompressed read buffer
+    monkeypatch.setattr(app, 'wsgi_app', DecompressedRequest(app.wsgi_app, max_length=len(body) // 2))
+    resp = client.post('/api/v0.2/grq/dataset/index/stream', data=gzip.compress(body),
+                       headers={'Content-Encoding': 'gzip'})
+    assert resp.status_code == 413 and resp.json['success'] is False
+    assert ingest.chunks and len(ingest.rolled_back) == sum(len(chunk) for chunk in ingest.chunks)
+
+
+class FlippingPipeline:
+    """get_ingest_pipeline() finding the pipeline (INGEST_PIPELINE_RETRY) after its first call"""
+
+    def __init__(self, monkeypatch):
+        self.calls = 0
+        monkeypatch.setattr(api, 'get_ingest_pipeline', self)
+        monkeypatch.setattr(api, 'is_geo_enriched', lambda: True)
+
+    def __call__(self):
+        self.calls += 1
+        return None if self.calls == 1 else 'dataset_enrich_pipeline'
+
+
+@pytest.fixture
+def bulk_requests(monkeypatch, grq_es):
+    """real prepare_bulk(), records the docs and kwargs of the bulk requests"""
+    monkeypatch.setattr(api, 'grq_es', grq_es)
+    monkeypatch.setattr(api, 'ensure_indices', lambda indices: None)
+    monkeypatch.setattr(api, 'get_footprint_cache', lambda: None)
+    monkeypatch.setattr(api, 'add_aliases', lambda index_aliases: None)
+    requests = []
+
+    def index_bulk(docs_bulk, delete_docs, **kwargs):
+        requests.append((docs_bulk[1::2], kwargs))
+        return []
+
+    monkeypatch.setattr(api, 'index_bulk', index_bulk)
+    return requests
+
+
+def assert_prepared_for_the_pipeline(requests):
+    for docs, kwargs in requests:
+        for doc in docs:
+            assert ('@timestamp' in doc and 'temporal_span' in doc) is ('pipeline' not in kwargs)
+
+
+def test_index_resolves_the_pipeline_once(client, monkeypatch, bulk_requests):
+    pipeline = FlippingPipeline(monkeypatch)
+    datasets = [{'id': 'ds-1', 'version': 'v1', 'starttime': '2020-01-01T00:00:00Z', 'endtime': '2020-01-02T00:00:00Z'}]
+    resp = client.post('/api/v0.2/grq/dataset/index', json=json.dumps(datasets))
+    assert resp.status_code == 200, resp.json
+    assert pipeline.calls == 1
+    assert_prepared_for_the_pipeline(bulk_requests)
+    assert 'pipeline' not in bulk_requests[0][1]
+
+
+def test_stream_resolves_the_pipeline_per_chunk(client, config, monkeypatch, bulk_requests):
+    config(STREAM_CHUNK_SIZE=1)
+    FlippingPipeline(monkeypatch)
+    lines = [json.dumps({'id': 'ds-%d' % i, 'version': 'v1', 'starttime': '2020-01-01T00:00:00Z',
+                         'endtime': '2020-01-02T00:00:00Z'}) for i in range(2)]
+    resp = client.post('/api/v0.2/grq/dataset/index/stream', data='\n'.join(lines).encode('utf-8'))
+    assert resp.status_code == 200, resp.json
+    assert ['pipeline' in kwargs for _, kwargs in bulk_requests] == [False, True]
+    assert_prepared_for_the_pipeline(bulk_requests)
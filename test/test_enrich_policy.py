@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import enrich_policy
+from enrich_policy import ENRICH_FIELDS, manage_policy
+
+
+class FakeEnrichES:
+    """records the calls made to create/refresh the enrich policy"""
+
+    def __init__(self, policies=()):
+        self.calls = []
+        self.policies = set(policies)
+        self.indices = SimpleNamespace(delete=self._call('delete_index'), refresh=self._call('refresh'),
+                                       create=self._call('create_index'))
+        self.enrich = SimpleNamespace(get_policy=self._get_policy, put_policy=self._put_policy,
+                                      execute_policy=self._call('execute_policy'))
+        self.ingest = SimpleNamespace(put_pipeline=self._call('put_pipeline'))
+
+    def _call(self, name):
+        return lambda **kwargs: self.calls.append((name, kwargs))
+
+    def _get_policy(self, name):
+        return {'policies': [{'config': {'geo_match': {'name': name}}}] if name in self.policies else []}
+
+    def _put_policy(self, name, body):
+        self.calls.append(('put_policy', {'name': name, 'body': body}))
+        self.policies.add(name)
+
+    def reindex(self, body, **kwargs):
+        self.calls.append(('reindex', {'body': body}))
+        return {'created': 3, 'failures': []}
+
+
+def names(es):
+    return [name for name, _ in es.calls]
+
+
+def test_create(monkeypatch, config):
+    config(INGEST_PIPELINE='dataset_enrich_pipeline', INGEST_PIPELINE_DATE_PARTS=False)
+    monkeypatch.setattr(enrich_policy, 'load_continents', lambda: [])
+    es = FakeEnrichES()
+    manage_policy(es, 'create', 'geonames_cities', 'geonames_enrich', 'geonames')
+    assert names(es) == ['delete_index', 'create_index', 'reindex', 'refresh', 'put_policy', 'execute_policy',
+                         'put_pipeline']
+
+    policy = es.calls[4][1]
+    assert policy['name'] == 'geonames_cities'
+    assert policy['body'] == {'geo_match': {'indices': 'geonames_enrich', 'match_field': 'shape',
+                                            'enrich_fields': ENRICH_FIELDS}}
+    assert es.calls[5][1]['name'] == 'geonames_cities'
+    pipeline = es.calls[6][1]
+    assert pipeline['id'] == 'dataset_enrich_pipeline'
+    assert any(p.get('enrich', {}).get('policy_name') == 'geonames_cities' for p in pipeline['body']['processors'])
+
+
+def test_refresh(monkeypatch):
+    monkeypatch.setattr(enrich_policy, 'load_continents', lambda: [])
+    es = FakeEnrichES(policies=['geonames_cities'])
+    manage_policy(es, 'refresh', 'geonames_cities', 'geonames_enrich', 'geonames')
+    assert names(es) == ['delete_index', 'create_index', 'reindex', 'refresh', 'execute_policy']
+
+    es = FakeEnrichES(policies=['geonames_cities'])
+    manage_policy(es, 'create', 'geonames_cities', 'geonames_enrich', 'geonames')  # existing policy kept
+    assert 'put_policy' not in names(es) and 'execute_policy' in names(es)
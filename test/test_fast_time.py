@@ -0,0 +1,90 @@
+import re
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from grq2.lib.fast_time import temporal_spans, parse_time_elements, epoch_seconds
+from grq2.lib.time_utils import getTemporalSpanInDays, getDatetimeFromString
+
+
+def reference_time_elements(dt_str):
+    """getTimeElementsFromString before the fast path"""
+    match = re.match(r'^(\d{4})[/-](\d{2})[/-](\d{2})[\s*T](\d{2}):(\d{2}):(\d{2})(?:\.\d+)?Z?$', dt_str)
+    if match:
+        return tuple(map(int, match.groups()))
+    match = re.match(r'^(\d{4})[/-](\d{2})[/-](\d{2})$', dt_str)
+    if match:
+        return tuple(map(int, match.groups())) + (0, 0, 0)
+    raise RuntimeError("Failed to recognize date format: %s" % dt_str)
+
+
+def reference_span(dt1, dt2):
+    """getTemporalSpanInDays before the fast path"""
+    dt1 = datetime(*reference_time_elements(dt1))
+    dt2 = datetime(*reference_time_elements(dt2))
+    temporal_diff = dt1 - dt2 if dt1 > dt2 else dt2 - dt1
+    temporal_span = abs(temporal_diff.days)
+    if abs(temporal_diff.seconds) >= 43200.:
+        temporal_span += 1
+    return temporal_span
+
+
+FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.123456Z', '%Y-%m-%dT%H:%M:%S.5',
+           '%Y/%m/%d %H:%M:%S', '%Y-%m-%d*%H:%M:%S', '%Y-%m-%d']
+
+
+def random_pairs(count, seed=0):
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        start = datetime(1990, 1, 1) + timedelta(seconds=rng.randrange(40 * 365 * 86400))
+        end = start + timedelta(seconds=rng.choice([0, 43199, 43200, 86399, 86400, rng.randrange(400 * 86400)]))
+        if rng.random() < 0.5:
+            start, end = end, start
+        pairs.append((start.strftime(rng.choice(FORMATS)), end.strftime(rng.choice(FORMATS))))
+    return pairs
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_temporal_spans_match_reference(use_numpy):
+    pairs = random_pairs(2000)
+    assert temporal_spans(pairs, use_numpy=use_numpy) == [reference_span(dt1, dt2) for dt1, dt2 in pairs]
+
+
+def test_temporal_span_in_days_matches_reference():
+    for dt1, dt2 in random_pairs(500, seed=1):
+        assert getTemporalSpanInDays(dt1, dt2) == reference_span(dt1, dt2)
+
+
+@pytest.mark.parametrize('dt1, dt2, expected', [
+    ('2020-01-01T00:00:00Z', '2020-01-01T11:59:59Z', 0),
+    ('2020-01-01T00:00:00Z', '2020-01-01T12:00:00Z', 1),
+    ('2020-01-01T12:00:00Z', '2020-01-01T00:00:00Z', 1),
+    ('2020-02-28T00:00:00', '2020-03-01T00:00:00', 2),  # leap year
+    ('2019-12-31', '2020-01-01T12:00:00.999Z', 2),
+])
+def test_temporal_span_rounding(dt1, dt2, expected):
+    assert getTemporalSpanInDays(dt1, dt2) == reference_span(dt1, dt2) == expected
+    assert temporal_spans([(dt1, dt2)] * 300) == [expected] * 300
+
+
+@pytest.mark.parametrize('dt_str', ['2020-01-01T00:00:00+00:00', '20200101T000000', '2020-1-01', 'yesterday',
+                                    '2020-01-01T00:00:0Z'])
+def test_parse_rejects_like_reference(dt_str):
+    with pytest.raises(RuntimeError):
+        reference_time_elements(dt_str)
+    with pytest.raises(RuntimeError):
+        parse_time_elements(dt_str)
+
+
+def test_parse_non_ascii_digits_like_reference():
+    dt_str = '\uff12\uff10\uff12\uff10-01-01T00:00:00'  # fullwidth digits, matched by the reference regex
+    assert parse_time_elements(dt_str) == reference_time_elements(dt_str) == (2020, 1, 1, 0, 0, 0)
+
+
+def test_invalid_dates_raise():
+    with pytest.raises(ValueError):
+        epoch_seconds('2021-02-29T00:00:00Z')
+    with pytest.raises(ValueError):
+        getDatetimeFromString('2021-13-01')
@@ -0,0 +1,136 @@
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from grq2.lib import footprint_cache
+from grq2.lib.footprint_cache import FootprintCache, footprint_key, footprint_entry, apply_footprint_entry
+
+
+SQUARE = [[[-118.1, 34.2], [-117.0, 34.2], [-117.0, 35.0], [-118.1, 34.2]]]
+REDIS_URL = 'redis://localhost:6379/0'
+
+
+def dataset(coordinates=SQUARE, geo_type='polygon', **kwargs):
+    doc = {'id': 'ds', 'location': {'type': geo_type, 'coordinates': coordinates}}
+    doc.update(kwargs)
+    return doc
+
+
+def test_footprint_key_normalization():
+    key = footprint_key(dataset())
+    assert key == footprint_key(dataset(geo_type='Polygon'))
+    assert key == footprint_key(dataset([[[-118.100001, 34.2], [-117, 34.2], [-117.0, 35.0], [-118.1, 34.2]]]))
+    assert key == footprint_key(dataset([[p + [120.] for p in SQUARE[0]]]))  # elevation ignored
+    assert key != footprint_key(dataset([[[-118.10001, 34.2], [-117.0, 34.2], [-117.0, 35.0], [-118.1, 34.2]]]))
+    rounded = dataset([[[-118, 34], [-117, 34], [-117, 35], [-118, 34]]])
+    assert key != footprint_key(dataset(), precision=0) == footprint_key(rounded, precision=0)
+    assert footprint_key(dataset([0.0, -0.0], 'point')) == footprint_key(dataset([-0.000001, 0.000001], 'point'))
+
+
+def test_footprint_key_with_center():
+    center = {'type': 'point', 'coordinates': [-117.5, 34.5]}
+    assert footprint_key(dataset(center=center)) != footprint_key(dataset())
+    assert footprint_key(dataset(center=center)) == footprint_key(dataset(center={'coordinates': [-117.500001, 34.5]}))
+
+
+@pytest.mark.parametrize('doc', [
+    {'id': 'no location'},
+    dataset(geo_type='GeometryCollection'),
+    dataset(coordinates=None),
+    {'id': 'no coordinates', 'location': {'type': 'polygon'}},
+    dataset(center={'type': 'point'}),
+    dataset(coordinates=[['a', 'b']], geo_type='linestring'),
+])
+def test_footprint_key_unsupported(doc):
+    assert footprint_key(doc) is None
+
+
+def test_apply_footprint_entry():
+    doc = dataset(center={'type': 'point', 'coordinates': [-117.5, 34.5]})
+    entry = footprint_entry(doc, [{'name': 'Pasadena'}], 'North America')
+
+    other = dataset()
+    apply_footprint_entry(other, entry)
+    assert other['center'] == {'type': 'point', 'coordinates': [-117.5, 34.5]}
+    assert other['city'] == [{'name': 'Pasadena'}] and other['continent'] == 'North America'
+
+    no_city = dataset(center={'type': 'point', 'coordinates': [0., 0.]})
+    apply_footprint_entry(no_city, {'center': [1., 1.], 'city': [], 'continent': None})
+    assert no_city['center']['coordinates'] == [0., 0.] and 'city' not in no_city and 'continent' not in no_city
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    monkeypatch.setattr(footprint_cache, 'Redis', fakeredis.FakeRedis)
+    fakeredis.FakeRedis.from_url(REDIS_URL).flushall()  # the fake redis servers are shared by URL
+
+
+def test_entries_are_copies():
+    cache = FootprintCache(10)
+    cache.put_many({'a': {'center': [1., 2.], 'city': [{'name': 'x'}], 'continent': 'Europe'}})
+    entry = cache.get_many(['a', 'b'])['a']
+    entry['city'].append({'name': 'y'})
+    assert cache.get_many(['a']) == {'a': {'center': [1., 2.], 'city': [{'name': 'x'}], 'continent': 'Europe'}}
+
+
+def test_lru_eviction():
+    cache = FootprintCache(2)
+    cache.put_many({'a': {'n': 1}, 'b': {'n': 2}})
+    cache.get_many(['a'])  # b is now the least recently used
+    cache.put_many({'c': {'n': 3}})
+    assert len(cache) == 2
+    assert set(cache.get_many(['a', 'b', 'c'])) == {'a', 'c'}
+
+
+def test_expiration(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(footprint_cache.time, 'time', lambda: now[0])
+    cache = FootprintCache(10, ttl=60)
+    cache.put_many({'a': {'n': 1}})
+    now[0] += 59
+    assert cache.get_many(['a']) == {'a': {'n': 1}}
+    now[0] += 1
+    assert cache.get_many(['a']) == {}
+    assert len(cache) == 0
+
+
+def test_shared_through_redis(fake_redis):
+    first = FootprintCache(10, ttl=60, redis_url=REDIS_URL, prefix='test:')
+    second = FootprintCache(10, ttl=60, redis_url=REDIS_URL, prefix='test:')
+    first.put_many({'a': {'n': 1}})
+    assert 0 < second.redis.ttl('test:a') <= 60
+
+    assert second.get_many(['a', 'b']) == {'a': {'n': 1}}
+    assert len(second) == 1  # kept in process
+
+    other_index = FootprintCache(10, redis_url=REDIS_URL, prefix='other:')
+    assert other_index.get_many(['a']) == {}
+
+
+def test_redis_errors_are_misses(fake_redis, monkeypatch):
+    cache = FootprintCache(10, redis_url=REDIS_URL)
+
+    def unavailable(*args, **kwargs):
+        raise RedisConnectionError("connection refused")
+
+    monkeypatch.setattr(cache.redis, 'mget', unavailable)
+    monkeypatch.setattr(cache.redis, 'pipeline', unavailable)
+    cache.put_many({'a': {'n': 1}})  # kept in process
+    assert cache.get_many(['a', 'b']) == {'a': {'n': 1}}
+
+
+def test_get_footprint_cache(monkeypatch, config, fake_redis):
+    monkeypatch.setattr(footprint_cache, '_cache', None)
+    config(FOOTPRINT_CACHE_SIZE=0)
+    assert footprint_cache.get_footprint_cache() is None
+
+    config(FOOTPRINT_CACHE_SIZE=100, FOOTPRINT_CACHE_REDIS=True, GEONAMES_CITIES_INDEX='geonames_cities',
+           CONTINENT_RESOLVER=False, CONTINENT_OUTLINES='continents.geojson')
+    cache = footprint_cache.get_footprint_cache()
+    assert cache.size == 100 and cache.redis is not None
+    assert cache.prefix == 'grq_footprint_cache:geonames_cities:nearest:'
+    assert footprint_cache.get_footprint_cache() is cache
+
+    monkeypatch.setattr(footprint_cache, '_cache', None)
+    config(CONTINENT_RESOLVER=True)  # continents of the outlines, not cached along the closest continent points
+    assert footprint_cache.get_footprint_cache().prefix == 'grq_footprint_cache:geonames_cities:outlines:'
@@ -0,0 +1,122 @@
+from future import standard_library
+standard_library.install_aliases()
+
+import gzip
+import json
+import random
+
+import pytest
+
+from grq2.lib.geocoder import LocalGeocoder, haversine_km, point_in_ring, is_populated_place
+
+
+def make_places(count=2000, seed=7):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(count):
+        docs.append({
+            'geonameid': str(i),
+            'name': 'place %d' % i,
+            'feature_class': rng.choice(('P', 'P', 'P', 'A')),
+            'feature_code': 'PPL',
+            'population': rng.choice((0, rng.randint(1, 5000000))),
+            'location': {'lon': rng.uniform(-180., 180.), 'lat': rng.uniform(-80., 80.)},
+        })
+    return docs
+
+
+CONTINENTS = [
+    {'geonameid': 'eu', 'name': 'Europe', 'feature_class': 'L', 'feature_code': 'CONT',
+     'location': {'lon': 9.14062, 'lat': 48.69096}},
+    {'geonameid': 'na', 'name': 'North America', 'feature_class': 'L', 'feature_code': 'CONT',
+     'location': {'lon': -100.54688, 'lat': 46.07323}},
+]
+
+
+def brute_force_cities(docs, ring, size):
+    hits = [d for d in docs
+            if is_populated_place(d) and point_in_ring(d['location']['lon'], d['location']['lat'], ring)]
+    hits.sort(key=lambda d: d['population'], reverse=True)
+    return [d['geonameid'] for d in hits[:size]]
+
+
+def brute_force_nearest(docs, lon, lat, size, distance=100.):
+    hits = []
+    for d in docs:
+        if is_populated_place(d):
+            dist = haversine_km(lon, lat, d['location']['lon'], d['location']['lat'])
+            if dist <= distance:
+                hits.append((dist, d['geonameid']))
+    return [geonameid for _, geonameid in sorted(hits)[:size]]
+
+
+@pytest.mark.parametrize('cell_size', [0.5, 1., 5.])
+def test_get_cities_matches_brute_force(cell_size):
+    docs = make_places()
+    geocoder = LocalGeocoder(docs, cell_size=cell_size)
+    rng = random.Random(1)
+    for _ in range(50):
+        lon, lat = rng.uniform(-170., 160.), rng.uniform(-70., 60.)
+        ring = [[lon, lat], [lon + 10., lat], [lon + 8., lat + 12.], [lon - 1., lat + 9.], [lon, lat]]
+        found = [d['geonameid'] for d in geocoder.get_cities(ring, size=5)]
+        assert found == brute_force_cities(docs, ring, 5)
+
+
+def test_get_cities_multipolygon_is_an_or_of_the_rings():
+    docs = make_places()
+    geocoder = LocalGeocoder(docs)
+    ring1 = [[0., 0.], [20., 0.], [20., 20.], [0., 20.], [0., 0.]]
+    ring2 = [[40., 0.], [60., 0.], [60., 20.], [40., 20.], [40., 0.]]
+    found = [d['geonameid'] for d in geocoder.get_cities([ring1, ring2, []], size=10, multipolygon=True)]
+
+    expected = [d for d in docs if is_populated_place(d) and
+                (point_in_ring(d['location']['lon'], d['location']['lat'], ring1) or
+                 point_in_ring(d['location']['lon'], d['location']['lat'], ring2))]
+    expected.sort(key=lambda d: d['population'], reverse=True)
+    assert found == [d['geonameid'] for d in expected[:10]]
+
+
+def test_get_nearest_cities_matches_brute_force():
+    docs = make_places(count=20000)
+    geocoder = LocalGeocoder(docs)
+    rng = random.Random(2)
+    points = [(rng.uniform(-180., 180.), rng.uniform(-80., 80.)) for _ in range(30)]
+    points += [(179.9, 10.), (-179.9, -10.)]  # circles crossing the antimeridian
+    for lon, lat in points:
+        found = [d['geonameid'] for d in geocoder.get_nearest_cities(lon, lat, size=5)]
+        assert found == brute_force_nearest(docs, lon, lat, 5)
+
+
+def test_get_nearest_cities_across_antimeridian():
+    docs = [
+        {'geonameid': 'east', 'feature_class': 'P', 'population': 10, 'location': {'lon': 179.8, 'lat': 0.}},
+        {'geonameid': 'west', 'feature_class': 'P', 'population': 10, 'location': {'lon': -179.9, 'lat': 0.}},
+    ]
+    found = [d['geonameid'] for d in LocalGeocoder(docs).get_nearest_cities(-179.95, 0.)]
+    assert found == ['west', 'east']
+
+
+def test_continents_and_filters():
+    docs = make_places(count=100) + CONTINENTS
+    geocoder = LocalGeocoder(docs)
+    assert len(geocoder) == sum(1 for d in docs if is_populated_place(d))
+    assert [c['name'] for c in geocoder.get_continents(2.35, 48.85)] == ['Europe', 'North America']
+    assert [c['name'] for c in geocoder.get_continents(-74., 40.7, size=1)] == ['North America']
+
+
+def test_results_are_copies():
+    docs = [{'geonameid': '1', 'feature_class': 'P', 'population': 5, 'location': {'lon': 1., 'lat': 1.}}]
+    geocoder = LocalGeocoder(docs)
+    geocoder.get_nearest_cities(1., 1.)[0]['name'] = 'changed'
+    assert 'name' not in geocoder.get_nearest_cities(1., 1.)[0]
+
+
+def test_from_snapshot(tmp_path):
+    docs = make_places(count=200) + CONTINENTS
+    path = str(tmp_path / 'snapshot.jsonl.gz')
+    with gzip.open(path, 'wt') as f:
+        for doc in docs:
+            f.write(json.dumps(doc) + '\n\n')
+    geocoder = LocalGeocoder.from_snapshot(path)
+    assert len(geocoder) == len(LocalGeocoder(docs))
+    assert len(geocoder.continents) == 2
@@ -0,0 +1,66 @@
+import pytest
+from shapely.geometry import shape
+
+from grq2.lib import geometry
+from grq2.lib.geometry import prepare_geometries, normalize_geojson_type
+
+
+LOCATIONS = [
+    {'type': 'point', 'coordinates': [-118.17, 34.2]},
+    {'type': 'Polygon', 'coordinates': [[[-118, 34], [-117, 34], [-117, 35.5], [-118, 35], [-118, 34]]]},
+    {'type': 'polygon', 'coordinates': [[[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]],
+                                        [[1, 1], [2, 1], [2, 2], [1, 2], [1, 1]]]},  # with a hole
+    {'type': 'multipolygon', 'coordinates': [
+        [[[10, 10], [11, 10], [11, 11], [10, 11], [10, 10]]],
+        [[[20, 20], [22, 20], [22, 23], [20, 23], [20, 20]]],
+    ]},
+    {'type': 'linestring', 'coordinates': [[1, 2], [3, 4], [6, 4]]},
+    {'type': 'MultiPoint', 'coordinates': [[1, 1], [3, 5]]},
+    {'type': 'multilinestring', 'coordinates': [[[0, 0], [1, 1]], [[5, 5], [5, 8], [6, 8]]]},
+    {'type': 'Polygon', 'coordinates': [[[-5, -5, 100], [5, -5, 100], [5, 5, 120], [-5, -5, 100]]]},  # 3D
+    {'type': 'GeometryCollection', 'geometries': []},
+]
+
+
+def expected(location):
+    geo_type = normalize_geojson_type(location['type'])
+    if geo_type is None:
+        return None
+    geo_shape = shape({'type': geo_type, 'coordinates': location['coordinates']})
+    return geo_type, (geo_shape.centroid.x, geo_shape.centroid.y), tuple(geo_shape.bounds)
+
+
+def assert_matches_shape(results, locations):
+    assert len(results) == len(locations)
+    for info, location in zip(results, locations):
+        exp = expected(location)
+        if exp is None:
+            assert info is None
+            continue
+        assert info.type == exp[0]
+        assert info.center == pytest.approx(exp[1])
+        assert info.bounds == pytest.approx(exp[2])
+
+
+def test_prepare_geometries_matches_shape():
+    assert_matches_shape(prepare_geometries(LOCATIONS), LOCATIONS)
+
+
+def test_prepare_geometries_shapely_1_fallback(monkeypatch):
+    monkeypatch.delattr(geometry.shapely, 'from_ragged_array')
+    assert_matches_shape(prepare_geometries(LOCATIONS), LOCATIONS)
+
+
+def test_prepare_geometries_invalid_geometry():
+    locations = [
+        {'type': 'polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]},
+        {'type': 'polygon', 'coordinates': [[[0, 0], [1, 0]]]},  # not a linear ring
+    ]
+    with pytest.raises(ValueError):
+        prepare_geometries(locations)  # same error as shape()
+
+
+def test_ragged_array_layout():
+    coords, offsets = geometry.ragged_array('MultiPolygon', [LOCATIONS[3]['coordinates']])
+    assert coords.shape == (10, 2)
+    assert [o.tolist() for o in offsets] == [[0, 5, 10], [0, 1, 2], [0, 2]]
@@ -0,0 +1,152 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import import_ES
+from import_ES import FIELD_NAMES, CITIES_MAPPING, build_cities_index, parse
+
+
+COUNTRIES = 'US\tUSA\t840\tUS\tUnited States\tWashington\t9629091\t310232863\tNA\n'
+ADMIN1 = 'US.CA\tCalifornia\tCalifornia\t5332921\n'
+ADMIN2 = 'US.CA.037\tLos Angeles County\tLos Angeles County\t5368381\n'
+
+
+def make_line(geonameid, population=1000):
+    values = dict.fromkeys(FIELD_NAMES, '')
+    values.update(geonameid=str(geonameid), name='place %d' % geonameid, latitude='34.1', longitude='-118.1',
+                  feature_class='P', feature_code='PPL', country_code='US', admin1_code='CA', admin2_code='037',
+                  population=str(population))
+    return '\t'.join(values[name] for name in FIELD_NAMES) + '\n'
+
+
+class FakeBulkES:
+    """records the indexed docs, the ids in failing are rejected by the bulk requests"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.indexed = []
+        self.settings = {'index.refresh_interval': '30s'}
+        self.indices = SimpleNamespace(get_settings=self._get_settings, put_settings=self._put_settings,
+                                       refresh=lambda index: None)
+
+    def _get_settings(self, index, flat_settings):
+        return {index: {'settings': dict(self.settings)}}
+
+    def _put_settings(self, index, body):
+        self.settings.update(('index.%s' % k, v) for k, v in body['index'].items())
+
+    def parallel_bulk(self, es, actions, **kwargs):
+        for action in actions:
+            if action['_id'] in self.failing:
+                yield False, {'index': {'_id': action['_id'], 'status': 400, 'error': {'type': 'mapper_parsing'}}}
+            else:
+                self.indexed.append(action['_id'])
+                yield True, {'index': {'_id': action['_id'], 'status': 201}}
+
+
+@pytest.fixture
+def geonames_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'countryInfo.txt').write_text('#ISO\tISO3\n' + COUNTRIES)
+    (tmp_path / 'admin1CodesASCII.txt').write_text(ADMIN1)
+    (tmp_path / 'admin2Codes.txt').write_text(ADMIN2)
+    with open(str(tmp_path / 'allCountries.txt'), 'w') as f:
+        for i in range(1, 11):
+            f.write(make_line(i))
+    return tmp_path
+
+
+def load(es, monkeypatch, **kwargs):
+    monkeypatch.setattr(import_ES, 'os_helpers', es)  # not an Elasticsearch instance
+    return parse(es, 'allCountries.txt', workers=1, checkpoint_every=3, **kwargs)
+
+
+def test_load(geonames_dir, monkeypatch):
+    es = FakeBulkES()
+    assert load(es, monkeypatch) == 10
+    assert es.indexed == [str(i) for i in range(1, 11)]
+    assert es.settings['index.refresh_interval'] == '30s'  # restored
+    assert not (geonames_dir / 'allCountries.txt.checkpoint').exists()
+    assert not (geonames_dir / 'allCountries.txt.failed').exists()
+
+
+def test_checkpoint_stops_at_failed_docs(geonames_dir, monkeypatch):
+    es = FakeBulkES(failing=['4', '8'])
+    with pytest.raises(RuntimeError, match='2 documents failed'):
+        load(es, monkeypatch)
+    assert len(es.indexed) == 8  # the load goes on past the failures
+    assert es.settings['index.refresh_interval'] == '30s'
+
+    checkpoint = json.loads((geonames_dir / 'allCountries.txt.checkpoint').read_text())
+    assert checkpoint['position'] == len(''.join(make_line(i) for i in range(1, 4)))
+    assert checkpoint['docs'] == 3
+    failed = [json.loads(line) for line in (geonames_dir / 'allCountries.txt.failed').read_text().splitlines()]
+    assert [item['index']['_id'] for item in failed] == ['4', '8']
+
+    # fixed, the next run resumes from the first failed doc
+    es = FakeBulkES()
+    assert load(es, monkeypatch) == 10
+    assert es.indexed == [str(i) for i in range(4, 11)]
+    assert not (geonames_dir / 'allCountries.txt.checkpoint').exists()
+    assert not (geonames_dir / 'allCountries.txt.failed').exists()
+
+
+class FakeCitiesES:
+    """indices and aliases, update_aliases() is atomic and rejects an alias named like an index (as ES does)"""
+
+    def __init__(self, indices=(), aliases=None):
+        self.existing = {index: {} for index in indices}
+        self.aliases = dict(aliases or {})  # alias -> indices
+        self.deleted = []
+        self.indices = SimpleNamespace(
+            exists=lambda index: index in self.existing, exists_alias=lambda name: name in self.aliases,
+            get_alias=lambda name: {i: {'aliases': {name: {}}} for i in self.aliases[name]},
+            create=self._create, update_aliases=self._update_aliases, delete=self._delete,
+            put_settings=lambda index, body: None, forcemerge=lambda **kwargs: None, refresh=lambda index: None)
+
+    def _create(self, index, body):
+        assert body['mappings'] == CITIES_MAPPING
+        self.existing[index] = body
+
+    def _delete(self, index, ignore=None):
+        self.deleted.append(index)
+        self.existing.pop(index, None)
+
+    def reindex(self, body, wait_for_completion, request_timeout):
+        return {'created': 3, 'failures': []}
+
+    def _update_aliases(self, body):
+        existing = set(self.existing)
+        aliases = {alias: set(indices) for alias, indices in self.aliases.items()}
+        for action in body['actions']:
+            (op, params), = action.items()
+            if op == 'remove_index':
+                existing.remove(params['index'])
+            elif op == 'remove':
+                aliases[params['alias']].remove(params['index'])
+            else:
+                if params['alias'] in existing:
+                    raise RuntimeError("invalid_alias_name_exception: an index exists with the same name as the alias")
+                aliases.setdefault(params['alias'], set()).add(params['index'])
+        self.existing = {index: self.existing[index] for index in existing}
+        self.aliases = {alias: indices for alias, indices in aliases.items() if indices}
+
+
+def test_build_cities_index():
+    es = FakeCitiesES(indices=['geonames'])
+    first = build_cities_index(es, 'geonames_cities')
+    assert es.aliases == {'geonames_cities': {first}}
+
+    es.indices.create(index='geonames_cities_1', body={'mappings': CITIES_MAPPING})
+    es.aliases['geonames_cities'] = {'geonames_cities_1'}
+    second = build_cities_index(es, 'geonames_cities')
+    assert es.aliases == {'geonames_cities': {second}}
+    assert es.deleted == ['geonames_cities_1']
+
+
+def test_build_cities_index_replaces_a_concrete_index():
+    es = FakeCitiesES(indices=['geonames', 'geonames_cities'])
+    index = build_cities_index(es, 'geonames_cities')
+    assert es.aliases == {'geonames_cities': {index}}
+    assert set(es.existing) == {'geonames', index}
@@ -0,0 +1,177 @@
+import os
+import time
+
+import fakeredis
+import pytest
+
+from grq2.lib import ingest_queue
+from grq2.lib.ingest_queue import (RedisIngestQueue, SpoolIngestQueue, IngestWriter, QUEUED, SUCCEEDED, FAILED)
+
+
+@pytest.fixture
+def redis_queue(monkeypatch):
+    monkeypatch.setattr(ingest_queue, 'Redis', fakeredis.FakeRedis)
+    queue = RedisIngestQueue('redis://localhost:6379/0', name='test_ingest')
+    queue.redis.flushall()  # the fake redis servers are shared by URL
+    return queue
+
+
+@pytest.fixture
+def spool_queue(tmp_path):
+    return SpoolIngestQueue(str(tmp_path))
+
+
+@pytest.fixture(params=['redis', 'spool'])
+def queue(request, redis_queue, spool_queue):
+    return redis_queue if request.param == 'redis' else spool_queue
+
+
+def datasets(prefix, count):
+    return [{'id': '%s-%d' % (prefix, i)} for i in range(count)]
+
+
+def test_put_claim_ack(queue):
+    ticket = queue.put(datasets('a', 2))
+    assert queue.get_status(ticket) == {'state': QUEUED, 'count': 2}
+
+    entries = queue.claim(10, 100, timeout=0)
+    assert [entry['ticket'] for _, entry in entries] == [ticket]
+    assert entries[0][1]['datasets'] == datasets('a', 2)
+    assert queue.claim(10, 100, timeout=0) == []
+
+    queue.ack(*entries[0])
+    queue.recover(0)
+    assert queue.claim(10, 100, timeout=0) == []
+
+
+def test_claim_limits(queue):
+    tickets = [queue.put(datasets(p, 3)) for p in 'abcd']
+
+    entries = queue.claim(2, 100, timeout=0)
+    assert [entry['ticket'] for _, entry in entries] == tickets[:2]  # FIFO
+    entries = queue.claim(10, 3, timeout=0)
+    assert [entry['ticket'] for _, entry in entries] == tickets[2:3]
+    assert len(queue.claim(10, 100, timeout=0)) == 1
+
+
+def test_recover_stale_claims(queue, monkeypatch):
+    ticket = queue.put(datasets('a', 1))
+    assert len(queue.claim(10, 100, timeout=0)) == 1
+
+    queue.recover(600)
+    assert queue.claim(10, 100, timeout=0) == []  # claimed recently, not re-queued
+
+    now = time.time()
+    monkeypatch.setattr(ingest_queue.time, 'time', lambda: now + 601)
+    if isinstance(queue, SpoolIngestQueue):
+        monkeypatch.setattr(os.path, 'getmtime', lambda path: now)
+    queue.recover(600)
+    entries = queue.claim(10, 100, timeout=0)
+    assert [entry['ticket'] for _, entry in entries] == [ticket]
+
+
+def test_spool_claim_not_recovered_while_moved(spool_queue, monkeypatch):
+    ticket = spool_queue.put(datasets('a', 1))
+    queued = os.path.join(spool_queue.queue_dir, os.listdir(spool_queue.queue_dir)[0])
+    os.utime(queued, (time.time() - 3600, time.time() - 3600))  # queued an hour ago
+
+    rename = os.rename
+
+    def rename_then_recover(src, dst):
+        rename(src, dst)
+        if src == queued:
+            spool_queue.recover(600)  # another worker, right after the move
+
+    monkeypatch.setattr(ingest_queue.os, 'rename', rename_then_recover)
+    assert [entry['ticket'] for _, entry in spool_queue.claim(10, 100, timeout=0)] == [ticket]
+    monkeypatch.undo()
+    assert os.listdir(spool_queue.queue_dir) == []  # not re-queued
+
+
+def test_redis_claim_records_claim_time(redis_queue):
+    ticket = redis_queue.put(datasets('a', 1))
+    before = time.time()
+    redis_queue.claim(10, 100, timeout=0)
+    claimed_at = redis_queue.redis.hget(redis_queue.claims_key, ticket)
+    assert claimed_at is not None and float(claimed_at) >= before
+
+
+def test_redis_recover_unrecorded_claim(redis_queue, monkeypatch):
+    # payload moved to the processing list without a claim time (ie. claimed by an older version)
+    ticket = redis_queue.put(datasets('a', 1))
+    redis_queue.redis.rpoplpush(redis_queue.queue_key, redis_queue.processing_key)
+
+    redis_queue.recover(600)
+    assert redis_queue.redis.llen(redis_queue.queue_key) == 0  # considered just claimed
+    assert redis_queue.redis.hget(redis_queue.claims_key, ticket) is not None
+
+    now = time.time()
+    monkeypatch.setattr(ingest_queue.time, 'time', lambda: now + 601)
+    redis_queue.recover(600)
+    assert redis_queue.redis.llen(redis_queue.queue_key) == 1
+    assert redis_queue.redis.hget(redis_queue.claims_key, ticket) is None
+
+
+def test_redis_recover_drops_orphan_claims(redis_queue, monkeypatch):
+    redis_queue.redis.hset(redis_queue.claims_key, 'acked', time.time())
+    now = time.time()
+    monkeypatch.setattr(ingest_queue.time, 'time', lambda: now + 601)
+    redis_queue.recover(600)
+    assert redis_queue.redis.hlen(redis_queue.claims_key) == 0
+
+
+def test_writer_coalesces_payloads(redis_queue):
+    ok = redis_queue.put(datasets('ok', 2))
+    bad = redis_queue.put(datasets('bad', 2))
+    batches = []
+
+    def process(docs):
+        batches.append([ds['id'] for ds in docs])
+        return len(docs) - 1, [{'index': {'_id': 'bad-1', 'status': 400}}]
+
+    writer = IngestWriter(redis_queue, process, poll_interval=0)
+    assert writer.drain_once() == 2
+    assert batches == [['ok-0', 'ok-1', 'bad-0', 'bad-1']]
+
+    assert redis_queue.get_status(ok)['state'] == SUCCEEDED
+    status = redis_queue.get_status(bad)
+    assert status['state'] == FAILED and status['indexed'] == 1
+    assert redis_queue.redis.llen(redis_queue.processing_key) == 0
+    assert redis_queue.redis.hlen(redis_queue.claims_key) == 0
+
+
+def test_writer_isolates_failing_payload(spool_queue):
+    ok = spool_queue.put(datasets('ok', 1))
+    bad = spool_queue.put(datasets('bad', 1))
+
+    def process(docs):
+        if any(ds['id'].startswith('bad') for ds in docs):
+            raise ValueError("unable to index")
+        return len(docs), []
+
+    writer = IngestWriter(spool_queue, process, poll_interval=0)
+    assert writer.drain_once() == 2
+    assert spool_queue.get_status(ok)['state'] == SUCCEEDED
+    assert spool_queue.get_status(bad)['state'] == FAILED
+    assert os.listdir(spool_queue.processing_dir) == []
+
+
+def test_writer_retries_unaltered_payloads(spool_queue):
+    location = {'type': 'Point', 'coordinates': [1., 2.]}
+    ok = spool_queue.put([{'id': 'ok-0', 'location': location}])
+    spool_queue.put(datasets('bad', 1))
+    seen = []
+
+    def process(docs):
+        seen.append([ds.get('location', {}).get('type') for ds in docs])
+        for ds in docs:
+            if 'location' in ds:  # same as prepare_bulk()
+                ds['location']['type'] = ds['location']['type'].lower()
+        if any(ds['id'].startswith('bad') for ds in docs):
+            raise ValueError("unable to index")
+        return len(docs), []
+
+    writer = IngestWriter(spool_queue, process, poll_interval=0)
+    assert writer.drain_once() == 2
+    assert spool_queue.get_status(ok)['state'] == SUCCEEDED
+    assert seen == [['Point', None], ['Point'], [None]]  # the payload is retried as queued
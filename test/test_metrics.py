@@ -0,0 +1,73 @@
+import pytest
+from flask import Flask
+
+from grq2.lib.metrics import Metrics, batch_labels, MIXED
+from grq2.services import metrics as service
+from grq2.services.metrics import mod
+
+
+def test_disabled_metrics_are_noop():
+    metrics = Metrics()
+    metrics.inc('grq_ingest_docs_total')
+    with metrics.context(dataset='a'), metrics.timer('bulk'):
+        pass
+    assert [line for line in metrics.render().splitlines() if not line.startswith('#')] == []
+
+
+def test_render():
+    metrics = Metrics(enabled=True)
+    with metrics.context(dataset='a', index='grq_1_a'):
+        metrics.inc('grq_ingest_docs_total', 3)
+        metrics.inc('grq_ingest_docs_total', 2)
+        metrics.observe('grq_ingest_stage_seconds', 0.5, stage='bulk')
+        metrics.observe('grq_ingest_stage_seconds', 0.25, stage='bulk')
+    metrics.inc('grq_ingest_errors_total', dataset='with "quotes"\n')
+
+    lines = metrics.render().splitlines()
+    assert '# TYPE grq_ingest_docs_total counter' in lines
+    assert 'grq_ingest_docs_total{dataset="a",index="grq_1_a"} 5' in lines
+    assert 'grq_ingest_stage_seconds_count{dataset="a",index="grq_1_a",stage="bulk"} 2' in lines
+    assert 'grq_ingest_stage_seconds_sum{dataset="a",index="grq_1_a",stage="bulk"} 0.75' in lines
+    assert 'grq_ingest_errors_total{dataset="with \\"quotes\\"\\n"} 1' in lines
+
+
+def test_shared_directory_sums_workers(tmp_path):
+    workers = [Metrics(enabled=True) for _ in range(3)]
+    for i, metrics in enumerate(workers):
+        metrics.share(str(tmp_path), interval=3600)
+        metrics.inc('grq_ingest_docs_total', i + 1, dataset='a')
+        metrics.observe('grq_ingest_stage_seconds', 1., stage='parse')
+    workers[0].flush()
+    workers[1].flush()  # the last worker never flushed, the scrape doesn't include it yet
+
+    lines = workers[0].render().splitlines()
+    assert 'grq_ingest_docs_total{dataset="a"} 3' in lines
+    assert 'grq_ingest_stage_seconds_count{stage="parse"} 2' in lines
+
+    lines = workers[2].render().splitlines()  # served by the last worker, flushed before rendering
+    assert 'grq_ingest_docs_total{dataset="a"} 6' in lines
+    assert 'grq_ingest_stage_seconds_sum{stage="parse"} 3.0' in lines
+
+
+def test_batch_labels():
+    assert batch_labels([('a', 'grq_1_a'), ('a', 'grq_1_a')]) == {'dataset': 'a', 'index': 'grq_1_a'}
+    assert batch_labels([('a', 'grq_1_a'), ('b', 'grq_1_b')]) == {'dataset': MIXED, 'index': MIXED}
+
+
+@pytest.fixture
+def client():
+    app = Flask('metrics_test')
+    app.register_blueprint(mod)
+    return app.test_client()
+
+
+def test_metrics_endpoint(client, monkeypatch):
+    monkeypatch.setattr(service, 'metrics', Metrics())
+    assert client.get('/metrics').status_code == 404
+
+    enabled = Metrics(enabled=True)
+    enabled.inc('grq_ingest_requests_total', endpoint='index')
+    monkeypatch.setattr(service, 'metrics', enabled)
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert 'grq_ingest_requests_total{endpoint="index"} 1' in resp.get_data(as_text=True)
@@ -0,0 +1,79 @@
+import gzip
+import json
+
+import pytest
+import shapely
+
+from grq2.lib import offload
+from grq2.lib.offload import ProcessPool, WorkerError, offload_geometries
+from grq2.lib.geometry import prepare_geometries
+
+
+CONTINENTS = [
+    {'geonameid': 'eu', 'name': 'Europe', 'feature_class': 'L', 'feature_code': 'CONT',
+     'location': {'lon': 9.14062, 'lat': 48.69096}},
+    {'geonameid': 'na', 'name': 'North America', 'feature_class': 'L', 'feature_code': 'CONT',
+     'location': {'lon': -100.54688, 'lat': 46.07323}},
+]
+
+LOCATIONS = [
+    {'type': 'point', 'coordinates': [-118.17, 34.2]},
+    {'type': 'Polygon', 'coordinates': [[[-118, 34], [-117, 34], [-117, 35.5], [-118, 35], [-118, 34]]]},
+    {'type': 'multipolygon', 'coordinates': [[[[10, 10], [11, 10], [11, 11], [10, 11], [10, 10]]]]},
+    {'type': 'GeometryCollection', 'geometries': []},
+]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = tmp_path / 'geonames.json.gz'
+    with gzip.open(str(path), 'wt') as f:
+        for doc in CONTINENTS:
+            f.write(json.dumps(doc) + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def pool(snapshot):
+    """spawned workers, they would fail to start if grq2/__init__.py (no settings.cfg here) was imported"""
+    pool = ProcessPool(1, start_method='spawn', snapshot=snapshot)
+    yield pool
+    pool.close()
+
+
+def test_worker_tasks(pool):
+    result = pool.call('geocode', [('get_continents', (9., 48.))])
+    assert result[0][0]['name'] == 'Europe'
+
+    with pytest.raises(WorkerError, match='AttributeError'):
+        pool.call('geocode', [('no_such_lookup', ())])
+    assert pool.call('geocode', [('get_continents', (-100., 46.))])[0][0]['name'] == 'North America'
+
+
+@pytest.mark.skipif(not hasattr(shapely, 'from_ragged_array'), reason="shapely 2.0+")
+def test_offload_geometries(pool, monkeypatch, config):
+    config(GEOMETRY_WORKERS=1, GEOMETRY_OFFLOAD_MIN_BATCH=1, GEOMETRY_OFFLOAD_CHUNK=2)
+    monkeypatch.setattr(offload, '_pool', pool)
+    assert offload_geometries(LOCATIONS * 3) == prepare_geometries(LOCATIONS * 3)
+
+
+def test_lost_worker_is_dropped(pool, monkeypatch):
+    conn = pool._idle.queue[0]
+    pool._processes[conn].kill()
+    pool._processes[conn].join()
+
+    def failing_start():
+        raise OSError("too many open files")
+
+    monkeypatch.setattr(pool, '_start', failing_start)
+    with pytest.raises(WorkerError, match='worker process lost'):
+        pool.call('geocode', [])
+    assert conn.closed and list(pool._idle.queue) == [None]  # not put back in the idle pool
+
+    with pytest.raises(WorkerError, match='unable to start'):
+        pool.call('geocode', [])
+    assert list(pool._idle.queue) == [None]
+
+    monkeypatch.undo()
+    assert pool.call('geocode', [('get_continents', (9., 48.))])[0][0]['name'] == 'Europe'
+    assert len(pool._processes) == 1
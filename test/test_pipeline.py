@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+from grq2.lib import pipeline
+from grq2.lib.pipeline import enrich_pipeline, has_geo_processors, get_ingest_pipeline, is_geo_enriched
+
+
+CONTINENTS = [{'name': 'Europe', 'location': {'lon': 9.14062, 'lat': 48.69096}}]
+
+
+class FakeIngestES:
+    def __init__(self, pipelines=None, error=None):
+        self.pipelines = pipelines or {}
+        self.error = error
+        self.gets = 0
+        self.ingest = SimpleNamespace(get_pipeline=self._get_pipeline, put_pipeline=self._put_pipeline)
+
+    def _get_pipeline(self, id, ignore=None):
+        self.gets += 1
+        if self.error is not None:
+            raise self.error
+        return {id: self.pipelines[id]} if id in self.pipelines else {}
+
+    def _put_pipeline(self, id, body):
+        pytest.fail("pipeline installed by a worker")
+
+
+@pytest.fixture
+def pipeline_state(monkeypatch, config, grq_es):
+    monkeypatch.setattr(pipeline, 'grq_es', grq_es)
+    monkeypatch.setattr(pipeline, '_pipeline', None)
+    monkeypatch.setattr(pipeline, '_pipeline_checked_at', None)
+    monkeypatch.setattr(pipeline, '_geo_enrich', False)
+    config(INGEST_PIPELINE='dataset_enrich_pipeline', INGEST_PIPELINE_RETRY=60)
+
+    now = [1000.]
+    monkeypatch.setattr(pipeline.time, 'time', lambda: now[0])
+    return now
+
+
+def test_enrich_pipeline():
+    body = enrich_pipeline(date_parts=True)
+    assert [list(p) for p in body['processors']] == [['set'], ['script']]
+    assert body['processors'][1]['script']['params'] == {'date_parts': True}
+    assert not has_geo_processors(body)
+
+    body = enrich_pipeline(geo_policy='geonames_cities', continents=CONTINENTS)
+    assert has_geo_processors(body)
+    assert [list(p) for p in body['processors']] == [['set'], ['script'], ['script'], ['enrich'], ['script']]
+    enrich = body['processors'][3]['enrich']
+    assert enrich['policy_name'] == 'geonames_cities' and enrich['max_matches'] == 128
+    params = body['processors'][4]['script']['params']
+    assert params['continents'] == [['Europe', 9.14062, 48.69096]]
+
+
+def test_pipeline_disabled(pipeline_state, config, grq_es):
+    config(INGEST_PIPELINE=None)
+    grq_es.es = FakeIngestES()
+    assert get_ingest_pipeline() is None
+    assert grq_es.es.gets == 0
+
+
+def test_existing_pipeline_checked_once(pipeline_state, grq_es):
+    grq_es.es = FakeIngestES({'dataset_enrich_pipeline': enrich_pipeline()})
+    assert get_ingest_pipeline() == 'dataset_enrich_pipeline'
+    assert get_ingest_pipeline() == 'dataset_enrich_pipeline'
+    assert not is_geo_enriched()
+    assert grq_es.es.gets == 1
+
+
+def test_geo_enriched_pipeline(pipeline_state, grq_es):
+    body = enrich_pipeline(geo_policy='geonames_cities', continents=CONTINENTS)
+    grq_es.es = FakeIngestES({'dataset_enrich_pipeline': body})
+    assert is_geo_enriched()
+
+
+@pytest.mark.parametrize('error', [None, ConnectionError("cluster unavailable")])
+def test_missing_pipeline_checked_again(pipeline_state, grq_es, error):
+    grq_es.es = FakeIngestES(error=error)
+    assert get_ingest_pipeline() is None
+    pipeline_state[0] += 59
+    assert get_ingest_pipeline() is None
+    assert grq_es.es.gets == 1  # not checked for every request
+
+    grq_es.es.error = None
+    grq_es.es.pipelines['dataset_enrich_pipeline'] = enrich_pipeline()  # installed meanwhile
+    pipeline_state[0] += 1
+    assert get_ingest_pipeline() == 'dataset_enrich_pipeline'
+    assert grq_es.es.gets == 2
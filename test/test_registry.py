@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import pytest
+
+from grq2.lib import registry
+from grq2.lib.registry import AliasRegistry, IndexRegistry
+
+
+class FakeAliasES:
+    def __init__(self, pairs=()):
+        self.pairs = list(pairs)
+        self.cat_calls = 0
+        self.updates = []
+        self.cat = SimpleNamespace(aliases=self._cat_aliases)
+        self.indices = SimpleNamespace(update_aliases=self._update_aliases)
+
+    def _cat_aliases(self, format):
+        self.cat_calls += 1
+        return [{'index': index, 'alias': alias} for index, alias in self.pairs]
+
+    def _update_aliases(self, body):
+        self.updates.append(body['actions'])
+        self.pairs.extend((a['add']['index'], a['add']['alias']) for a in body['actions'])
+
+
+def test_alias_registry_adds_missing_pairs_once():
+    es = FakeAliasES([('grq_1_a', 'a')])
+    aliases = AliasRegistry(es)
+
+    added = aliases.add([('grq_1_a', 'a'), ('grq_1_a', 'b'), ('grq_1_a', 'b'), ('grq_1_c', 'c')])
+    assert added == [('grq_1_a', 'b'), ('grq_1_c', 'c')]
+    assert es.updates == [[{'add': {'index': 'grq_1_a', 'alias': 'b'}}, {'add': {'index': 'grq_1_c', 'alias': 'c'}}]]
+
+    assert aliases.add([('grq_1_a', 'b'), ('grq_1_c', 'c')]) == []
+    assert len(es.updates) == 1
+    assert es.cat_calls == 1
+
+
+def test_alias_registry_refreshes_after_ttl(monkeypatch):
+    es = FakeAliasES()
+    aliases = AliasRegistry(es, ttl=300)
+    now = registry.time.time()
+    monkeypatch.setattr(registry.time, 'time', lambda: now)
+    assert aliases.missing([('grq_1_a', 'a')]) == [('grq_1_a', 'a')]
+
+    es.pairs.append(('grq_1_a', 'a'))  # added by another worker
+    assert aliases.missing([('grq_1_a', 'a')]) == [('grq_1_a', 'a')]
+    assert es.cat_calls == 1
+
+    monkeypatch.setattr(registry.time, 'time', lambda: now + 300)
+    assert aliases.missing([('grq_1_a', 'a')]) == []
+    assert es.cat_calls == 2
+
+
+class FakeIndexES:
+    def __init__(self, indices=(), aliases=()):
+        self.existing = set(indices)
+        self.aliases = set(aliases)
+        self.creates = []
+        self.cat = SimpleNamespace(indices=self._cat_indices, aliases=self._cat_aliases)
+        self.indices = SimpleNamespace(create=self._create)
+
+    def _cat_indices(self, index, format, h):
+        return [{'index': i} for i in sorted(self.existing)]
+
+    def _cat_aliases(self, name, format, h):
+        return [{'alias': a} for a in sorted(self.aliases)]
+
+    def _create(self, index, ignore):
+        self.creates.append(index)
+        if index in self.aliases:
+            return {'error': {'type': 'invalid_index_name_exception',
+                              'reason': 'Invalid index name [%s], already exists as alias' % index}, 'status': 400}
+        if index in self.existing:
+            return {'error': {'type': 'resource_already_exists_exception'}, 'status': 400}
+        if index.startswith('bad'):
+            return {'error': {'type': 'invalid_index_name_exception', 'reason': 'must be lowercase'}, 'status': 400}
+        self.existing.add(index)
+        return {'acknowledged': True, 'index': index}
+
+
+def test_index_registry_creates_missing_indices():
+    es = FakeIndexES(indices=['grq_1_a'], aliases=['grq_custom'])
+    indices = IndexRegistry(es)
+    assert indices.ensure(['grq_1_a', 'grq_1_b', 'grq_1_b', 'grq_custom']) == ['grq_1_b']
+    assert es.creates == ['grq_1_b']  # existing indices & aliases are known from the refresh
+
+    assert indices.ensure(['grq_1_b']) == []
+    assert es.creates == ['grq_1_b']
+
+
+def test_index_registry_caches_existing_names():
+    es = FakeIndexES()
+    indices = IndexRegistry(es)
+    indices.refresh()
+    es.existing.add('grq_1_a')  # created by another worker since the refresh
+    es.aliases.add('grq_custom')
+
+    assert indices.ensure(['grq_1_a', 'grq_custom']) == []
+    assert indices.ensure(['grq_1_a', 'grq_custom']) == []
+    assert es.creates == ['grq_1_a', 'grq_custom']  # not retried on every ingest
+
+
+def test_index_registry_error():
+    indices = IndexRegistry(FakeIndexES())
+    with pytest.raises(RuntimeError, match='unable to create index'):
+        indices.ensure(['bad_INDEX'])
+
+
+def test_ensure_indices_disabled_by_default(monkeypatch, app):
+    monkeypatch.delitem(app.config, 'INDEX_PRECREATE', raising=False)
+    monkeypatch.setattr(registry, 'get_index_registry', lambda: pytest.fail("index registry used"))
+    registry.ensure_indices(['grq_1_a'])
@@ -0,0 +1,56 @@
+import pytest
+
+from grq2.lib.footprint_cache import FootprintCache
+from grq2.services.api_v02 import datasets as api
+
+
+CITY = {'name': 'Pasadena', 'population': 141029}
+
+
+@pytest.fixture
+def geonames(monkeypatch, config):
+    """geonames lookups answered in memory, recorded in order"""
+    config(GEOMETRY_WORKERS=0)
+    lookups = []
+
+    def batch_lookup(batch):
+        lookups.extend(func for func, _ in batch)
+        return [[CITY] if func != 'get_continents' else [{'name': 'North America'}] for func, _ in batch]
+
+    monkeypatch.setattr(api, 'batch_lookup', batch_lookup)
+    monkeypatch.setattr(api, 'get_footprint_cache', lambda: None)
+    monkeypatch.setattr(api, 'get_continent_resolver', lambda: None)
+    return lookups
+
+
+def datasets():
+    return [
+        {'id': 'polygon', 'location': {'type': 'polygon', 'coordinates': [[[-118, 34], [-117, 34], [-117, 35],
+                                                                          [-118, 34]]]}},
+        {'id': 'point', 'location': {'type': 'point', 'coordinates': [-118.14, 34.15]}},
+        {'id': 'no location'},
+    ]
+
+
+def test_batch_cities_and_continents(geonames):
+    docs = datasets()
+    api.reverse_geolocation_batch(docs)
+    assert geonames == ['get_cities', 'get_continents', 'get_nearest_cities', 'get_continents']
+    for doc in docs[:2]:
+        assert doc['city'] == [CITY] and doc['continent'] == 'North America' and 'center' in doc
+    assert 'city' not in docs[2]
+
+
+def test_batch_geolocation_added_by_the_pipeline(geonames, monkeypatch):
+    cache = FootprintCache(10)
+    monkeypatch.setattr(api, 'get_footprint_cache', lambda: cache)
+    docs = datasets()
+    api.reverse_geolocation_batch(docs, geocode=False)
+    assert geonames == []  # GEONAMES_ENRICH_POLICY, the city & continent are added by the ingest pipeline
+    for doc in docs[:2]:
+        assert 'center' in doc and 'city' not in doc and 'continent' not in doc
+    assert len(cache) == 0  # nothing cached without its continent
+
+    api.reverse_geolocation_batch(docs)  # pipeline removed
+    assert geonames == ['get_cities', 'get_continents', 'get_nearest_cities', 'get_continents']
+    assert len(cache) == 2 and all(doc['continent'] == 'North America' for doc in docs[:2])
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from import_ES import FIELD_NAMES, CONTINENT_CODES, parse_row
+from row_parser import GeonamesParser, block_ranges, parse_blocks
+
+
+CNTRIES = {
+    'US': ['USA', '840', 'US', 'United States', 'Washington', '9629091', '310232863', 'NA'],
+    'FR': ['FRA', '250', 'FR', 'France', 'Paris', '547030', '64768389', 'EU'],
+}
+ADM1 = {'US.CA': ['California', 'California', '5332921'], 'FR.11': ['Île-de-France', 'Ile-de-France', '3012874']}
+ADM2 = {'US.CA.037': ['Los Angeles County', 'Los Angeles County', '5368381']}
+
+
+def make_line(**values):
+    row = dict.fromkeys(FIELD_NAMES, '')
+    row.update(geonameid='1', name='place', latitude='34.1', longitude='-118.1', modification_date='2020-01-01')
+    row.update(values)
+    return '\t'.join(row[name] for name in FIELD_NAMES) + '\n'
+
+
+LINES = [
+    make_line(),
+    make_line(geonameid='5368361', name='Los Angeles', asciiname='Los Angeles',
+              alternatename='LA, Lungsod ng Los Angeles', feature_class='P', feature_code='PPLA2', country_code='US',
+              cc2='US,MX', admin1_code='CA', admin2_code='037', population='3971883', elevation='89', dem='115',
+              timezone='America/Los_Angeles', modification_date='2019-09-05'),
+    make_line(geonameid='2988507', name='Paris', alternatename='Lutetia', feature_class='P', country_code='FR',
+              admin1_code='11', admin2_code='75', population='2138551', elevation='-3', latitude='48.85341',
+              longitude='2.3488'),
+    make_line(country_code='US', admin1_code='CA', admin2_code='059'),  # unknown admin2
+    make_line(country_code='US', admin1_code='XX'),  # unknown admin1
+    make_line(country_code='ZZ', admin1_code='01'),  # unknown country
+    make_line(name='  padded  ', population='0', elevation=''),
+]
+
+
+@pytest.fixture
+def parser():
+    return GeonamesParser(FIELD_NAMES, CONTINENT_CODES, ADM1, ADM2, CNTRIES)
+
+
+@pytest.mark.parametrize('line', LINES)
+def test_same_docs_as_parse_row(parser, line):
+    assert parser.parse(line) == parse_row(line, ADM1, ADM2, CNTRIES)
+
+
+def test_missing_coordinates_rejected_like_parse_row(parser):
+    line = make_line(latitude='')
+    with pytest.raises(TypeError):
+        parse_row(line, ADM1, ADM2, CNTRIES)
+    with pytest.raises(TypeError):
+        parser.parse(line)
+
+
+def test_parse_block(parser):
+    data = ('\n'.join(LINES) + '\n').encode('utf-8')  # with blank lines
+    docs = parser.parse_block(data)
+    assert [geonameid for geonameid, _ in docs] == [parse_row(line, ADM1, ADM2, CNTRIES)['geonameid']
+                                                    for line in LINES]
+    assert [json.loads(doc) for _, doc in docs] == [parse_row(line, ADM1, ADM2, CNTRIES) for line in LINES]
+
+
+def test_block_ranges(tmp_path):
+    path = tmp_path / 'allCountries.txt'
+    path.write_bytes(''.join(LINES * 20).encode('utf-8'))
+    data = path.read_bytes()
+
+    ranges = list(block_ranges(str(path), block_size=500))
+    assert len(ranges) > 1
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start and data[end - 1:end] == b'\n'  # whole lines
+
+    start = len(''.join(LINES).encode('utf-8'))
+    assert list(block_ranges(str(path), start, block_size=len(data)))[0] == (start, len(data))
+
+
+def test_parse_blocks(tmp_path):
+    lines = [make_line(geonameid=str(i), country_code='US', admin1_code='CA', population=str(i))
+             for i in range(300)]
+    path = tmp_path / 'allCountries.txt'
+    path.write_text(''.join(lines))
+
+    tables = (FIELD_NAMES, CONTINENT_CODES, ADM1, ADM2, CNTRIES)
+    blocks = list(parse_blocks(str(path), tables, workers=2, block_size=2000))
+    assert len(blocks) > 2
+    assert blocks[-1][0] == path.stat().st_size
+    docs = [doc for _, block in blocks for doc in block]
+    assert [geonameid for geonameid, _ in docs] == [str(i) for i in range(300)]  # in file order
+    assert json.loads(docs[7][1]) == parse_row(lines[7], ADM1, ADM2, CNTRIES)
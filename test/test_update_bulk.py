@@ -0,0 +1,125 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from grq2.lib import dataset
+from grq2.lib.coalescer import BulkCoalescer
+from grq2.lib.metrics import metrics
+
+
+class FakeBulkES:
+    """bulk API failing the documents whose id starts with "bad" """
+
+    def __init__(self):
+        self.calls = []
+
+    def bulk(self, body, **kwargs):
+        self.calls.append(kwargs)
+        items = []
+        for action in body.decode().splitlines()[::2]:
+            doc_info = json.loads(action)['index']
+            doc_info = {**doc_info, 'result': 'created', 'status': 201}
+            if doc_info['_id'].startswith('bad'):
+                doc_info['error'] = {'type': 'mapper_parsing_exception'}
+                doc_info['status'] = 400
+            items.append({'index': doc_info})
+        return {'errors': any('error' in i['index'] for i in items), 'items': items}
+
+
+@pytest.fixture
+def es(monkeypatch, config):
+    es = FakeBulkES()
+    monkeypatch.setattr(dataset, 'grq_es', SimpleNamespace(es=es))
+    monkeypatch.setattr(dataset, 'prepare_update',
+                        lambda update_json, pipeline=None: ('grq_1_%s' % update_json['dataset'], []))
+    monkeypatch.setattr(dataset, 'ensure_indices', lambda indices: None)
+    monkeypatch.setattr(dataset, 'get_ingest_pipeline', lambda: None)
+    monkeypatch.setattr(dataset, 'add_aliases', lambda index_aliases: None)
+    config(BULK_REQUEST_TIMEOUT=42)
+    return es
+
+
+@pytest.fixture
+def enabled_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, 'enabled', True)
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+
+def test_update_bulk_results(es):
+    results = dataset.update_bulk([
+        {'id': 'ok-1', 'dataset': 'a'},
+        {'id': 'bad-1', 'dataset': 'a'},
+        {'id': 'ok-2', 'dataset': 'b'},
+    ])
+    assert results[0]['success'] is True and results[0]['index'] == 'grq_1_a'
+    assert isinstance(results[1], Exception) and 'bad-1' in str(results[1])
+    assert results[2]['objectid'] == 'ok-2'
+
+
+def test_update_bulk_request_timeout(es):
+    dataset.update_bulk([{'id': 'ok-1', 'dataset': 'a'}])
+    assert es.calls == [{'request_timeout': 42}]
+
+
+def test_update_bulk_counts_indexed_docs_only(es, enabled_metrics):
+    dataset.update_bulk([{'id': 'ok-1', 'dataset': 'a'}, {'id': 'bad-1', 'dataset': 'a'}])
+    rendered = enabled_metrics.render()
+    assert 'grq_ingest_docs_total{dataset="a",index="grq_1_a"} 1\n' in rendered
+    assert 'grq_ingest_errors_total{dataset="a",index="grq_1_a"} 1\n' in rendered
+
+
+def test_coalescer_gathers_concurrent_items():
+    batches = []
+
+    def flush(items):
+        batches.append(items)
+        return [ValueError(item) if item < 0 else item * 10 for item in items]
+
+    coalescer = BulkCoalescer(flush, window=5, max_items=4)
+    results = {}
+
+    def submit(item):
+        try:
+            results[item] = coalescer.submit(item)
+        except ValueError as e:
+            results[item] = e
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in (1, 2, -3, 4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert len(batches) == 1 and sorted(batches[0]) == [-3, 1, 2, 4]  # flushed when full, not after the window
+    assert results[1] == 10 and results[4] == 40
+    assert isinstance(results[-3], ValueError)
+
+
+def test_coalescer_flush_failure():
+    def flush(items):
+        raise RuntimeError("bulk request failed")
+
+    coalescer = BulkCoalescer(flush, window=0, max_items=10)
+    with pytest.raises(RuntimeError):
+        coalescer.submit('item')
+
+
+def test_coalescer_missing_results():
+    coalescer = BulkCoalescer(lambda items: [], window=0, max_items=10)
+    with pytest.raises(RuntimeError, match="no result"):
+        coalescer.submit('item')
+
+
+def test_update_bulk_resolves_the_pipeline_once(es, monkeypatch):
+    calls = []
+    prepared = []
+    monkeypatch.setattr(dataset, 'get_ingest_pipeline', lambda: calls.append(1) or (None if len(calls) == 1 else 'p'))
+    monkeypatch.setattr(dataset, 'prepare_update', lambda update_json, pipeline=None: prepared.append(pipeline) or
+                        ('grq_1_%s' % update_json['dataset'], []))
+    dataset.update_bulk([{'id': 'ok-1', 'dataset': 'a'}, {'id': 'ok-2', 'dataset': 'a'}])
+    assert len(calls) == 1 and prepared == [None, None]
+    assert 'pipeline' not in es.calls[0]
@@ -0,0 +1,88 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import update_deltas
+from import_ES import FIELD_NAMES, parse_row
+from update_deltas import apply_day, bulk_apply, delta_actions, read_deletes
+
+
+CNTRIES = {'US': ['USA', '840', 'US', 'United States', 'Washington', '9629091', '310232863', 'NA']}
+
+
+def make_line(geonameid, feature_class='P', population='1000'):
+    row = dict.fromkeys(FIELD_NAMES, '')
+    row.update(geonameid=geonameid, name='place %s' % geonameid, latitude='34.1', longitude='-118.1',
+               feature_class=feature_class, country_code='US', population=population, modification_date='2020-01-01')
+    return '\t'.join(row[name] for name in FIELD_NAMES) + '\n'
+
+
+MODIFICATIONS = [
+    make_line('1'),
+    make_line('2', population='0'),  # no longer populated
+    make_line('3', feature_class='S'),
+]
+
+
+@pytest.fixture
+def delta_files(tmp_path):
+    modifications = tmp_path / 'modifications-2020-01-02.txt'
+    modifications.write_text(''.join(MODIFICATIONS))
+    deletes = tmp_path / 'deletes-2020-01-02.txt'
+    deletes.write_text('4\tOld Town\tduplicate\n\n5\tOther\t\n')
+    return str(modifications), str(deletes)
+
+
+def test_read_deletes(delta_files):
+    assert read_deletes(delta_files[1]) == ['4', '5']
+
+
+def test_delta_actions(delta_files):
+    actions = list(delta_actions(*delta_files, {}, {}, CNTRIES))
+    assert [(a['_op_type'], a['_index'], a['_id']) for a in actions] == [
+        ('index', 'geonames', '1'), ('index', 'geonames', '2'), ('index', 'geonames', '3'),
+        ('delete', 'geonames', '4'), ('delete', 'geonames', '5'),
+    ]
+    assert actions[0]['_source'] == parse_row(MODIFICATIONS[0], {}, {}, CNTRIES)
+
+
+def test_delta_actions_cities(delta_files):
+    actions = list(delta_actions(*delta_files, {}, {}, CNTRIES, index='geonames_cities', cities=True))
+    assert [(a['_op_type'], a['_index'], a['_id']) for a in actions] == [
+        ('index', 'geonames_cities', '1'), ('delete', 'geonames_cities', '2'), ('delete', 'geonames_cities', '3'),
+        ('delete', 'geonames_cities', '4'), ('delete', 'geonames_cities', '5'),
+    ]
+
+
+def test_bulk_apply(monkeypatch):
+    results = [
+        (True, {'index': {'_id': '1', 'status': 200}}),
+        (False, {'index': {'_id': '2', 'status': 400, 'error': {'type': 'mapper_parsing_exception'}}}),
+        (True, {'delete': {'_id': '4', 'status': 200}}),
+        (False, {'delete': {'_id': '5', 'status': 404}}),  # already gone
+        (False, {'delete': {'_id': '6', 'status': 503}}),
+    ]
+    monkeypatch.setattr(update_deltas, 'os_helpers', SimpleNamespace(streaming_bulk=lambda es, actions, **kw: results))
+    assert bulk_apply(object(), []) == (1, 2, 2)
+
+
+def test_apply_day_not_published(monkeypatch, tmp_path):
+    monkeypatch.setattr(update_deltas, 'download', lambda name, work_dir: None if 'deletes' in name else name)
+    monkeypatch.setattr(update_deltas, 'bulk_apply', lambda *args, **kwargs: pytest.fail("applied"))
+    assert apply_day(object(), date(2020, 1, 2), str(tmp_path), {}, {}, CNTRIES) is None
+
+
+def test_apply_day(monkeypatch, delta_files):
+    files = {'modifications-2020-01-02.txt': delta_files[0], 'deletes-2020-01-02.txt': delta_files[1]}
+    monkeypatch.setattr(update_deltas, 'download', lambda name, work_dir: files[name])
+    applied = []
+
+    def fake_bulk_apply(es, actions, chunk_size):
+        actions = list(actions)
+        applied.append({a['_index'] for a in actions})
+        return 1, 2, 0 if len(applied) == 1 else 1
+
+    monkeypatch.setattr(update_deltas, 'bulk_apply', fake_bulk_apply)
+    assert apply_day(object(), date(2020, 1, 2), 'deltas', {}, {}, CNTRIES, cities_index='geonames_cities') == (1, 2, 1)
+    assert applied == [{'geonames'}, {'geonames_cities'}]